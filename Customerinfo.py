@@ -1,12 +1,26 @@
 import streamlit as st
 import pandas as pd
-import gspread
 from gspread.exceptions import APIError, WorksheetNotFound, SpreadsheetNotFound
+from gspread.utils import rowcol_to_a1
 from datetime import datetime
+import hashlib
 import json
+import os
+import re
+import threading
 import time
 import urllib.request # Thêm import cho Webhook
 import urllib.error   # Thêm import cho Webhook
+import pytz
+import gsheetpool
+from teamsoutbox import TeamsOutbox, PENDING, SENT, FAILED
+from teamscard import build_order_cards, CARD_BYTE_BUDGET as DEFAULT_CARD_BYTE_BUDGET
+from orderindex import OrderSearchIndex, PhoneIndex
+from ordersync import delta_sync, full_reload, id_key
+from teamsdigest import DigestScheduler
+from orderanalytics import OrderRollups
+from orderimport import read_orders
+from orderexport import EXPORT_FORMATS, export_orders, take_file
 
 # --- CẤU HÌNH WEBHOOK TEAMS (Được tham khảo từ sendmsteams.py) ---
 WEBHOOK_URL = (
@@ -64,13 +78,17 @@ except KeyError:
     st.stop()
 
 
+# Bản sao SQLite cục bộ (tùy chọn): sqlite_mirror_path = "mirror.db" trong secrets.toml
+SQLITE_MIRROR_PATH = st.secrets.get("sqlite_mirror_path")
+
+
 def connect_to_gsheet(spreadsheet_name, worksheet_name):
-    """Thiết lập kết nối với Google Sheet bằng gspread."""
+    """Lấy handle Worksheet từ kho kết nối dùng chung (chỉ xác thực/tra cứu lần đầu)."""
     try:
-        gc = gspread.service_account_from_dict(service_account_info)
-        spreadsheet = gc.open(spreadsheet_name)
-        worksheet = spreadsheet.worksheet(worksheet_name)
-        return worksheet
+        return gsheetpool.get_worksheet(
+            service_account_info, worksheet_name, spreadsheet_name=spreadsheet_name,
+            mirror_path=SQLITE_MIRROR_PATH, row_id_column=1, watch_headers=("Tình trạng",)
+        )
         
     except SpreadsheetNotFound:
         st.error(f"⚠️ Lỗi: Không tìm thấy Google Sheet có tên '{spreadsheet_name}'. Vui lòng kiểm tra lại tên file.")
@@ -83,20 +101,384 @@ def connect_to_gsheet(spreadsheet_name, worksheet_name):
         return None
 
 
-# --- ĐỊNH NGHĨA HÀM load_data (ĐÃ BỎ CACHE) ---
+# --- HÀNG ĐỢI GỬI TEAMS CHẠY NỀN (outbox trên đĩa) ---
+TEAMS_OUTBOX_DIR = st.secrets.get(
+    "teams_outbox_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".teams_outbox")
+)
+
+
+@st.cache_resource(show_spinner=False)
+def get_teams_outbox():
+    """Một outbox + luồng gửi nền cho toàn tiến trình."""
+    return TeamsOutbox(TEAMS_OUTBOX_DIR, sender=post_json).start()
+
+
+def fingerprint_frame(df):
+    """Dấu vân tay nội dung DataFrame (gồm cả chỉ mục), tính bằng hash vector hóa."""
+    hashed = pd.util.hash_pandas_object(df, index=True).values
+    return hashlib.sha256(hashed.tobytes() + "|".join(map(str, df.columns)).encode("utf-8")).hexdigest()
+
+
+# --- ADAPTIVE CARD: CHỈ DỰNG LẠI KHI DỮ LIỆU THAY ĐỔI ---
+# Ngân sách byte mỗi card (Teams giới hạn ~28 KB), cấu hình qua secrets.toml
+CARD_BYTE_BUDGET = int(st.secrets.get("teams_card_byte_budget", DEFAULT_CARD_BYTE_BUDGET))
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_adaptive_cards(fingerprint, _df, byte_budget):
+    """Danh sách card cho bảng `_df`; cache theo dấu vân tay nên rerun không dựng lại."""
+    return build_order_cards(_df, byte_budget)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_adaptive_card_json(fingerprint, _df, byte_budget):
+    """JSON để tải xuống: một card, hoặc danh sách card nếu đã bị chia."""
+    cards = build_adaptive_cards(fingerprint, _df, byte_budget)
+    return json.dumps(cards[0] if len(cards) == 1 else cards, ensure_ascii=False, indent=4)
+
+
+# --- ĐỊNH NGHĨA HÀM load_data (BẢNG DÙNG CHUNG, ĐỒNG BỘ TĂNG DẦN) ---
+# Sau bao lâu (giây) thì đồng bộ lại với Sheet, cấu hình qua secrets.toml: orders_cache_ttl = 60
+CACHE_TTL_SEC = int(st.secrets.get("orders_cache_ttl", 60))
+# Đồng bộ tăng dần: chỉ đọc dòng mới + cột 'Tình trạng'; đặt false để luôn tải lại toàn bộ
+INCREMENTAL_SYNC = bool(st.secrets.get("orders_incremental_sync", True))
+
+
+@st.cache_resource(show_spinner=False)
+def _orders_sync_state(sheet_name, worksheet_name):
+    """Bảng đơn hàng dùng chung cho mọi phiên cùng trạng thái đồng bộ của nó."""
+    return {
+        "lock": threading.Lock(),
+        "header": None,
+        "df": None,
+        "row_index": {},   # Số thứ tự -> số dòng trên Sheet
+        "synced_at": 0.0,
+        "version": 0,      # Tăng mỗi khi dữ liệu thay đổi
+    }
+
+
+def sync_orders_table(sheet_name, worksheet_name):
+    """
+    Trả về trạng thái đồng bộ (đã cập nhật nếu quá CACHE_TTL_SEC). Lần đầu hoặc khi cấu trúc
+    Sheet thay đổi thì tải toàn bộ; còn lại chi phí mỗi lần đồng bộ tỉ lệ với phần thay đổi.
+    """
+    state = _orders_sync_state(sheet_name, worksheet_name)
+    with state["lock"]:
+        if state["df"] is None or time.time() - state["synced_at"] >= CACHE_TTL_SEC:
+            ws = connect_to_gsheet(sheet_name, worksheet_name)
+            if ws is None:
+                raise ConnectionError(f"Không kết nối được '{sheet_name}/{worksheet_name}'")
+            if not (INCREMENTAL_SYNC and state["df"] is not None and delta_sync(state, ws)):
+                full_reload(state, ws)
+            state["synced_at"] = time.time()
+    return state
+
+
+def fetch_orders_table(sheet_name, worksheet_name):
+    """Bảng đơn hàng dùng chung (chỉ đọc: cần sửa thì .copy() trước)."""
+    return sync_orders_table(sheet_name, worksheet_name)["df"]
+
+
 def load_data(sheet_name, worksheet_name):
-    ws = connect_to_gsheet(sheet_name, worksheet_name)
-    if ws:
-        data = ws.get_all_values()
-        if len(data) > 1:
-            df = pd.DataFrame(data[1:], columns=data[0])
-            return df
-    return pd.DataFrame()
+    try:
+        return fetch_orders_table(sheet_name, worksheet_name)
+    except ConnectionError:
+        return pd.DataFrame()
+    except APIError as e:
+        st.error(f"⚠️ Lỗi đọc Google Sheet: {e}")
+        return pd.DataFrame()
+
+
+def fetch_order_row_index(sheet_name, worksheet_name):
+    """Chỉ mục Số thứ tự -> số dòng trên Sheet, được duy trì cùng bảng đơn hàng."""
+    return sync_orders_table(sheet_name, worksheet_name)["row_index"]
+
+
+def invalidate_orders_cache(full=False):
+    """
+    Sau khi ứng dụng ghi vào Sheet: lần đọc kế tiếp sẽ đồng bộ ngay (chỉ lấy phần thay đổi).
+    full=True khi biết chắc cấu trúc Sheet đã đổi: lần đọc kế tiếp tải lại toàn bộ.
+    """
+    state = _orders_sync_state(SPREADSHEET_NAME, WORKSHEET_NAME)
+    with state["lock"]:
+        state["synced_at"] = 0.0
+        if full:
+            state["df"] = None
+
+
+def write_statuses(worksheet, status_updates, header):
+    """
+    Ghi nhiều trạng thái bằng một lần batch_update.
+
+    status_updates: {Số thứ tự: trạng thái mới}. Trả về (danh sách ID đã ghi, {ID: lý do lỗi}).
+    Trước khi ghi, đọc lại ô Số thứ tự của các dòng đích trong 1 request để phát hiện chỉ mục cũ.
+    Ném ValueError nếu thiếu cột 'Tình trạng' hoặc 'Số thứ tự'.
+    """
+    status_col_index = header.index("Tình trạng") + 1
+    id_col_index = header.index("Số thứ tự") + 1
+    row_index = fetch_order_row_index(SPREADSHEET_NAME, WORKSHEET_NAME)
+
+    failures = {}
+    targets = {}
+    for order_id in status_updates:
+        row = row_index.get(id_key(order_id))
+        if row is None:
+            failures[order_id] = "Không tìm thấy Số thứ tự này trong Google Sheet."
+        else:
+            targets[order_id] = row
+
+    if targets:
+        id_cells = worksheet.batch_get([rowcol_to_a1(row, id_col_index) for row in targets.values()])
+        for (order_id, row), cell in zip(list(targets.items()), id_cells):
+            current = cell[0][0] if cell and cell[0] else ""
+            if id_key(current) != id_key(order_id):
+                failures[order_id] = f"Dòng {row} đã thay đổi trên Sheet (ID hiện tại: '{current}'). Vui lòng tải lại."
+                del targets[order_id]
+        if len(targets) < len(id_cells):
+            invalidate_orders_cache(full=True)
+
+    if targets:
+        worksheet.batch_update([
+            {"range": rowcol_to_a1(row, status_col_index), "values": [[status_updates[order_id]]]}
+            for order_id, row in targets.items()
+        ])
+    return list(targets), failures
+
+
+# --- CẤP SỐ THỨ TỰ ĐƠN HÀNG (KHÔNG ĐỌC LẠI TOÀN BỘ SHEET) ---
+@st.cache_resource(show_spinner=False)
+def _order_id_counter():
+    """Mốc Số thứ tự tiếp theo, dùng chung cho mọi phiên trong tiến trình."""
+    return {"next_id": None, "lock": threading.Lock()}
+
+
+def _appended_row_number(append_response):
+    """Lấy số dòng từ updatedRange (VD: 'Sheet1!A125:G125' -> 125)."""
+    updated_range = append_response["updates"]["updatedRange"]
+    return int(re.search(r"![A-Z]+(\d+)", updated_range).group(1))
+
+
+def append_order_with_id(worksheet, order_fields):
+    """
+    Ghi đơn hàng mới và trả về Số thứ tự của đơn.
+
+    Số thứ tự = số dòng trên Sheet - 1 (giữ nguyên quy ước cũ), nhưng được lấy từ dòng
+    mà Google Sheets thực sự cấp cho lệnh append, nên hai phiên ghi cùng lúc không thể trùng.
+    Giá trị dự đoán lấy từ mốc đã cache: thường chỉ tốn 1 request; nếu lệch thì sửa lại ô A.
+    Qua bản sao SQLite (sqlite_mirror_path) thì số dòng là dòng cục bộ, trả về ngay; nếu khi
+    đẩy lên Sheet cấp dòng khác thì bản sao tự sửa ô A theo dòng thật.
+    """
+    counter = _order_id_counter()
+    with counter["lock"]:
+        if counter["next_id"] is None:
+            counter["next_id"] = len(worksheet.col_values(1))
+        guessed_id = counter["next_id"]
+        counter["next_id"] += 1
+
+    response = worksheet.append_row([guessed_id] + list(order_fields))
+    order_id = _appended_row_number(response) - 1
+
+    if order_id != guessed_id:
+        worksheet.update_cell(order_id + 1, 1, order_id)
+        with counter["lock"]:
+            counter["next_id"] = order_id + 1
+    return order_id
+
+
+IMPORT_CHUNK_ROWS = int(st.secrets.get("import_chunk_rows", 500))
+
+
+def append_orders_with_ids(worksheet, orders, chunk_size=IMPORT_CHUNK_ROWS):
+    """
+    Ghi nhiều đơn hàng (mỗi đơn là danh sách trường như append_order_with_id) và trả về
+    danh sách Số thứ tự theo đúng thứ tự.
+
+    Cả khối Số thứ tự được giữ chỗ một lần từ mốc đã cache, sau đó ghi bằng append_rows
+    theo từng phần `chunk_size` dòng (để mỗi request không vượt giới hạn kích thước).
+    Nếu dòng thực tế của một phần bị lệch (có phiên khác ghi xen vào) thì sửa lại cột A
+    của phần đó bằng một lệnh update.
+    """
+    counter = _order_id_counter()
+    with counter["lock"]:
+        if counter["next_id"] is None:
+            counter["next_id"] = len(worksheet.col_values(1))
+        first_guess = counter["next_id"]
+        counter["next_id"] += len(orders)
+
+    order_ids = []
+    for start in range(0, len(orders), chunk_size):
+        chunk = orders[start:start + chunk_size]
+        guessed_id = first_guess + start
+        response = worksheet.append_rows([[guessed_id + i] + list(fields) for i, fields in enumerate(chunk)])
+        first_row = _appended_row_number(response)
+        first_id = first_row - 1
+
+        if first_id != guessed_id:
+            worksheet.update(
+                range_name=f"A{first_row}:A{first_row + len(chunk) - 1}",
+                values=[[first_id + i] for i in range(len(chunk))],
+            )
+            with counter["lock"]:
+                counter["next_id"] = max(counter["next_id"], first_id + len(chunk))
+        order_ids.extend(range(first_id, first_id + len(chunk)))
+    return order_ids
 
 
 # Tên Spreadsheet và Worksheet
 SPREADSHEET_NAME = "momijicustomer"
 WORKSHEET_NAME = "Sheet1"
+ORDER_STATUSES = ["Mới", "Đang chăm sóc", "Hoàn thành", "Hủy"]
+PAGE_SIZES = [25, 50, 100, 200]
+SERVICE_OPTIONS = [
+    "Thay sàn gỗ",
+    "Sơn nhà",
+    "Sửa chữa nhà (Tổng thể)",
+    "Sửa đồ nội thất",
+    "Sửa điện nước",
+    "Vệ sinh công nghiệp",
+    "Khác"
+]
+
+
+# --- LỌC VÀ PHÂN TRANG DANH SÁCH ĐƠN HÀNG (PHÍA SERVER) ---
+SEARCH_FIELDS = ['Tên khách', 'Số điện thoại', 'Địa chỉ', 'Yêu cầu dịch vụ', 'Tình trạng']
+
+
+@st.cache_resource(show_spinner=False)
+def get_order_search_index():
+    """Chỉ mục toàn văn (không dấu) dùng chung; cập nhật tăng dần theo phiên bản bảng đơn hàng."""
+    return OrderSearchIndex(SEARCH_FIELDS, phone_fields=['Số điện thoại'])
+
+
+@st.cache_resource(show_spinner=False)
+def get_phone_index():
+    """Chỉ mục SĐT chuẩn hóa -> đơn cũ (dựng một lần, cập nhật tăng dần khi có đơn mới/đổi trạng thái)."""
+    return PhoneIndex('Số Điện Thoại', ['Thời Gian', 'Tên Khách Hàng', 'Yêu Cầu Dịch Vụ', 'Tình trạng'])
+
+
+def sync_phone_index():
+    index = get_phone_index()
+    try:
+        state = sync_orders_table(SPREADSHEET_NAME, WORKSHEET_NAME)
+    except (ConnectionError, APIError):
+        return index
+    df = state["df"]
+    if not df.empty and "Số thứ tự" in df.columns and "Số Điện Thoại" in df.columns:
+        index.sync(df, version=state["version"], id_field="Số thứ tự")
+    return index
+
+
+# --- THỐNG KÊ ĐƠN HÀNG (ROLLUP CẬP NHẬT TĂNG DẦN) ---
+@st.cache_resource(show_spinner=False)
+def get_order_rollups():
+    """Bảng tổng hợp dùng chung; chỉ cộng/trừ phần đơn mới hoặc đổi trạng thái theo phiên bản bảng."""
+    return OrderRollups('Số thứ tự', 'Thời Gian', 'Yêu Cầu Dịch Vụ', 'Tình trạng')
+
+
+def sync_order_rollups():
+    rollups = get_order_rollups()
+    try:
+        state = sync_orders_table(SPREADSHEET_NAME, WORKSHEET_NAME)
+    except (ConnectionError, APIError):
+        return rollups
+    df = state["df"]
+    if not df.empty and {'Số thứ tự', 'Thời Gian', 'Yêu Cầu Dịch Vụ', 'Tình trạng'} <= set(df.columns):
+        rollups.sync(df, version=state["version"])
+    return rollups
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def build_order_filter_columns(fingerprint, _df_display):
+    """Cột phụ để lọc nhanh (ngày tạo dạng datetime); dựng lại khi dữ liệu đổi."""
+    created = pd.to_datetime(_df_display['Ngày tạo'], errors='coerce')
+    return pd.DataFrame({"created": created}, index=_df_display.index)
+
+
+def order_filter_mask(df_display, filter_columns, query=None, statuses=(), date_range=(), services=(), search_index=None):
+    """Mặt nạ lọc theo từ khóa (tên/SĐT/địa chỉ/dịch vụ, không dấu), tình trạng, dịch vụ và khoảng ngày tạo."""
+    mask = pd.Series(True, index=df_display.index)
+    matched_ids = search_index.search(query) if (query and search_index is not None) else None
+    if matched_ids is not None:
+        mask &= df_display.index.isin(list(matched_ids))
+    if statuses:
+        mask &= df_display['Tình trạng'].isin(statuses)
+    if services:
+        mask &= df_display['Yêu cầu dịch vụ'].isin(services)
+    if date_range and len(date_range) == 2:
+        start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)
+        mask &= (filter_columns["created"] >= start) & (filter_columns["created"] < end)
+    return mask.values
+
+
+def filter_orders(df_display, filter_columns, query, statuses, date_range, search_index=None):
+    """Thu hẹp bảng theo từ khóa, tình trạng và khoảng ngày tạo."""
+    return df_display[order_filter_mask(df_display, filter_columns, query, statuses, date_range, search_index=search_index)]
+
+# --- BẢNG HIỂN THỊ (DÙNG CHO data_editor, ADAPTIVE CARD VÀ DIGEST) ---
+DISPLAY_RENAME = {
+    'Tên Khách Hàng': 'Tên khách', 
+    'Số Điện Thoại': 'Số điện thoại', 
+    'Thời Gian': 'Ngày tạo',
+    'Địa Chỉ': 'Địa chỉ',
+    'Yêu Cầu Dịch Vụ': 'Yêu cầu dịch vụ',
+    'Tình trạng': 'Tình trạng'
+}
+DISPLAY_COLUMNS = [
+    'Ngày tạo', 
+    'Tên khách', 
+    'Số điện thoại', 
+    'Địa chỉ', 
+    'Yêu cầu dịch vụ',
+    'Tình trạng' 
+]
+
+
+def prepare_display_frame(df):
+    """
+    Đổi tên cột và đặt 'Số thứ tự' (dạng số) làm chỉ mục.
+    Trả về (df_display, lỗi khi đặt chỉ mục hoặc None).
+    """
+    df_edit = df.copy() 
+    index_error = None
+    try:
+        df_edit['Số thứ tự'] = pd.to_numeric(df_edit['Số thứ tự'], errors='coerce', downcast='integer')
+        df_edit.set_index('Số thứ tự', inplace=True)
+    except Exception as e:
+        index_error = e
+
+    df_edit.rename(columns=DISPLAY_RENAME, inplace=True)
+    return df_edit[[col for col in DISPLAY_COLUMNS if col in df_edit.columns]], index_error
+
+
+# --- DIGEST TỰ ĐỘNG LÊN TEAMS (chỉ gửi đơn mới/đổi trạng thái) ---
+# Giờ gửi theo giờ Việt Nam, VD trong secrets.toml: teams_digest_times = ["08:00", "17:30"]
+TEAMS_DIGEST_TIMES = list(st.secrets.get("teams_digest_times", []))
+TEAMS_DIGEST_STATE = st.secrets.get(
+    "teams_digest_state", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".teams_digest.json")
+)
+VN_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
+
+
+def load_display_orders(worksheet):
+    """Đọc bảng đơn hàng cho luồng digest (chạy ngoài phiên Streamlit nên không dùng cache của app)."""
+    data = worksheet.get_all_values()
+    if not data or "Tình trạng" not in data[0]:
+        raise ValueError("Không tìm thấy cột 'Tình trạng' trong Google Sheet.")
+    return prepare_display_frame(pd.DataFrame(data[1:], columns=data[0]))[0]
+
+
+@st.cache_resource(show_spinner=False)
+def get_digest_scheduler(_worksheet):
+    """Một bộ lập lịch digest cho toàn tiến trình (chỉ chạy khi có cấu hình giờ gửi)."""
+    return DigestScheduler(
+        TEAMS_DIGEST_STATE, TEAMS_DIGEST_TIMES, VN_TZ,
+        load_orders=lambda: load_display_orders(_worksheet),
+        outbox=get_teams_outbox(),
+        url=WEBHOOK_URL,
+        build_cards=lambda delta: build_order_cards(delta, CARD_BYTE_BUDGET, title="Đơn hàng BeniHome mới/cập nhật"),
+        wrap=as_attachments,
+    ).start()
+
 
 # --- THIẾT LẬP GIAO DIỆN STREAMLIT ---
 st.title("🏡 Hệ Thống Theo Dõi Đặt Hàng Dịch Vụ Sửa Chữa BeniHOME")
@@ -105,24 +487,36 @@ st.markdown("---")
 # 1. Nhập dữ liệu người đặt hàng dịch vụ
 st.header("1. Nhập Thông Tin Đặt Hàng Mới")
 
+PHONE_KEY = f'order_phone_{st.session_state["form_key"]}'
+
+
+# SĐT nằm ngoài form và trong fragment: nhập SĐT chỉ chạy lại phần này để tra khách cũ
+@st.fragment
+def render_phone_lookup():
+    phone = st.text_input("📱 **Số Điện Thoại** (VD: 090xxxxxxx)", max_chars=15, key=PHONE_KEY)
+    if not phone.strip():
+        return
+    past_orders = sync_phone_index().lookup(phone)
+    if past_orders:
+        st.info(f"🔁 Khách cũ: số điện thoại này đã có **{len(past_orders)}** đơn hàng.")
+        st.dataframe(
+            pd.DataFrame(past_orders, columns=['Số thứ tự', 'Ngày tạo', 'Tên khách', 'Yêu cầu dịch vụ', 'Tình trạng']),
+            hide_index=True,
+            width='stretch',
+        )
+
+
+render_phone_lookup()
+
 with st.form(key=f'order_form_{st.session_state["form_key"]}'):
     
     col1, col2 = st.columns(2)
     
     with col1:
         customer_name = st.text_input("📝 **Tên Khách Hàng**", max_chars=100)
-        phone_number = st.text_input("📱 **Số Điện Thoại** (VD: 090xxxxxxx)", max_chars=15)
         service_request = st.selectbox(
             "🛠️ **Yêu Cầu Dịch Vụ**",
-            options=[
-                "Thay sàn gỗ",
-                "Sơn nhà",
-                "Sửa chữa nhà (Tổng thể)",
-                "Sửa đồ nội thất",
-                "Sửa điện nước",
-                "Vệ sinh công nghiệp",
-                "Khác"
-            ]
+            options=SERVICE_OPTIONS
         )
     with col2:
         address = st.text_area("📍 **Địa Chỉ Cần Sửa Chữa**", max_chars=200, height=200)
@@ -130,6 +524,7 @@ with st.form(key=f'order_form_{st.session_state["form_key"]}'):
     submit_button = st.form_submit_button(label='Lưu Đơn Hàng')
 
 worksheet = None 
+phone_number = st.session_state.get(PHONE_KEY, "").strip()
 
 if submit_button:
     if not all([customer_name, phone_number, address, service_request]):
@@ -142,13 +537,9 @@ if submit_button:
 
         if worksheet:
             try:
-                existing_data = worksheet.get_all_values()
-                next_order_id = len(existing_data)
-                
                 timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
                 new_order_data = [
-                    next_order_id,     
                     timestamp,         
                     customer_name,     
                     phone_number,      
@@ -157,7 +548,9 @@ if submit_button:
                     "Mới"              
                 ]
 
-                worksheet.append_row(new_order_data)
+                order_id = append_order_with_id(worksheet, new_order_data)
+                get_phone_index().add(order_id, phone_number, (timestamp, customer_name, service_request, "Mới"))
+                invalidate_orders_cache()
                 st.success("✅ **Lưu đơn hàng thành công!**")
                 st.balloons()
                 
@@ -170,6 +563,49 @@ if submit_button:
             except Exception as e:
                 st.error(f"⚠️ Lỗi KHÔNG XÁC ĐỊNH khi lưu dữ liệu: {e}")
 
+# Nhập hàng loạt: kiểm tra cả file trước, rồi ghi mọi đơn hợp lệ bằng append_rows theo khối
+with st.expander("📥 Nhập hàng loạt từ file CSV / Excel"):
+    st.caption(
+        "File cần các cột: **Tên Khách Hàng**, **Số Điện Thoại**, **Địa Chỉ**, **Yêu Cầu Dịch Vụ** "
+        "(không phân biệt dấu/hoa thường). Mọi đơn nhập vào có tình trạng **Mới**."
+    )
+    uploaded = st.file_uploader("Chọn file", type=["csv", "xlsx"], key=f'order_import_{st.session_state["form_key"]}')
+    if uploaded is not None:
+        try:
+            import_ok, import_rejected = read_orders(uploaded.getvalue(), uploaded.name, SERVICE_OPTIONS)
+        except Exception as e:
+            st.error(f"⚠️ Không đọc được file: {e}")
+            import_ok, import_rejected = None, None
+
+        if import_ok is not None:
+            st.write(f"✅ Hợp lệ: **{len(import_ok)}** đơn · ❌ Bị loại: **{len(import_rejected)}** dòng")
+            if len(import_rejected):
+                st.dataframe(import_rejected, hide_index=True, width='stretch')
+                st.download_button(
+                    "⬇️ Tải danh sách dòng bị loại",
+                    data=import_rejected.to_csv(index=False).encode("utf-8-sig"),
+                    file_name="don_hang_bi_loai.csv",
+                    mime="text/csv",
+                )
+            if len(import_ok) and st.button(f"Lưu {len(import_ok)} đơn hàng", type="primary"):
+                worksheet = connect_to_gsheet(SPREADSHEET_NAME, WORKSHEET_NAME)
+                if worksheet:
+                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    rows = [
+                        [timestamp, name, phone, address, service, "Mới"]
+                        for name, phone, address, service in import_ok[["name", "phone", "address", "service"]].itertuples(index=False)
+                    ]
+                    try:
+                        with st.spinner(f"🔄 Đang ghi {len(rows)} đơn hàng..."):
+                            order_ids = append_orders_with_ids(worksheet, rows)
+                        invalidate_orders_cache()
+                        st.success(f"✅ Đã nhập **{len(order_ids)}** đơn hàng (Số thứ tự {order_ids[0]} – {order_ids[-1]}).")
+                        st.session_state['form_key'] += 1
+                    except Exception as e:
+                        invalidate_orders_cache()
+                        st.error(f"⚠️ Lỗi khi nhập dữ liệu: {e}")
+                        st.warning("Một phần đơn hàng có thể đã được ghi. Vui lòng kiểm tra danh sách trước khi nhập lại.")
+
 st.markdown("---")
 ## 2. Danh Sách Đơn Hàng và Cập Nhật Tình Trạng
 st.header("2. Danh Sách Đơn Hàng")
@@ -182,135 +618,48 @@ if not df.empty:
     
     # --- 1. Chuẩn bị DataFrame cho st.data_editor và JSON ---
     
-    df_edit = df.copy() 
-    try:
-        df_edit['Số thứ tự'] = pd.to_numeric(df_edit['Số thứ tự'], errors='coerce', downcast='integer')
-        df_edit.set_index('Số thứ tự', inplace=True)
-    except Exception as e:
-        st.warning(f"Không thể đặt 'Số thứ tự' làm chỉ mục: {e}. Vui lòng đảm bảo cột này không có giá trị trống.")
-
-    df_edit.rename(columns={
-        'Tên Khách Hàng': 'Tên khách', 
-        'Số Điện Thoại': 'Số điện thoại', 
-        'Thời Gian': 'Ngày tạo',
-        'Địa Chỉ': 'Địa chỉ',
-        'Yêu Cầu Dịch Vụ': 'Yêu cầu dịch vụ',
-        'Tình trạng': 'Tình trạng'
-    }, inplace=True)
-
-    display_columns = [
-        'Ngày tạo', 
-        'Tên khách', 
-        'Số điện thoại', 
-        'Địa chỉ', 
-        'Yêu cầu dịch vụ',
-        'Tình trạng' 
-    ]
-    df_display = df_edit[[col for col in display_columns if col in df_edit.columns]]
-
-    # --- 2. HÀM TẠO ADAPTIVE CARD JSON ---
-    
-    def generate_adaptive_card_json(df):
-        """
-        Nhóm DataFrame theo 'Tình trạng' và tạo Adaptive Card JSON theo cấu trúc mẫu.
-        """
-        df_json = df.reset_index().rename(columns={
-             'Số thứ tự': 'ID',
-             'Ngày tạo': 'Thời gian tạo',
-             'Tên khách': 'Tên Khách Hàng',
-             'Số điện thoại': 'Số Điện Thoại',
-             'Địa chỉ': 'Địa Chỉ',
-             'Yêu cầu dịch vụ': 'Yêu Cầu Dịch Vụ',
-             'Tình trạng': 'Tình trạng'
-        })
-        
-        df_json = df_json[['ID', 'Tên Khách Hàng', 'Yêu Cầu Dịch Vụ', 'Địa Chỉ', 'Số Điện Thoại', 'Thời gian tạo', 'Tình trạng']]
+    df_display, index_error = prepare_display_frame(df)
+    if index_error is not None:
+        st.warning(f"Không thể đặt 'Số thứ tự' làm chỉ mục: {index_error}. Vui lòng đảm bảo cột này không có giá trị trống.")
 
-        total_orders = len(df_json)
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        adaptive_card_template = {
-            "type": "AdaptiveCard",
-            "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-            "version": "1.0",
-            "body": [
-                # Header
-                {
-                    "type": "ColumnSet",
-                    "columns": [
-                        {"type": "Column", "width": 3, "items": [
-                            {"type": "TextBlock", "size": "Large", "weight": "Bolder", "text": "Đơn hàng BeniHome"},
-                            {"type": "TextBlock", "isSubtle": True, "spacing": "None", "text": f"Cập nhật: {current_time}"}
-                        ]},
-                        {"type": "Column", "width": "auto", "items": [
-                            {"type": "Image", "url": "https://benihome.com.vn/wp-content/uploads/2018/08/logo.png", "size": "Medium", "altText": "BeniHome"}
-                        ], "horizontalAlignment": "Right"}
-                    ]
-                },
-                # Total
-                {"type": "TextBlock", "text": f"Tổng: {total_orders} đơn", "weight": "Bolder", "spacing": "Small"}
-            ],
-            "actions": [
-                {"type": "Action.OpenUrl", "title": "Mở bảng Excel", "url": "https://docs.google.com/spreadsheets/d/1uRtOnKX29zge_KjHmajNppWUGnqB3YStA1nh_J356Jo/edit?gid=0#gid=0"}
-            ]
-        }
+    # --- 2. ADAPTIVE CARD (CACHE THEO DẤU VÂN TAY CỦA df_display) ---
+    display_fingerprint = fingerprint_frame(df_display)
 
-        grouped = df_json.groupby('Tình trạng')
-        
-        for status, group in grouped:
-            order_list_container = {"type": "Container", "items": []}
-            
-            for index, row in group.iterrows():
-                order_string = f"#{row['ID']} • {row['Tên Khách Hàng']} • {row['Yêu Cầu Dịch Vụ']} • {row['Địa Chỉ']} • {row['Số Điện Thoại']} • {row['Thời gian tạo']}"
-                
-                order_list_container["items"].append({
-                    "type": "TextBlock",
-                    "text": order_string,
-                    "wrap": True,
-                    "spacing": "Small"
-                })
-
-            status_container = {
-                "type": "Container",
-                "items": [
-                    {"type": "TextBlock", "text": f"{status} ({len(group)})", "weight": "Bolder", "size": "Medium", "spacing": "Medium"},
-                    order_list_container
-                ]
-            }
-            
-            adaptive_card_template["body"].append(status_container)
-            
-        return json.dumps(adaptive_card_template, ensure_ascii=False, indent=4)
+    def get_adaptive_cards():
+        return build_adaptive_cards(display_fingerprint, df_display, CARD_BYTE_BUDGET)
 
     # Hàm wrapper để Streamlit gọi khi tạo tệp tải xuống
     def get_adaptive_card_data():
-        return generate_adaptive_card_json(df_display)
+        return build_adaptive_card_json(display_fingerprint, df_display, CARD_BYTE_BUDGET)
 
     # --- 3. HÀM GỬI LÊN TEAMS (Callback cho nút) ---
     def send_to_teams_callback():
-        json_string = get_adaptive_card_data()
-        
+        """Đưa báo cáo vào outbox rồi trả về ngay; luồng nền sẽ gửi và tự thử lại khi lỗi."""
         try:
-            card = json.loads(json_string)
-            
-            # 1. Bao thành attachments
-            wrapped = as_attachments(card)
-
-            # 2. Gửi lên webhook
-            st.toast("Đang gửi báo cáo Adaptive Card lên MS Teams...")
-            status, body = post_json(WEBHOOK_URL, wrapped)
-            
-            # 3. Xử lý phản hồi
-            if status in (200, 202):
-                st.success(f"✅ Đã gửi báo cáo đơn hàng thành công lên MS Teams! (Status: {status})")
-            else:
-                st.error(f"❌ Lỗi khi gửi lên MS Teams (Status: {status}). Vui lòng kiểm tra Flow Power Automate.")
-                st.code(f"Phản hồi: {body[:500]}", language='text') # Hiện 500 ký tự đầu của body
-                
-        except json.JSONDecodeError:
-            st.error("Lỗi: Dữ liệu JSON tạo ra không hợp lệ.")
+            cards = get_adaptive_cards()
+            msg_id = get_teams_outbox().enqueue_parts(
+                WEBHOOK_URL, [as_attachments(card) for card in cards], dedup_key=display_fingerprint
+            )
+            st.session_state["teams_msg_id"] = msg_id
+            st.toast(f"📨 Đã đưa báo cáo ({len(cards)} card) vào hàng đợi gửi MS Teams.")
         except Exception as e:
-            st.error(f"Lỗi không xác định trong quá trình gửi: {e}")
+            st.error(f"Lỗi không xác định khi đưa báo cáo vào hàng đợi: {e}")
+
+    def render_teams_delivery_status():
+        msg = get_teams_outbox().status(st.session_state.get("teams_msg_id"))
+        if msg is None:
+            return
+        if msg["status"] == SENT:
+            st.success(f"✅ Đã gửi báo cáo đơn hàng thành công lên MS Teams! (Status: {msg['last_status']})")
+        elif msg["status"] == FAILED:
+            st.error(f"❌ Lỗi khi gửi lên MS Teams (Status: {msg['last_status']}, {msg['attempts']} lần thử). Vui lòng kiểm tra Flow Power Automate.")
+            st.code(f"Phản hồi: {msg['last_error']}", language='text')
+        elif len(msg["payloads"]) > 1:
+            st.info(f"⏳ Đang gửi báo cáo lên MS Teams... ({msg['next_part']}/{len(msg['payloads'])} card)")
+        elif msg["attempts"]:
+            st.warning(f"⏳ Gửi chưa thành công (Status: {msg['last_status']}), sẽ tự thử lại... (lần {msg['attempts']})")
+        else:
+            st.info("⏳ Đang gửi báo cáo lên MS Teams...")
 
     # --- 4. CÁC NÚT HÀNH ĐỘNG ---
     col_download, col_send = st.columns([0.25, 0.75])
@@ -321,7 +670,7 @@ if not df.empty:
             data=get_adaptive_card_data(), 
             file_name='adaptive_card_don_hang_benihome.json', 
             mime='application/json',
-            help="Tải toàn bộ danh sách đơn hàng hiện tại dưới dạng Adaptive Card JSON."
+            help="Tải toàn bộ danh sách đơn hàng hiện tại dưới dạng Adaptive Card JSON (danh sách card nếu vượt giới hạn kích thước của Teams)."
         )
 
     with col_send:
@@ -331,73 +680,179 @@ if not df.empty:
             on_click=send_to_teams_callback,
             help="Tạo Adaptive Card JSON mới nhất và gửi đến Power Automate Flow (MS Teams)."
         )
+        if TEAMS_DIGEST_TIMES:
+            digest_ws = connect_to_gsheet(SPREADSHEET_NAME, WORKSHEET_NAME)
+            if digest_ws:
+                digest_state = get_digest_scheduler(digest_ws).status()
+                st.caption(
+                    f"🕒 Tự động gửi đơn mới/cập nhật lúc {', '.join(TEAMS_DIGEST_TIMES)} · "
+                    f"Lần gửi thành công gần nhất: {digest_state.get('last_sent_at') or 'chưa có'}"
+                )
+        # Trạng thái gửi: tự làm mới (chỉ phần này) khi tin nhắn còn đang chờ gửi
+        last_msg = get_teams_outbox().status(st.session_state.get("teams_msg_id"))
+        if last_msg and last_msg["status"] == PENDING:
+            st.fragment(render_teams_delivery_status, run_every=2)()
+        else:
+            render_teams_delivery_status()
+
+    # Xuất file: ghi theo khối ra file tạm trên đĩa, chỉ tạo khi bấm nút; đọc một lần rồi xóa file tạm
+    with st.expander("📤 Xuất dữ liệu (CSV / Excel / Parquet)"):
+        col_exp_status, col_exp_service, col_exp_date, col_exp_fmt = st.columns(4)
+        with col_exp_status:
+            export_statuses = st.multiselect("Tình trạng", ORDER_STATUSES, key="export_statuses")
+        with col_exp_service:
+            export_services = st.multiselect("Yêu cầu dịch vụ", SERVICE_OPTIONS, key="export_services")
+        with col_exp_date:
+            export_dates = st.date_input("Ngày tạo", value=(), key="export_dates")
+        with col_exp_fmt:
+            export_format = st.selectbox("Định dạng", list(EXPORT_FORMATS), key="export_format")
+
+        if st.button("Tạo file xuất"):
+            export_mask = order_filter_mask(
+                df_display, build_order_filter_columns(display_fingerprint, df_display),
+                statuses=export_statuses, date_range=export_dates, services=export_services,
+            )
+            st.session_state.pop("export_data", None)
+            try:
+                with st.spinner("🔄 Đang ghi file..."):
+                    st.session_state["export_data"] = take_file(export_orders(df_display, export_mask, export_format))
+                st.session_state["export_info"] = (export_format, int(export_mask.sum()))
+            except ImportError as e:
+                st.error(f"Thiếu thư viện cho định dạng {export_format}: {e}")
+
+        export_data = st.session_state.get("export_data")
+        if export_data is not None:
+            fmt, count = st.session_state["export_info"]
+            suffix, mime, _ = EXPORT_FORMATS[fmt]
+            st.download_button(
+                f"⬇️ Tải {count} đơn hàng ({fmt})",
+                data=export_data,
+                file_name=f"don_hang_benihome{suffix}",
+                mime=mime,
+            )
     # -----------------------------
 
+    # --- 5. Bộ lọc + phân trang: chỉ gửi một trang dữ liệu xuống trình duyệt ---
+    filter_columns = build_order_filter_columns(display_fingerprint, df_display)
+    search_index = get_order_search_index()
+    search_index.sync(df_display, version=_orders_sync_state(SPREADSHEET_NAME, WORKSHEET_NAME)["version"])
+
+    col_search, col_status, col_date = st.columns([0.4, 0.3, 0.3])
+    with col_search:
+        search_query = st.text_input("🔎 Tìm theo tên / số điện thoại / địa chỉ (không cần dấu)", key="order_search")
+    with col_status:
+        status_filter = st.multiselect("Tình trạng", ORDER_STATUSES, key="order_status_filter")
+    with col_date:
+        date_filter = st.date_input("Ngày tạo", value=(), key="order_date_filter")
+
+    filtered_df = filter_orders(df_display, filter_columns, search_query, status_filter, date_filter, search_index)
+
+    col_size, col_page, col_count = st.columns([0.2, 0.2, 0.6])
+    with col_size:
+        page_size = st.selectbox("Số dòng / trang", PAGE_SIZES, index=1, key="order_page_size")
+    total_pages = max(1, -(-len(filtered_df) // page_size))
+    filter_signature = (search_query, tuple(status_filter), tuple(date_filter), page_size)
+    if st.session_state.get("order_filter_signature") != filter_signature:
+        st.session_state["order_filter_signature"] = filter_signature
+        st.session_state["order_page"] = 1
+    st.session_state["order_page"] = min(st.session_state.get("order_page", 1), total_pages)
+    with col_page:
+        page = st.number_input("Trang", min_value=1, max_value=total_pages, step=1, key="order_page")
+    with col_count:
+        st.caption(f"Tìm thấy **{len(filtered_df)}** / {len(df_display)} đơn · Trang {page}/{total_pages}")
+
+    page_df = filtered_df.iloc[(page - 1) * page_size: page * page_size]
+
     st.caption("💡 **Nhấn đúp chuột vào cột 'Tình trạng' để thay đổi trạng thái.**")
-    
-    # --- 5. Hiển thị bảng có thể chỉnh sửa (data_editor) ---
+
+    # Key của bảng gắn với bộ lọc + trang, để thay đổi chưa lưu không bị áp nhầm sang trang khác
+    editor_key = "data_editor_" + hashlib.md5(repr((filter_signature, page)).encode("utf-8")).hexdigest()[:12]
+
+    # --- 6. Hiển thị bảng có thể chỉnh sửa (data_editor) ---
     edited_df = st.data_editor(
-        df_display,
-        key="data_editor",
+        page_df,
+        key=editor_key,
         column_config={
             "Tình trạng": st.column_config.SelectboxColumn(
                 "Tình trạng",
                 help="Cập nhật tình trạng của đơn hàng",
                 width="medium",
-                options=["Mới", "Đang chăm sóc", "Hoàn thành", "Hủy"],
+                options=ORDER_STATUSES,
                 required=True,
             ),
         },
-        disabled=df_display.columns.difference(['Tình trạng']), 
+        disabled=page_df.columns.difference(['Tình trạng']), 
         width='stretch'
     )
     
-    # --- 6. Logic Ghi lại thay đổi vào Google Sheet ---
+    # --- 7. Logic Ghi lại thay đổi vào Google Sheet ---
     
-    if st.session_state["data_editor"]["edited_rows"]:
+    # edited_rows dùng vị trí dòng trong trang đang hiển thị -> đổi sang Số thứ tự (chỉ mục của page_df)
+    changes = st.session_state[editor_key]["edited_rows"]
+    if changes:
+        status_updates = {
+            page_df.index[pos]: updated_data["Tình trạng"]
+            for pos, updated_data in changes.items()
+            if updated_data.get("Tình trạng")
+        }
+        updated_ids, failures = [], {}
+
         with st.spinner("🔄 Đang cập nhật trạng thái đơn hàng..."):
-            
             worksheet = connect_to_gsheet(SPREADSHEET_NAME, WORKSHEET_NAME)
-            if worksheet:
-                changes = st.session_state["data_editor"]["edited_rows"]
-                
-                all_records = worksheet.get_all_values()
-                header = all_records[0]
-                
+            if worksheet and status_updates:
                 try:
-                    status_col_index = header.index("Tình trạng") + 1 
-                    id_col_index = header.index("Số thứ tự") + 1
+                    updated_ids, failures = write_statuses(worksheet, status_updates, list(df.columns))
                 except ValueError:
                     st.error("Lỗi: Không tìm thấy cột 'Tình trạng' hoặc 'Số thứ tự' trong Google Sheet. Vui lòng kiểm tra tiêu đề cột.")
                     st.stop()
-                
-                updated_successfully = False
-                
-                for index, updated_data in changes.items():
-                    order_id = index 
-                    new_status = updated_data.get("Tình trạng")
-                    
-                    if new_status:
-                        gsheet_row_number = -1
-                        for i, row in enumerate(all_records):
-                            if str(row[id_col_index - 1]) == str(order_id): 
-                                gsheet_row_number = i + 1 
-                                break
-                        
-                        if gsheet_row_number > 1:
-                            try:
-                                worksheet.update_cell(gsheet_row_number, status_col_index, new_status)
-                                updated_successfully = True
-                                st.toast(f"✅ Đã cập nhật Đơn hàng ID {order_id} sang trạng thái: {new_status}")
-                            except Exception as e:
-                                st.error(f"Lỗi khi cập nhật ID {order_id}: {e}")
-                        
-        if updated_successfully:
-            st.session_state["data_editor"]["edited_rows"] = {}
+                except Exception as e:
+                    failures = {order_id: str(e) for order_id in status_updates}
+
+        for order_id in updated_ids:
+            st.toast(f"✅ Đã cập nhật Đơn hàng ID {order_id} sang trạng thái: {status_updates[order_id]}")
+        for order_id, reason in failures.items():
+            st.error(f"Lỗi khi cập nhật ID {order_id}: {reason}")
+
+        if updated_ids:
+            invalidate_orders_cache()
+            st.session_state[editor_key]["edited_rows"] = {}
             st.rerun() 
 
 else:
     st.info("Chưa có đơn hàng nào được lưu hoặc không thể kết nối Google Sheet. Vui lòng kiểm tra permissions và tên Sheet.")
 
+# 3. Thống kê: chỉ vẽ từ bảng tổng hợp nhỏ, đổi "Ngày/Tuần" chỉ chạy lại phần này
+@st.fragment
+def render_order_analytics():
+    rollups = sync_order_rollups()
+    conversion = rollups.conversion("Mới", "Hoàn thành")
+    if not conversion["total"]:
+        st.info("Chưa có dữ liệu để thống kê.")
+        return
+
+    col_total, col_new, col_done, col_rate = st.columns(4)
+    col_total.metric("Tổng số đơn", conversion["total"])
+    col_new.metric("Đang ở trạng thái Mới", conversion["new"])
+    col_done.metric("Hoàn thành", conversion["done"])
+    col_rate.metric("Tỉ lệ Mới → Hoàn thành", f"{conversion['rate']:.1%}")
+
+    col_service, col_status = st.columns(2)
+    with col_service:
+        st.caption("**Số đơn theo Yêu Cầu Dịch Vụ**")
+        st.bar_chart(rollups.by("service"), horizontal=True)
+    with col_status:
+        st.caption("**Số đơn theo Tình trạng**")
+        st.bar_chart(rollups.by("status"), horizontal=True)
+
+    granularity = st.radio("Số đơn mới theo", ["Ngày", "Tuần"], horizontal=True, key="analytics_granularity")
+    st.bar_chart(rollups.timeline("D" if granularity == "Ngày" else "W", by="status"))
+
+
+if not df.empty:
+    st.markdown("---")
+    st.header("3. Thống Kê Đơn Hàng")
+    render_order_analytics()
+
 st.markdown("---")
 st.info("Ứng dụng được lập trình bởi NNT.")
+gsheetpool.render_gateway_stats()
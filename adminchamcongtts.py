@@ -1,20 +1,36 @@
+import os
+import time
 import streamlit as st
-import pandas as pd
-import gspread
-import json
-import base64
 import pytz
 from datetime import datetime
+import gsheetpool
+from attendancepartition import AttendancePartitions, PART_COLUMN, ROW_COLUMN, describe_error, month_of
+from attendanceindex import AttendanceIndex, DAY, format_time
+from orderexport import EXPORT_FORMATS, take_file
+from timesheet import Timesheet, export_timesheet
 
 # --- 1. CẤU HÌNH ---
 st.set_page_config(layout="wide", page_title="Quản lý Koshi")
 vn_tz = pytz.timezone('Asia/Ho_Chi_Minh')
 
 # --- 2. KẾT NỐI ---
+@st.cache_resource(show_spinner=False)
+def get_partitions(_creds, sheet_id, worksheet_name):
+    """Nhật ký chấm công phân vùng theo tháng; luồng nền lưu trữ các tháng đã đóng ra Parquet."""
+    return AttendancePartitions(
+        _creds, sheet_id, worksheet_name,
+        archive_dir=st.secrets.get(
+            "attendance_archive_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), "attendance_archive")
+        ),
+        mirror_path=st.secrets.get("sqlite_mirror_path"),  # Tùy chọn: đọc/ghi qua bản sao SQLite
+        keep_months=int(st.secrets.get("attendance_keep_months", 2)),
+        drop_archived=bool(st.secrets.get("attendance_drop_archived", False)),
+    ).start_rollover(vn_tz)
+
+
 try:
-    decoded = json.loads(base64.b64decode(st.secrets["base64_service_account"]).decode('utf-8'))
-    gc = gspread.service_account_from_dict(decoded)
-    sh = gc.open_by_key(st.secrets["sheet_id"]).worksheet(st.secrets["worksheet_name"])
+    decoded = gsheetpool.decode_credentials(st.secrets["base64_service_account"])
+    partitions = get_partitions(decoded, st.secrets["sheet_id"], st.secrets["worksheet_name"])
 except Exception as e:
     st.error(f"Lỗi kết nối: {e}")
     st.stop()
@@ -34,37 +50,102 @@ if not st.session_state.admin_logged:
             else: st.error("Sai tài khoản")
     st.stop()
 
-# --- 4. TẢI DỮ LIỆU ---
-data = sh.get_all_values()
-df_full = pd.DataFrame(data[1:], columns=data[0]) if len(data) > 1 else pd.DataFrame()
-
-# --- 5. SIDEBAR: BỘ LỌC VÀ NÚT ÁP DỤNG (ĐẢM BẢO HIỂN THỊ) ---
-st.sidebar.title("🔍 BỘ LỌC CHUNG")
-
 # Khởi tạo giá trị lọc mặc định nếu chưa có
 if 'curr_date' not in st.session_state:
     st.session_state.curr_date = datetime.now(vn_tz).strftime('%Y-%m-%d')
 if 'curr_user' not in st.session_state:
     st.session_state.curr_user = "Tất cả"
 
+# --- 4. TẢI DỮ LIỆU: CHỈ PHÂN VÙNG CỦA THÁNG ĐANG XEM ---
+def get_month_frame(month):
+    """
+    Bảng của tháng đang xem, giữ trong session_state: phê duyệt sửa thẳng trên bảng này
+    nên không phải tải lại cả phân vùng sau mỗi thao tác.
+    """
+    if st.session_state.get("attendance_month") != month or "attendance_df" not in st.session_state:
+        st.session_state.attendance_df = partitions.load_month(month)
+        st.session_state.attendance_month = month
+        st.session_state.attendance_polled_at = time.time()
+        st.session_state.attendance_version = st.session_state.get("attendance_version", 0) + 1
+    return st.session_state.attendance_df
+
+
+def get_attendance_index():
+    """Bảng đã định kiểu + chỉ mục (ngày, người dùng), chỉ dựng lại khi dữ liệu tải về thay đổi."""
+    index = st.session_state.setdefault("attendance_index", AttendanceIndex())
+    index.sync(st.session_state.attendance_df,
+               (st.session_state.attendance_month, st.session_state.attendance_version))
+    return index
+
+
+def review_rows(df, labels, status):
+    """
+    Ghi tình trạng (cột F) và người duyệt (cột G) cho các dòng `labels` của `df`: mỗi phân vùng
+    một lệnh batch_update, rồi cập nhật luôn `df` và chỉ mục tại chỗ.
+    """
+    now = datetime.now(vn_tz).strftime('%H:%M:%S %d-%m-%Y')
+    reviewer = f"{st.session_state.mail} ({now})"
+    by_part = {}
+    for part, row in df.loc[labels, [PART_COLUMN, ROW_COLUMN]].itertuples(index=False):
+        by_part.setdefault(part, []).append({"range": f"F{row}:G{row}", "values": [[status, reviewer]]})
+    for part, data in by_part.items():
+        partitions.worksheet(part).batch_update(data, value_input_option='USER_ENTERED')
+    df.loc[labels, 'Tình trạng'] = status
+    df.loc[labels, 'Người duyệt'] = reviewer
+    get_attendance_index().set_review(labels, status, reviewer)
+    if "timesheet" in st.session_state:
+        st.session_state.timesheet.set_review(st.session_state.attendance_month, labels, status)
+
+
+APPROVED = "Đã duyệt ✅"
+REJECTED = "Từ chối ❌"
+
+applied_month = month_of(st.session_state.curr_date)
+df_full = get_month_frame(applied_month)
+attendance = get_attendance_index()
+month_archived = os.path.exists(partitions.archive_path(applied_month))
+
+# --- 5. SIDEBAR: BỘ LỌC VÀ NÚT ÁP DỤNG (ĐẢM BẢO HIỂN THỊ) ---
+st.sidebar.title("🔍 BỘ LỌC CHUNG")
+
 # Các ô nhập liệu ở Sidebar
 new_date = st.sidebar.date_input("1. Lọc theo ngày:", value=datetime.strptime(st.session_state.curr_date, '%Y-%m-%d'))
-user_list = ["Tất cả"] + sorted(df_full['Tên người dùng'].unique().tolist()) if not df_full.empty else ["Tất cả"]
+user_list = ["Tất cả"] + attendance.users
 new_user = st.sidebar.selectbox("2. Lọc theo nhân viên:", user_list, index=user_list.index(st.session_state.curr_user) if st.session_state.curr_user in user_list else 0)
 
 # NÚT ÁP DỤNG LỌC (MÀU ĐỎ NỔI BẬT)
 if st.sidebar.button("🚀 ÁP DỤNG LỌC", type="primary", use_container_width=True):
     st.session_state.curr_date = new_date.strftime('%Y-%m-%d')
     st.session_state.curr_user = new_user
+    st.session_state.pop("attendance_df", None)  # Áp dụng lọc = tải lại dữ liệu mới nhất
+    st.rerun()
+if st.sidebar.button("🔄 Tải lại dữ liệu", use_container_width=True):
+    st.session_state.pop("attendance_df", None)
     st.rerun()
 
 st.sidebar.divider()
 if st.sidebar.button("🚪 Đăng xuất", use_container_width=True):
     st.session_state.admin_logged = False
     st.rerun()
+if st.sidebar.button("🗄️ Lưu trữ các tháng đã đóng", use_container_width=True):
+    try:
+        with st.spinner("Đang lưu trữ..."):
+            archived = partitions.archive_closed_months(datetime.now(vn_tz))
+        st.sidebar.success(
+            "Đã lưu trữ: " + ", ".join(f"{m} ({n} dòng)" for m, n in archived.items()) if archived
+            else "Không có tháng nào cần lưu trữ."
+        )
+    except Exception as e:
+        st.sidebar.error(f"Lưu trữ thất bại: {describe_error(e)}")
+gsheetpool.render_gateway_stats()
 
 # --- 6. GIAO DIỆN CHÍNH ---
 st.title("🔑 Phê duyệt & Quản lý Chấm công")
+if partitions.last_error:
+    st.error(
+        f"🗄️ Lưu trữ tự động các tháng đã đóng bị lỗi lúc {partitions.last_error_at:%H:%M %d/%m/%Y}: "
+        f"{partitions.last_error}. Dữ liệu vẫn còn trên Google Sheets; hệ thống sẽ tự thử lại."
+    )
 
 # Lấy giá trị đã chốt từ session_state
 applied_date = st.session_state.curr_date
@@ -72,71 +153,158 @@ applied_user = st.session_state.curr_user
 
 # Thanh trạng thái hiển thị rõ ràng
 st.info(f"📍 Đang hiển thị dữ liệu của: **{applied_user}** vào ngày **{applied_date}**")
+if month_archived:
+    st.caption(f"🗄️ Tháng {applied_month} đã được lưu trữ: chỉ xem, không phê duyệt được.")
 
-tab1, tab2 = st.tabs(["⏳ Chờ phê duyệt", "📜 Lịch sử"])
+tab1, tab2, tab3 = st.tabs(["⏳ Chờ phê duyệt", "📜 Lịch sử", "🧮 Bảng công"])
 
-# --- TAB 1: PHÊ DUYỆT ---
-with tab1:
+# --- TAB 1: PHÊ DUYỆT (TỰ LÀM MỚI, CHẠY RIÊNG TRONG FRAGMENT) ---
+POLL_SECONDS = int(st.secrets.get("admin_poll_seconds", 30))
+
+
+def poll_pending_changes():
+    """
+    Đối chiếu bảng đang giữ với phân vùng tháng trên Sheet (tín hiệu rẻ: hai cột D + F),
+    chỉ tải các dòng mới/đổi. Bỏ qua nếu vừa tải xong hoặc tháng đã lưu trữ.
+    """
+    if month_archived or time.time() - st.session_state.get("attendance_polled_at", 0) < POLL_SECONDS / 2:
+        return st.session_state.attendance_df
+    try:
+        df, changed = partitions.refresh_month(st.session_state.attendance_df, applied_month)
+    except Exception as e:
+        st.caption(f"⚠️ Chưa làm mới được: {e}")
+        return st.session_state.attendance_df
+    st.session_state.attendance_polled_at = time.time()
+    if changed:
+        st.session_state.attendance_df = df
+        st.session_state.attendance_version += 1
+    return df
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def render_pending():
+    # Chỉ phần này chạy lại theo chu kỳ; sidebar, tab lịch sử và đăng nhập không bị chạy lại
+    df_full = poll_pending_changes()
+    index = get_attendance_index()
     if not df_full.empty:
-        # Lọc danh sách Chờ duyệt
-        pending = df_full[df_full['Tình trạng'] == "Chờ duyệt"].copy()
-        if not pending.empty:
-            pending['date_only'] = pending['Thời gian Check in'].str[:10]
-            # Lọc theo Ngày & Người dùng đã ÁP DỤNG
-            mask = (pending['date_only'] == applied_date)
-            if applied_user != "Tất cả":
-                mask = mask & (pending['Tên người dùng'] == applied_user)
-            
-            res = pending[mask]
-            
+        if (index.frame['Tình trạng'] == "Chờ duyệt").any():
+            # Lọc theo Ngày & Người dùng đã ÁP DỤNG (tra chỉ mục, không quét bảng)
+            res = index.lookup(applied_date, None if applied_user == "Tất cả" else applied_user, status="Chờ duyệt")
+
             if res.empty:
                 st.warning(f"Không có yêu cầu chờ duyệt nào cho {applied_user} vào {applied_date}")
             else:
                 st.write(f"Tìm thấy **{len(res)}** yêu cầu:")
+                if not month_archived:
+                    # Duyệt hàng loạt: mọi ô tình trạng + người duyệt được ghi trong một lệnh batch_update
+                    picker = res[['Tên người dùng', 'Thời gian Check in', 'Thời gian Check out', 'Ghi chú']].copy()
+                    picker.insert(0, "Chọn", False)
+                    picked = st.data_editor(
+                        picker, hide_index=True, use_container_width=True,
+                        disabled=list(picker.columns[1:]), key=f"pick_{applied_date}_{applied_user}_{hash(tuple(res.index))}",
+                    )
+                    selected = res.index[picked["Chọn"].to_numpy(dtype=bool)]
+                    bulk_ok, bulk_no, bulk_all = st.columns(3)
+                    if bulk_ok.button(f"✅ Duyệt đã chọn ({len(selected)})", disabled=selected.empty, use_container_width=True):
+                        review_rows(df_full, selected, APPROVED)
+                        st.rerun(scope="fragment")
+                    if bulk_no.button(f"❌ Từ chối đã chọn ({len(selected)})", disabled=selected.empty, use_container_width=True):
+                        review_rows(df_full, selected, REJECTED)
+                        st.rerun(scope="fragment")
+                    if bulk_all.button(f"✅ Duyệt tất cả đang hiện ({len(res)})", type="primary", use_container_width=True):
+                        review_rows(df_full, res.index, APPROVED)
+                        st.rerun(scope="fragment")
                 for idx, r in res.iterrows():
-                    real_row = idx + 2
+                    real_row = int(r[ROW_COLUMN])
                     with st.container(border=True):
                         st.markdown(f"### 👤 {r['Tên người dùng']}")
                         c1, c2 = st.columns(2)
-                        with c1: st.success(f"🛫 **Vào:** {r['Thời gian Check in']}")
-                        with c2: st.error(f"🛬 **Ra:** {r['Thời gian Check out']}")
+                        with c1: st.success(f"🛫 **Vào:** {format_time(r['Thời gian Check in'])}")
+                        with c2: st.error(f"🛬 **Ra:** {format_time(r['Thời gian Check out'])}")
                         if r['Ghi chú']: st.info(f"📝 **Ghi chú:** {r['Ghi chú']}")
                         
+                        if month_archived:
+                            continue
                         btn_ok, btn_no = st.columns(2)
-                        if btn_ok.button("✅ DUYỆT", key=f"ok_{real_row}", use_container_width=True):
-                            now = datetime.now(vn_tz).strftime('%H:%M:%S %d-%m-%Y')
-                            sh.update_cell(real_row, 6, "Đã duyệt ✅")
-                            sh.update_cell(real_row, 7, f"{st.session_state.mail} ({now})")
-                            st.rerun()
-                        if btn_no.button("❌ TỪ CHỐI", key=f"no_{real_row}", use_container_width=True, type="primary"):
-                            now = datetime.now(vn_tz).strftime('%H:%M:%S %d-%m-%Y')
-                            sh.update_cell(real_row, 6, "Từ chối ❌")
-                            sh.update_cell(real_row, 7, f"{st.session_state.mail} ({now})")
-                            st.rerun()
+                        if btn_ok.button("✅ DUYỆT", key=f"ok_{r[PART_COLUMN]}_{real_row}", use_container_width=True):
+                            review_rows(df_full, [idx], APPROVED)
+                            st.rerun(scope="fragment")
+                        if btn_no.button("❌ TỪ CHỐI", key=f"no_{r[PART_COLUMN]}_{real_row}", use_container_width=True, type="primary"):
+                            review_rows(df_full, [idx], REJECTED)
+                            st.rerun(scope="fragment")
         else:
             st.success("Tất cả yêu cầu đã được xử lý.")
 
+
+
+with tab1:
+    render_pending()
+
 # --- TAB 2: LỊCH SỬ (ĐÃ FIX LỖI LỌC) ---
 with tab2:
     st.subheader("📜 Dữ liệu hệ thống")
     if not df_full.empty:
-        # Tạo bản sao và lọc theo đúng tiêu chí Sidebar đã Áp dụng
-        hist_df = df_full.copy()
-        hist_df['date_tmp'] = hist_df['Thời gian Check in'].str[:10]
-        
-        # Lọc ngày
-        hist_df = hist_df[hist_df['date_tmp'] == applied_date]
-        
-        # Lọc nhân viên
-        if applied_user != "Tất cả":
-            hist_df = hist_df[hist_df['Tên người dùng'] == applied_user]
-            
+        # Lọc theo đúng tiêu chí Sidebar đã Áp dụng (tra chỉ mục ngày / ngày + nhân viên)
+        hist_df = attendance.lookup(applied_date, None if applied_user == "Tất cả" else applied_user)
+
         if hist_df.empty:
             st.warning("Không có dữ liệu lịch sử nào khớp với bộ lọc.")
         else:
             # Hiện bảng (Xóa cột tạm và đảo ngược thứ tự)
             st.dataframe(
-                hist_df.drop(columns=['date_tmp']).iloc[::-1],
+                hist_df.drop(columns=[DAY, PART_COLUMN, ROW_COLUMN]).iloc[::-1],
                 use_container_width=True,
                 hide_index=True
             )
+
+# --- TAB 3: BẢNG CÔNG (GIỜ ĐÃ DUYỆT THEO NHÂN VIÊN) ---
+TIMESHEET_REPORTS = {
+    "Tổng theo tháng": Timesheet.monthly,
+    "Theo ngày": Timesheet.daily,
+    "Chi tiết từng ca": Timesheet.shifts,
+    "Ca bất thường": Timesheet.issues,
+}
+TIMESHEET_FORMATS = ["Excel (XLSX)", "CSV"]
+
+with tab3:
+    # Tính một lần cho mỗi phiên bản dữ liệu; duyệt/từ chối chỉ cộng/trừ phần thay đổi (xem review_rows)
+    timesheet = st.session_state.setdefault("timesheet", Timesheet(tz=vn_tz.zone))
+    timesheet.sync(applied_month, attendance.frame, (applied_month, st.session_state.attendance_version))
+    monthly = timesheet.monthly(applied_month)
+    issues = timesheet.issues(applied_month)
+
+    st.subheader(f"🧮 Bảng công tháng {applied_month}")
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Tổng giờ đã duyệt", f"{monthly['Số giờ'].sum():,.1f}")
+    m2.metric("Số nhân viên", len(monthly))
+    m3.metric("Ca bất thường", len(issues))
+    st.dataframe(monthly, use_container_width=True)
+    with st.expander("📅 Giờ làm theo ngày"):
+        st.dataframe(timesheet.daily(applied_month), use_container_width=True)
+    if not issues.empty:
+        with st.expander(f"⚠️ Ca bất thường ({len(issues)})"):
+            st.dataframe(issues, use_container_width=True)
+
+    col_report, col_fmt = st.columns(2)
+    report_name = col_report.selectbox("Báo cáo", list(TIMESHEET_REPORTS), key="timesheet_report")
+    report_fmt = col_fmt.selectbox("Định dạng", TIMESHEET_FORMATS, key="timesheet_format")
+    if st.button("Tạo file bảng công"):
+        st.session_state.pop("timesheet_data", None)
+        try:
+            with st.spinner("🔄 Đang ghi file..."):
+                report = TIMESHEET_REPORTS[report_name](timesheet, applied_month)
+                st.session_state["timesheet_data"] = take_file(export_timesheet(report, report_fmt))
+            st.session_state["timesheet_info"] = (report_name, report_fmt)
+        except ImportError as e:
+            st.error(f"Thiếu thư viện cho định dạng {report_fmt}: {e}")
+
+    timesheet_data = st.session_state.get("timesheet_data")
+    if timesheet_data is not None:
+        name, fmt = st.session_state["timesheet_info"]
+        suffix, mime, _ = EXPORT_FORMATS[fmt]
+        st.download_button(
+            f"⬇️ Tải {name.lower()} ({fmt})",
+            data=timesheet_data,
+            file_name=f"bang_cong_{applied_month}{suffix}",
+            mime=mime,
+        )
@@ -0,0 +1,90 @@
+"""
+Bảng chấm công đã định kiểu kèm chỉ mục (ngày, người dùng) cho trang quản trị.
+
+- Phân tích một lần: Check in/Check out -> datetime, Tên người dùng/Tình trạng -> category.
+- Chỉ mục nhóm ngày -> vị trí dòng và (ngày, người dùng) -> vị trí dòng: mỗi lần lọc chỉ là
+  một lần tra dict rồi iloc vài dòng, không quét hay sao chép cả bảng.
+- Chỉ dựng lại khi `version` của dữ liệu đổi; phê duyệt chỉ đổi tình trạng/người duyệt
+  nên được cập nhật tại chỗ bằng `set_review()`.
+"""
+import threading
+
+import pandas as pd
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+CHECK_IN = 'Thời gian Check in'
+CHECK_OUT = 'Thời gian Check out'
+USER = 'Tên người dùng'
+STATUS = 'Tình trạng'
+REVIEWER = 'Người duyệt'
+DAY = "_day"  # Ngày check-in (00:00), khóa của chỉ mục
+
+
+def parse_times(values):
+    """Chuỗi thời gian -> datetime (NaT nếu trống/không đọc được); thử định dạng chuẩn trước cho nhanh."""
+    raw = values.astype(str).str.strip()
+    parsed = pd.to_datetime(raw, format=TIME_FORMAT, errors="coerce")
+    failed = parsed.isna() & (raw != "")
+    if failed.any():
+        # Ô đã bị Google Sheets định dạng lại (VD: '1/6/2025 8:00:00')
+        parsed[failed] = pd.to_datetime(raw[failed], format="mixed", dayfirst=True, errors="coerce")
+    return parsed
+
+
+def format_time(value):
+    return "" if pd.isna(value) else value.strftime(TIME_FORMAT)
+
+
+def typed_frame(df):
+    """Bản định kiểu của bảng chấm công (giữ nguyên chỉ mục dòng và các cột còn lại)."""
+    frame = df.copy()
+    frame[CHECK_IN] = parse_times(df[CHECK_IN])
+    frame[CHECK_OUT] = parse_times(df[CHECK_OUT])
+    frame[USER] = df[USER].astype(str).astype("category")
+    frame[STATUS] = df[STATUS].astype(str).astype("category")
+    frame[DAY] = frame[CHECK_IN].dt.normalize()
+    return frame
+
+
+class AttendanceIndex:
+    def __init__(self):
+        self.version = None
+        self.frame = None
+        self.users = []
+        self._lock = threading.RLock()
+        self._by_day = {}
+        self._by_day_user = {}
+        self._status = None  # Mảng tình trạng theo vị trí dòng, để lọc trước khi iloc
+
+    def sync(self, df, version=None):
+        """Định kiểu lại `df` và dựng chỉ mục; bỏ qua nếu `version` không đổi."""
+        with self._lock:
+            if version is not None and version == self.version and self.frame is not None:
+                return
+            frame = typed_frame(df)
+            self._by_day = frame.groupby(DAY, sort=False).indices
+            self._by_day_user = frame.groupby([DAY, USER], sort=False, observed=True).indices
+            self.users = sorted(frame[USER].cat.categories)
+            self._status = frame[STATUS].to_numpy(dtype=object)
+            self.frame = frame
+            self.version = version
+
+    def lookup(self, day, user=None, status=None):
+        """Các dòng của ngày `day` ('YYYY-MM-DD' hoặc date), lọc thêm theo người dùng/tình trạng nếu có."""
+        with self._lock:
+            key = pd.Timestamp(day).normalize()
+            positions = self._by_day.get(key) if user is None else self._by_day_user.get((key, user))
+            if positions is None:
+                return self.frame.iloc[:0]
+            if status is not None:
+                positions = positions[self._status[positions] == status]
+            return self.frame.iloc[positions]
+
+    def set_review(self, labels, status, reviewer):
+        """Cập nhật tình trạng + người duyệt của các dòng `labels` tại chỗ (không dựng lại chỉ mục)."""
+        with self._lock:
+            if status not in self.frame[STATUS].cat.categories:
+                self.frame[STATUS] = self.frame[STATUS].cat.add_categories([status])
+            self.frame.loc[labels, STATUS] = status
+            self.frame.loc[labels, REVIEWER] = reviewer
+            self._status[self.frame.index.get_indexer(labels)] = status
@@ -0,0 +1,254 @@
+"""
+Phân vùng nhật ký chấm công theo tháng và lưu trữ các tháng đã đóng.
+
+- Mỗi tháng một Worksheet "<tên gốc>_YYYY-MM", tự tạo (kèm dòng tiêu đề) khi cần ghi.
+  Ghi và đọc thường ngày chỉ chạm vào phân vùng của tháng hiện tại, nên lượng dữ liệu
+  phải tải không tăng theo thời gian.
+- Worksheet gốc (dữ liệu trước khi phân vùng) được giữ nguyên và chỉ đọc khi hỏi tới
+  một tháng chưa có phân vùng/lưu trữ.
+- `archive_closed_months()` ghi các tháng đã đóng ra Parquet nén zstd trong thư mục lưu trữ;
+  đọc một tháng cũ sẽ ưu tiên file Parquet, không gọi Google Sheets. Mỗi lúc chỉ một lượt lưu trữ
+  chạy trong tiến trình (luồng nền và nút trên trang quản trị dùng chung khóa); Worksheet gốc
+  được đọc một lần cho cả lượt rồi chia theo tháng.
+  Tùy chọn `drop_archived`: xóa Worksheet của tháng đã lưu trữ để Spreadsheet không phình ra.
+
+Phân vùng được nhận diện bằng chuỗi tháng 'YYYY-MM'; None = Worksheet gốc.
+"""
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+from gspread.exceptions import APIError, WorksheetNotFound
+
+import gsheetpool
+
+HEADER = ['Số thứ tự', 'Tên người dùng', 'Thời gian Check in', 'Thời gian Check out', 'Ghi chú', 'Tình trạng', 'Người duyệt']
+PART_COLUMN = "_part"  # Phân vùng chứa dòng (None = Worksheet gốc)
+ROW_COLUMN = "_row"    # Số dòng trên Worksheet đó
+
+_archive_lock = threading.Lock()  # Một lượt lưu trữ mỗi lúc (luồng nền + nút thủ công)
+
+
+def month_of(value):
+    """'2025-06-01 08:00:00' / date / datetime -> '2025-06'."""
+    return value.strftime("%Y-%m") if hasattr(value, "strftime") else str(value)[:7]
+
+
+def previous_month(month):
+    year, mon = map(int, month.split("-"))
+    return f"{year - 1}-12" if mon == 1 else f"{year}-{mon - 1:02d}"
+
+
+def describe_error(error):
+    """Mô tả lỗi lưu trữ cho người quản trị (thiếu thư viện Parquet thì chỉ rõ cần cài gì)."""
+    if isinstance(error, ImportError):
+        return f"Thiếu thư viện ghi/đọc Parquet (cài pyarrow: pip install pyarrow). Chi tiết: {error}"
+    return f"{type(error).__name__}: {error}"
+
+
+def _frame(rows, part, first_row=2):
+    width = len(HEADER)
+    df = pd.DataFrame([(list(r) + [""] * width)[:width] for r in rows], columns=HEADER)
+    df[PART_COLUMN] = part
+    df[ROW_COLUMN] = range(first_row, first_row + len(df))
+    return df
+
+
+class AttendancePartitions:
+    def __init__(self, creds, spreadsheet_id, base_name, archive_dir, mirror_path=None,
+                 keep_months=2, drop_archived=False):
+        """keep_months: số tháng gần nhất (tính cả tháng hiện tại) luôn giữ trên Google Sheets."""
+        self.creds = creds
+        self.spreadsheet_id = spreadsheet_id
+        self.base_name = base_name
+        self.archive_dir = archive_dir
+        self.mirror_path = mirror_path
+        self.keep_months = keep_months
+        self.drop_archived = drop_archived
+        self.last_error = ""  # Lỗi của lần lưu trữ tự động gần nhất ("" = thành công)
+        self.last_error_at = None
+        self._legacy_months = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(archive_dir, exist_ok=True)
+
+    # --- Worksheet theo phân vùng ---
+    def title(self, part):
+        return self.base_name if part is None else f"{self.base_name}_{part}"
+
+    def _open(self, part):
+        return gsheetpool.get_worksheet(self.creds, self.title(part), spreadsheet_id=self.spreadsheet_id,
+                                        mirror_path=self.mirror_path,
+                                        watch_headers=('Thời gian Check out', 'Tình trạng'))
+
+    def worksheet(self, part, create=False):
+        """Worksheet của phân vùng `part` (None nếu chưa có và create=False)."""
+        try:
+            return self._open(part)
+        except WorksheetNotFound:
+            if not create or part is None:
+                return None
+        with self._lock:
+            spreadsheet = gsheetpool.get_client(self.creds).open_by_key(self.spreadsheet_id)
+            try:
+                ws = spreadsheet.add_worksheet(self.title(part), rows=1000, cols=len(HEADER))
+                ws.update(range_name="A1", values=[HEADER])
+            except APIError:
+                pass  # Tiến trình khác vừa tạo cùng lúc
+        return self._open(part)
+
+    # --- Đọc ---
+    def archive_path(self, month):
+        return os.path.join(self.archive_dir, f"{self.base_name}_{month}.parquet")
+
+    def _legacy_frame(self):
+        return _frame(self._open(None).get_all_values()[1:], None)
+
+    def load_month(self, month, legacy=None):
+        """
+        Toàn bộ dòng của một tháng (cột HEADER + _part + _row). Có file lưu trữ thì chỉ đọc file;
+        nếu không thì lấy phân vùng trên Sheet, cộng các dòng của tháng đó trong Worksheet gốc
+        (chỉ khi Worksheet gốc có dữ liệu tháng này, VD: tháng chuyển sang phân vùng).
+        `legacy`: các dòng của tháng này trong Worksheet gốc nếu người gọi đã đọc sẵn.
+        """
+        path = self.archive_path(month)
+        if os.path.exists(path):
+            return pd.read_parquet(path)
+        frames = []
+        if month in self.legacy_months():
+            if legacy is None:
+                base = self._legacy_frame()
+                legacy = base[base['Thời gian Check in'].str[:7] == month]
+            frames.append(legacy)
+        ws = self.worksheet(month)
+        if ws is not None:
+            frames.append(_frame(ws.get_all_values()[1:], month))
+        return pd.concat(frames, ignore_index=True) if frames else _frame([], month)
+
+    def refresh_month(self, df, month, max_changed=200):
+        """
+        Đưa `df` (kết quả load_month) về khớp với phân vùng `month` trên Sheet mà không tải lại cả tháng.
+        Tín hiệu thay đổi: một lệnh batch_get hai cột hẹp Check out (D) + Tình trạng (F), so với bản
+        đang có để biết dòng nào mới/đổi; chỉ các dòng đó mới được lấy đủ cột bằng thêm một batch_get.
+        Trả về (bảng đã cập nhật, số dòng mới hoặc đổi); tháng đã lưu trữ thì không đổi gì.
+        """
+        if os.path.exists(self.archive_path(month)):
+            return df, 0
+        ws = self.worksheet(month)
+        if ws is None:
+            return df, 0
+        check_out, status = ws.batch_get(["D2:D", "F2:F"])
+        total = max(len(check_out), len(status))
+        remote = pd.DataFrame({
+            'Thời gian Check out': [(r[0] if r else "") for r in check_out] + [""] * (total - len(check_out)),
+            'Tình trạng': [(r[0] if r else "") for r in status] + [""] * (total - len(status)),
+        }, index=pd.RangeIndex(2, total + 2))
+
+        own = df[df[PART_COLUMN] == month]
+        local = own.set_index(ROW_COLUMN)[['Thời gian Check out', 'Tình trạng']]
+        local = local[local.index < total + 2]
+        diff = (local.values != remote.loc[local.index].values).any(axis=1)
+        changed = local.index[diff]
+        first_new = int(own[ROW_COLUMN].max()) + 1 if len(own) else 2
+        new_rows = max(0, total + 2 - first_new)
+        if not len(changed) and not new_rows:
+            return df, 0
+        if len(changed) > max_changed or len(local) < len(own):
+            # Quá nhiều dòng đổi hoặc Sheet bị xóa bớt dòng: tải lại cả phân vùng
+            return pd.concat([df[df[PART_COLUMN] != month], _frame(ws.get_all_values()[1:], month)],
+                             ignore_index=True), len(changed) + new_rows
+
+        ranges = [f"A{r}:G{r}" for r in changed]
+        if new_rows:
+            ranges.append(f"A{first_new}:G{total + 1}")
+        fetched = ws.batch_get(ranges)
+        if len(changed):
+            updated = _frame([(block[0] if block else []) for block in fetched[:len(changed)]], month)
+            positions = own.index[pd.Index(own[ROW_COLUMN]).get_indexer(changed)]
+            df.loc[positions, HEADER] = updated[HEADER].values
+        if new_rows:
+            df = pd.concat([df, _frame(fetched[-1], month, first_row=first_new)], ignore_index=True)
+        return df, len(changed) + new_rows
+
+    def legacy_months(self, refresh=False):
+        """Các tháng có dữ liệu trong Worksheet gốc (đọc cột Check in một lần, làm mới khi lưu trữ)."""
+        if refresh or self._legacy_months is None:
+            try:
+                column = self._open(None).col_values(HEADER.index('Thời gian Check in') + 1)[1:]
+            except WorksheetNotFound:
+                column = []
+            self._legacy_months = {str(ts)[:7] for ts in column if ts}
+        return self._legacy_months
+
+    # --- Lưu trữ ---
+    def closed_months(self, now):
+        """Các tháng (có dữ liệu trên Sheet) cũ hơn `keep_months` tháng gần nhất và chưa lưu trữ."""
+        keep = [month_of(now)]
+        while len(keep) < self.keep_months:
+            keep.append(previous_month(keep[-1]))
+        oldest_kept = keep[-1]
+
+        spreadsheet = gsheetpool.get_client(self.creds).open_by_key(self.spreadsheet_id)
+        prefix = f"{self.base_name}_"
+        months = {ws.title[len(prefix):] for ws in spreadsheet.worksheets() if ws.title.startswith(prefix)}
+        months.update(self.legacy_months(refresh=True))
+        return sorted(m for m in months
+                      if m < oldest_kept and len(m) == 7 and not os.path.exists(self.archive_path(m)))
+
+    def archive_month(self, month, legacy=None):
+        """
+        Ghi một tháng ra Parquet (ghi file tạm rồi đổi tên), sau đó xóa Worksheet nếu được cấu hình.
+        Gọi qua archive_closed_months() để có khóa; `legacy` như load_month().
+        """
+        df = self.load_month(month, legacy)
+        df[PART_COLUMN] = df[PART_COLUMN].astype(object).where(df[PART_COLUMN].notna(), None)
+        path = self.archive_path(month)
+        tmp = f"{path}.tmp"
+        df.to_parquet(tmp, compression="zstd", index=False)
+        os.replace(tmp, path)
+
+        if self.drop_archived:
+            ws = self.worksheet(month)
+            if ws is not None:
+                spreadsheet = gsheetpool.get_client(self.creds).open_by_key(self.spreadsheet_id)
+                spreadsheet.del_worksheet(getattr(ws, "worksheet", ws))
+        return path, len(df)
+
+    def archive_closed_months(self, now=None):
+        """Lưu trữ mọi tháng đã đóng; trả về {tháng: số dòng}. Lượt chạy đồng thời sẽ chờ lượt trước xong."""
+        now = now or datetime.now()
+        with _archive_lock:
+            months = self.closed_months(now)
+            legacy = {}
+            if set(months) & self.legacy_months():
+                base = self._legacy_frame()
+                legacy = dict(tuple(base.groupby(base['Thời gian Check in'].str[:7], sort=False)))
+            return {month: self.archive_month(month, legacy.get(month, _frame([], None)))[1]
+                    for month in months}
+
+    # --- Luồng nền lưu trữ định kỳ ---
+    def start_rollover(self, tz, interval=6 * 3600):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(tz, interval),
+                                            name="attendance-rollover", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, tz, interval):
+        while not self._stop.is_set():
+            try:
+                self.archive_closed_months(datetime.now(tz))
+                self.last_error, self.last_error_at = "", None
+            except Exception as e:
+                # Giữ lại để trang quản trị hiển thị (ghi thời điểm trước); lần chạy sau sẽ thử lại
+                self.last_error_at = datetime.now(tz)
+                self.last_error = describe_error(e)
+            self._stop.wait(interval)
@@ -0,0 +1,274 @@
+"""
+Hàng đợi chấm công lưu bền trong SQLite, gom các lượt check-in/check-out giờ cao điểm.
+
+- Giao diện chỉ ghi sự kiện vào SQLite rồi báo thành công ngay, không chờ Google Sheets.
+- Luồng nền lấy các sự kiện đang chờ theo đúng thứ tự ghi nhận: mọi check-in trong lô
+  -> một lệnh append, mọi check-out trong lô -> một lệnh batch_update. Số request không
+  phụ thuộc số người chấm công cùng lúc; hạn mức mỗi phút do cổng Sheets điều tiết.
+- Thứ tự theo từng người được giữ: check-out luôn đóng đúng ca check-in đứng trước nó
+  (kể cả khi hai sự kiện nằm trong cùng một lô). Lô lỗi được thử lại nguyên vẹn.
+- Idempotent: sự kiện trùng ID chỉ được ghi nhận một lần; check-in đã gửi nhưng không rõ
+  kết quả (mất kết nối giữa chừng) được đối chiếu trên Sheet trước khi gửi lại.
+
+Phần ghi Sheet do `sink` đảm nhận (xem SheetAttendanceSink trong chamcong.py). Vị trí một dòng
+là `ref` = (phân vùng, số dòng), phân vùng do sink tự quy ước (VD: tháng 'YYYY-MM'):
+    append_check_ins([(user, ts)]) -> [ref]
+    find_check_ins([(user, ts)], {phân vùng: dòng cuối đã biết}) -> {(user, ts): ref}
+    take_open_shift(user_key) -> ref | None
+    remember_open_shift(user_key, ref)
+    write_check_outs([(ref, ts, note)])
+`match_check_ins()` là phần so khớp dùng chung cho find_check_ins trên một Worksheet.
+"""
+import random
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+from gspread.exceptions import APIError
+
+from attendanceindex import parse_times
+
+CHECK_IN = "in"
+CHECK_OUT = "out"
+
+PENDING = "pending"
+SENDING = "sending"  # Đã gửi nhưng chưa rõ kết quả
+DONE = "done"
+FAILED = "failed"
+
+_COLUMNS = "seq, event_id, kind, user, user_key, ts, note, status, part, row_num"
+
+
+def user_key(user):
+    return str(user).strip().lower()
+
+
+def match_check_ins(ws, since_row, entries):
+    """
+    Các lượt check-in [(người dùng, thời gian)] đã nằm trên `ws` (cột B:C) từ dòng `since_row`
+    -> số dòng. So theo thời điểm đã phân tích chứ không theo chuỗi: ô ghi USER_ENTERED bị
+    Sheets định dạng lại (VD: '1/6/2025 8:00:00'). `since_row` vượt lưới (Sheet vừa khít dữ liệu)
+    nghĩa là chưa có dòng nào mới.
+    """
+    try:
+        values = ws.get(f"B{since_row}:C")
+    except APIError as e:
+        if "exceeds grid limits" in str(e):
+            return {}
+        raise
+    if not values or not entries:
+        return {}
+    users = [str(v[0]).strip() if v else "" for v in values]
+    times = parse_times(pd.Series([v[1] if len(v) > 1 else "" for v in values], dtype=object))
+    wanted_times = parse_times(pd.Series([ts for _, ts in entries], dtype=object))
+    wanted = {(str(user).strip(), t): (user, ts)
+              for (user, ts), t in zip(entries, wanted_times) if pd.notna(t)}
+
+    found = {}
+    for offset, (user, t) in enumerate(zip(users, times)):
+        entry = wanted.get((user, t)) if pd.notna(t) else None
+        if entry is not None:
+            found[entry] = since_row + offset
+    return found
+
+
+class AttendanceQueue:
+    def __init__(self, db_path, sink, flush_interval=2.0, max_batch=500, max_backoff=300.0,
+                 retention=7 * 24 * 3600):
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_backoff = max_backoff
+        self.retention = retention
+        self.last_error = ""
+        self.last_flushed_at = 0.0
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS attendance_events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, event_id TEXT UNIQUE, kind TEXT, user TEXT, "
+            "user_key TEXT, ts TEXT, note TEXT, status TEXT, part TEXT, row_num INTEGER, attempts INTEGER DEFAULT 0, "
+            "last_error TEXT DEFAULT '', created_at REAL)"
+        )
+        # Hàng đợi tạo trước khi có phân vùng theo tháng: thêm cột `part`
+        columns = {r[1] for r in self._db.execute("PRAGMA table_info(attendance_events)")}
+        if "part" not in columns:
+            self._db.execute("ALTER TABLE attendance_events ADD COLUMN part TEXT")
+
+    # --- Vòng đời ---
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="attendance-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        backoff = 0.0
+        while not self._stop.is_set():
+            try:
+                self.flush()
+                self._purge()
+                self.last_error = ""
+                backoff = 0.0
+            except Exception as e:
+                # 429 / lỗi mạng: sự kiện vẫn nằm trong hàng đợi, thử lại chậm dần
+                self.last_error = str(e)
+                backoff = min(self.max_backoff, max(self.flush_interval, backoff * 2))
+            delay = backoff + random.uniform(0, backoff / 2) if backoff else self.flush_interval
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    # --- API cho giao diện ---
+    def enqueue(self, kind, user, ts, note="", event_id=None):
+        """
+        Ghi nhận một sự kiện và trả về ID của nó (không chờ ghi Sheet).
+        ID mặc định gồm loại + người dùng + thời điểm (đến giây): bấm lặp trong cùng giây không tạo bản trùng.
+        """
+        event_id = event_id or f"{kind}:{user_key(user)}:{ts}"
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO attendance_events "
+                "(event_id, kind, user, user_key, ts, note, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (event_id, kind, str(user).strip(), user_key(user), ts, note, PENDING, time.time()),
+            )
+        self._wake.set()
+        return event_id
+
+    def last_pending_kind(self, user):
+        """
+        Loại (CHECK_IN/CHECK_OUT) của sự kiện chờ đẩy mới nhất của người dùng, None nếu không có.
+        CHECK_OUT nghĩa là ca đang mở đã có lượt check-out chờ ghi: không nhận thêm check-out nữa.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT kind FROM attendance_events WHERE user_key = ? AND status IN (?, ?) "
+                "ORDER BY seq DESC LIMIT 1",
+                (user_key(user), PENDING, SENDING),
+            ).fetchone()
+            return row[0] if row else None
+
+    def user_events(self, user, limit=10):
+        """Các sự kiện gần nhất của người dùng: danh sách dict (mới nhất trước)."""
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT kind, ts, status, last_error FROM attendance_events "
+                "WHERE user_key = ? ORDER BY seq DESC LIMIT ?",
+                (user_key(user), limit),
+            )
+            return [dict(zip(("kind", "ts", "status", "last_error"), r)) for r in cur]
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM attendance_events WHERE status IN (?, ?)", (PENDING, SENDING)
+            ).fetchone()[0]
+
+    # --- Đẩy lên Sheet ---
+    def _pending(self):
+        with self._lock:
+            cur = self._db.execute(
+                f"SELECT {_COLUMNS} FROM attendance_events WHERE status IN (?, ?) ORDER BY seq LIMIT ?",
+                (PENDING, SENDING, self.max_batch),
+            )
+            events = [dict(zip(_COLUMNS.split(", "), r)) for r in cur]
+        for e in events:
+            e["ref"] = None if e["row_num"] is None else (e["part"], e["row_num"])
+        return events
+
+    def _set(self, events, status, error=""):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "UPDATE attendance_events SET status = ?, part = ?, row_num = ?, last_error = ?, "
+                "attempts = attempts + ? WHERE seq = ?",
+                [(status, *(e["ref"] or (None, None)), error, int(status == SENDING), e["seq"]) for e in events],
+            )
+            self._db.execute("COMMIT")
+        for e in events:
+            e["status"] = status
+
+    def _known_last_rows(self):
+        """Dòng check-in lớn nhất đã biết của từng phân vùng."""
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT part, MAX(row_num) FROM attendance_events "
+                "WHERE kind = ? AND row_num IS NOT NULL GROUP BY part",
+                (CHECK_IN,),
+            )
+            return dict(cur.fetchall())
+
+    def flush(self):
+        """Đẩy một lô sự kiện đang chờ; trả về số sự kiện đã xử lý xong."""
+        with self._flush_lock:
+            events = self._pending()
+            if not events:
+                return 0
+
+            # 1. Check-in: đối chiếu các lượt chưa rõ kết quả, rồi gửi phần còn lại bằng một lệnh append
+            check_ins = [e for e in events if e["kind"] == CHECK_IN and e["ref"] is None]
+            uncertain = [e for e in check_ins if e["status"] == SENDING]
+            if uncertain:
+                landed = self.sink.find_check_ins([(e["user"], e["ts"]) for e in uncertain],
+                                                  self._known_last_rows())
+                for e in uncertain:
+                    e["ref"] = landed.get((e["user"], e["ts"]))
+                check_ins = [e for e in check_ins if e["ref"] is None]
+            if check_ins:
+                self._set(check_ins, SENDING)
+                refs = self.sink.append_check_ins([(e["user"], e["ts"]) for e in check_ins])
+                for e, ref in zip(check_ins, refs):
+                    e["ref"] = ref
+            self._set([e for e in events if e["kind"] == CHECK_IN], DONE)
+
+            # 2. Check-out: duyệt theo thứ tự, ca mở trong lô được ưu tiên trước chỉ mục.
+            # Mỗi ca chỉ được đóng một lần trong lô: giờ ra chưa ghi nên Sheet vẫn thấy ca đó mở.
+            open_refs = {}
+            check_outs, not_found, closed_twice = [], [], []
+            closing = set()
+            for e in events:
+                if e["kind"] == CHECK_IN:
+                    open_refs[e["user_key"]] = e["ref"]
+                    continue
+                if e["ref"] is None:
+                    e["ref"] = open_refs.pop(e["user_key"], None) or self.sink.take_open_shift(e["user_key"])
+                if e["ref"] is None:
+                    not_found.append(e)
+                elif tuple(e["ref"]) in closing:
+                    closed_twice.append(e)
+                else:
+                    closing.add(tuple(e["ref"]))
+                    check_outs.append(e)
+            for key, ref in open_refs.items():
+                self.sink.remember_open_shift(key, ref)
+            if not_found:
+                self._set(not_found, FAILED, "Không tìm thấy lượt Check In nào chưa đóng.")
+            if closed_twice:
+                self._set(closed_twice, FAILED, "Ca này đã có lượt Check Out trước đó.")
+            if check_outs:
+                self._set(check_outs, SENDING)  # Lưu lại dòng đã chọn để lần thử lại ghi đúng ca đó
+                self.sink.write_check_outs([(e["ref"], e["ts"], e["note"]) for e in check_outs])
+                self._set(check_outs, DONE)
+
+            self.last_flushed_at = time.time()
+            return len(events)
+
+    def _purge(self):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM attendance_events WHERE status IN (?, ?) AND created_at < ?",
+                (DONE, FAILED, time.time() - self.retention),
+            )
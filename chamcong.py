@@ -1,20 +1,37 @@
+import itertools
+import os
+import re
+import threading
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import gspread
-import json
-import base64
 import pytz
+import gsheetpool
+from attendancepartition import AttendancePartitions, month_of, previous_month
+from attendancequeue import AttendanceQueue, match_check_ins, user_key, CHECK_IN, CHECK_OUT, PENDING, SENDING, FAILED
 
 # --- 1. KẾT NỐI ---
+@st.cache_resource(show_spinner=False)
+def get_partitions(_creds, sheet_id, worksheet_name):
+    """Nhật ký chấm công phân vùng theo tháng: Worksheet '<tên gốc>_YYYY-MM' (xem attendancepartition.py)."""
+    return AttendancePartitions(
+        _creds, sheet_id, worksheet_name,
+        archive_dir=st.secrets.get(
+            "attendance_archive_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), "attendance_archive")
+        ),
+        mirror_path=st.secrets.get("sqlite_mirror_path"),  # Tùy chọn: đọc/ghi qua bản sao SQLite
+        keep_months=int(st.secrets.get("attendance_keep_months", 2)),
+        drop_archived=bool(st.secrets.get("attendance_drop_archived", False)),
+    )
+
+
 try:
     SHEET_ID = st.secrets["sheet_id"] 
     WORKSHEET_NAME = st.secrets["worksheet_name"]
     BASE64_CREDS = st.secrets["base64_service_account"] 
-    decoded_json_bytes = base64.b64decode(BASE64_CREDS)
-    CREDS_DICT = json.loads(decoded_json_bytes.decode('utf-8')) 
-    CLIENT = gspread.service_account_from_dict(CREDS_DICT)
-    SHEET = CLIENT.open_by_key(SHEET_ID).worksheet(WORKSHEET_NAME)
+    # Client và Worksheet lấy từ kho kết nối dùng chung: không xác thực lại mỗi lần rerun
+    CREDS_DICT = gsheetpool.decode_credentials(BASE64_CREDS)
+    PARTITIONS = get_partitions(CREDS_DICT, SHEET_ID, WORKSHEET_NAME)
 except Exception as e:
     st.error(f"Lỗi cấu hình: {e}")
     st.stop()
@@ -23,56 +40,217 @@ COLUMNS = ['Số thứ tự', 'Tên người dùng', 'Thời gian Check in', 'Th
 VN_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
 
 # --- 2. HÀM XỬ LÝ CHỐNG GHI ĐÈ ---
+# Vị trí một dòng là `ref` = (tháng 'YYYY-MM' của phân vùng, số dòng); tháng None = Worksheet gốc.
 
-def append_check_in_to_sheet(user_email, now_vn):
-    # Lấy toàn bộ dữ liệu cột B (Tên người dùng) để xác định dòng cuối cùng thực sự
-    col_b_values = SHEET.col_values(2) 
-    # Dòng tiếp theo sẽ là số lượng phần tử hiện tại + 1
-    # Nếu chỉ có tiêu đề, col_b_values là 1 phần tử -> dòng tiếp theo là 2.
-    # Nếu đã có 1 người, col_b_values là 2 phần tử -> dòng tiếp theo là 3.
-    next_row = len(col_b_values) + 1
-    
-    # Tính Số thứ tự (STT) dựa trên cột A
-    col_a_values = SHEET.col_values(1)
-    stt_nums = [int(x) for x in col_a_values[1:] if str(x).isdigit()]
-    new_stt = max(stt_nums) + 1 if stt_nums else 1
-    
-    new_row = [
-        new_stt, 
-        str(user_email).strip(), 
-        now_vn.strftime('%Y-%m-%d %H:%M:%S'), 
-        "", "", "Chờ duyệt", ""
-    ]
-    
-    # Ghi dữ liệu vào dải ô chính xác (A{next_row} đến G{next_row})
-    # Việc chỉ định rõ dải ô sẽ ngăn Google Sheets ghi đè lên dòng cũ
-    SHEET.update(f"A{next_row}:G{next_row}", [new_row], value_input_option='USER_ENTERED')
-    return True
-
-def update_check_out_in_sheet(user_email, now_vn, note_content):
-    if not note_content or str(note_content).strip() == "":
-        return "EMPTY_NOTE"
-
-    # Lấy dữ liệu tươi để tìm dòng
-    all_rows = SHEET.get_all_values()
-    target_row_idx = -1
-    clean_user = str(user_email).strip().lower()
-
-    # Quét ngược từ dưới lên để tìm đúng dòng của user chưa check-out
-    for i in range(len(all_rows) - 1, 0, -1):
-        row = all_rows[i]
-        if len(row) > 1 and row[1].strip().lower() == clean_user:
-            # Kiểm tra cột D (index 3) có trống không
-            if len(row) <= 3 or row[3].strip() == "":
-                target_row_idx = i + 1
+@st.cache_resource(show_spinner=False)
+def _stt_counter(part):
+    """Số thứ tự dự kiến cho lượt check-in tiếp theo của phân vùng, dùng chung cho mọi phiên."""
+    return {"next_stt": None, "lock": threading.Lock()}
+
+
+def _appended_row_number(append_response):
+    """Lấy số dòng từ updatedRange (VD: 'Sheet1!A125:G125' -> 125)."""
+    updated_range = append_response["updates"]["updatedRange"]
+    return int(re.search(r"![A-Z]+(\d+)", updated_range).group(1))
+
+
+# Chỉ mục ca đang mở: người dùng (chuẩn hóa) -> ref của lượt check-in gần nhất chưa có giờ check-out.
+# Dựng từ Sheet khi khởi động lạnh hoặc khi không tìm thấy ca (VD: check-in từ tiến trình khác);
+# sau đó được check-in/check-out cập nhật trực tiếp.
+@st.cache_resource(show_spinner=False)
+def _open_shifts():
+    return {"rows": None, "lock": threading.Lock()}
+
+
+def _rebuild_open_shifts(index):
+    """
+    Đọc cột B:D (Tên, Check in, Check out) của tháng trước và tháng này (ca qua đêm cuối tháng),
+    cùng Worksheet gốc nếu nó còn dữ liệu của hai tháng đó; ca mở sau cùng của mỗi người được giữ lại.
+    """
+    current = month_of(datetime.now(VN_TZ))
+    months = [previous_month(current), current]
+    parts = [None] if PARTITIONS.legacy_months() & set(months) else []
+    parts += months
+
+    refs = {}
+    for part in parts:
+        ws = PARTITIONS.worksheet(part)
+        if ws is None:
+            continue
+        for offset, values in enumerate(ws.get("B2:D")):
+            if values and values[0].strip() and (len(values) < 3 or values[2].strip() == ""):
+                refs[user_key(values[0])] = (part, offset + 2)
+    index["rows"] = refs
+
+
+def _remember_open_shift(key, ref):
+    index = _open_shifts()
+    with index["lock"]:
+        if index["rows"] is not None:
+            index["rows"][key] = ref
+
+
+def _open_shift_row(key, take=False):
+    """Ref của ca đang mở (take=True: gỡ luôn khỏi chỉ mục); dựng lại chỉ mục một lần nếu không thấy."""
+    index = _open_shifts()
+    with index["lock"]:
+        rebuilt = index["rows"] is None
+        if rebuilt:
+            _rebuild_open_shifts(index)
+        if key not in index["rows"] and not rebuilt:
+            _rebuild_open_shifts(index)
+        return index["rows"].pop(key, None) if take else index["rows"].get(key)
+
+
+# Dòng cuối có dữ liệu của từng phân vùng (ước lượng): để đọc phần đuôi mà không tải cả cột
+@st.cache_resource(show_spinner=False)
+def _last_row_hint(part):
+    return {"row": None, "lock": threading.Lock()}
+
+
+def _note_last_row(part, row):
+    hint = _last_row_hint(part)
+    with hint["lock"]:
+        hint["row"] = max(hint["row"] or 1, row)
+
+
+def _filled(cell):
+    return bool(cell and cell[0] and str(cell[0][0]).strip())
+
+
+def _probe_last_row(ws):
+    """
+    Tìm dòng cuối có dữ liệu ở cột B bằng vài lần batch_get các ô rời (không đọc cả cột):
+    dò theo lũy thừa 2 để khoanh vùng, rồi chia vùng thành 64 phần cho tới khi còn đúng một dòng.
+    """
+    # lo: dòng chắc chắn có dữ liệu (1 = tiêu đề); hi: dòng chắc chắn trống (ngay sau lưới của Sheet).
+    # Không dò ngoài lưới: ô vượt quá số dòng của Sheet làm batch_get báo lỗi "exceeds grid limits".
+    lo, hi = 1, ws.row_count + 1
+    probes = [2 ** k for k in range(1, 22) if 2 ** k <= ws.row_count]
+    for row, cell in zip(probes, ws.batch_get([f"B{r}" for r in probes]) if probes else []):
+        if not _filled(cell):
+            hi = row
+            break
+        lo = row
+    while hi - lo > 1:
+        step = max(1, (hi - lo) // 64)
+        probes = list(range(lo + step, hi, step))
+        new_lo, new_hi = lo, hi
+        for row, cell in zip(probes, ws.batch_get([f"B{r}" for r in probes])):
+            if not _filled(cell):
+                new_hi = row
                 break
+            new_lo = row
+        lo, hi = new_lo, new_hi
+    return lo
+
 
-    if target_row_idx != -1:
-        # Cập nhật cột D (4) và E (5) bằng tọa độ chính xác
-        SHEET.update_cell(target_row_idx, 4, now_vn.strftime('%Y-%m-%d %H:%M:%S'))
-        SHEET.update_cell(target_row_idx, 5, str(note_content).strip())
-        return "SUCCESS"
-    return "NOT_FOUND"
+def append_check_ins_to_sheet(entries):
+    """
+    Ghi các lượt check-in [(người dùng, thời gian)] vào phân vùng theo tháng của thời gian
+    check-in, mỗi phân vùng một lệnh append; trả về danh sách ref tương ứng.
+    """
+    refs = []
+    for part, group in itertools.groupby(entries, key=lambda entry: month_of(entry[1])):
+        refs.extend((part, row) for row in _append_check_ins(part, list(group)))
+    return refs
+
+
+def _append_check_ins(part, entries):
+    """
+    Ghi các lượt check-in của một phân vùng bằng một lệnh append duy nhất và trả về
+    danh sách số dòng tương ứng.
+
+    Google Sheets tự cấp các dòng trống tiếp theo cho mỗi lệnh append (nguyên tử phía server),
+    nên các lượt check-in cùng lúc không thể ghi đè lên nhau. Số thứ tự = số dòng - 1,
+    lấy từ dòng thực sự được cấp; giá trị ghi kèm là dự đoán từ bộ đếm đã cache, nếu lệch
+    (hoặc lần đầu sau khi khởi động) thì sửa lại cột A của cả khối bằng một lệnh update.
+    Không đọc cột nào nên độ trễ không tăng theo kích thước Sheet.
+    """
+    ws = PARTITIONS.worksheet(part, create=True)
+    counter = _stt_counter(part)
+    with counter["lock"]:
+        guessed_stt = counter["next_stt"]
+        if guessed_stt is not None:
+            counter["next_stt"] += len(entries)
+
+    new_rows = [
+        [
+            "" if guessed_stt is None else guessed_stt + i,
+            str(user_email).strip(), 
+            ts, 
+            "", "", "Chờ duyệt", ""
+        ]
+        for i, (user_email, ts) in enumerate(entries)
+    ]
+    response = ws.append_rows(new_rows, value_input_option='USER_ENTERED', table_range="A1")
+    first_row = _appended_row_number(response)
+    first_stt = first_row - 1
+
+    if first_stt != guessed_stt:
+        last_row = first_row + len(entries) - 1
+        ws.update(
+            range_name=f"A{first_row}:A{last_row}",
+            values=[[first_stt + i] for i in range(len(entries))],
+        )
+        with counter["lock"]:
+            counter["next_stt"] = first_stt + len(entries)
+    _note_last_row(part, first_row + len(entries) - 1)
+    return list(range(first_row, first_row + len(entries)))
+
+
+def find_check_ins_in_sheet(entries, known_last_rows):
+    """
+    Các lượt check-in [(người dùng, thời gian)] đã có trên Sheet -> ref. Mỗi phân vùng chỉ đọc
+    cột B:C từ sau dòng cuối đã biết (`known_last_rows`: {tháng: dòng}); so khớp xem match_check_ins.
+    """
+    found = {}
+    for part in {month_of(ts) for _, ts in entries}:
+        ws = PARTITIONS.worksheet(part)
+        if ws is None:
+            continue
+        since_row = max(2, (known_last_rows.get(part) or 1) + 1)
+        rows = match_check_ins(ws, since_row, [(u, ts) for u, ts in entries if month_of(ts) == part])
+        found.update({entry: (part, row) for entry, row in rows.items()})
+    return found
+
+
+def write_check_outs_to_sheet(updates):
+    """
+    Ghi giờ check-out (cột D) và ghi chú (cột E) [(ref, thời gian, ghi chú)]: mỗi phân vùng
+    một lệnh batch_update (ca qua đêm cuối tháng được ghi vào phân vùng của lượt check-in).
+    """
+    by_part = {}
+    for (part, row), ts, note in updates:
+        by_part.setdefault(part, []).append({"range": f"D{row}:E{row}", "values": [[ts, str(note).strip()]]})
+    for part, data in by_part.items():
+        PARTITIONS.worksheet(part).batch_update(data, value_input_option='USER_ENTERED')
+
+
+class SheetAttendanceSink:
+    """Phần ghi Google Sheets của hàng đợi chấm công (xem attendancequeue.py)."""
+    append_check_ins = staticmethod(append_check_ins_to_sheet)
+    find_check_ins = staticmethod(find_check_ins_in_sheet)
+    write_check_outs = staticmethod(write_check_outs_to_sheet)
+    remember_open_shift = staticmethod(_remember_open_shift)
+
+    @staticmethod
+    def take_open_shift(key):
+        return _open_shift_row(key, take=True)
+
+
+# Hàng đợi bền (SQLite): giao diện ghi nhận ngay, luồng nền gom lô ghi lên Sheet
+ATTENDANCE_QUEUE_PATH = st.secrets.get(
+    "attendance_queue_path", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".attendance_queue.db")
+)
+
+
+@st.cache_resource(show_spinner=False)
+def get_attendance_queue():
+    return AttendanceQueue(
+        ATTENDANCE_QUEUE_PATH, SheetAttendanceSink(),
+        flush_interval=float(st.secrets.get("attendance_flush_interval", 2.0)),
+    ).start()
 
 # --- 3. GIAO DIỆN (UI) ---
 st.set_page_config(layout="wide", page_title="Chấm Công")
@@ -91,14 +269,15 @@ with st.form("main_form"):
 email_final = email_in.strip()
 st.session_state.last_mail = email_final
 now = datetime.now(VN_TZ)
+now_str = now.strftime('%Y-%m-%d %H:%M:%S')
+queue = get_attendance_queue()
 
 if btn_in:
     if not email_final:
         st.error("Vui lòng nhập tên!")
     else:
-        append_check_in_to_sheet(email_final, now)
-        st.success(f"Check In thành công!")
-        st.rerun()
+        queue.enqueue(CHECK_IN, email_final, now_str)
+        st.success(f"Check In thành công lúc {now:%H:%M:%S}!")
 
 if btn_out:
     clean_note = note_in.strip()
@@ -108,16 +287,66 @@ if btn_out:
         st.error("❌ LỖI: Bạn phải nhập ghi chú địa điểm mới được Check Out!")
         st.stop()
     else:
-        res = update_check_out_in_sheet(email_final, now, clean_note)
-        if res == "SUCCESS":
-            st.success("Check Out thành công!")
-            st.rerun()
-        else:
+        # Sự kiện chờ gửi mới nhất quyết định ca còn mở hay không (Sheet chưa kịp cập nhật)
+        pending_kind = queue.last_pending_kind(email_final)
+        if pending_kind == CHECK_OUT:
+            st.error("❌ Bạn đã Check Out ca này, lượt Check Out đang được đồng bộ.")
+        elif pending_kind != CHECK_IN and not _open_shift_row(user_key(email_final)):
             st.error("❌ Không tìm thấy lượt Check In nào chưa đóng của bạn.")
+        else:
+            queue.enqueue(CHECK_OUT, email_final, now_str, clean_note)
+            st.success(f"Check Out thành công lúc {now:%H:%M:%S}!")
+
+# Trạng thái đồng bộ các lượt chấm công gần đây của người dùng
+if email_final:
+    recent_events = queue.user_events(email_final, limit=5)
+    waiting = sum(e["status"] in (PENDING, SENDING) for e in recent_events)
+    if waiting:
+        st.caption(f"⏳ {waiting} lượt chấm công đang được đồng bộ lên hệ thống...")
+    for e in recent_events:
+        if e["status"] == FAILED:
+            label = "Check In" if e["kind"] == CHECK_IN else "Check Out"
+            st.error(f"❌ {label} lúc {e['ts']} không được ghi: {e['last_error']}")
+
+# --- 5. HIỂN THỊ: CHỈ TẢI CÁC DÒNG CUỐI ---
+RECENT_ROWS = int(st.secrets.get("recent_rows", 50))
+RECENT_TTL = int(st.secrets.get("recent_rows_ttl", 15))
+
+
+@st.cache_data(ttl=RECENT_TTL, show_spinner=False)
+def fetch_recent_rows(part, limit):
+    """
+    `limit` dòng chấm công cuối cùng của phân vùng tháng `part` (cũ -> mới) và cờ còn dữ liệu
+    cũ hơn hay không. Chỉ đọc dải A{start}:G phía cuối; dải không có điểm kết thúc nên dòng mới
+    ghi thêm sau lần ước lượng vẫn được lấy về. Kết quả được cache giữa các lần rerun.
+    """
+    ws = PARTITIONS.worksheet(part)
+    if ws is None:
+        return [], False
+    hint = _last_row_hint(part)
+    last = hint["row"] or _probe_last_row(ws)
+    start = max(2, last - limit + 1)
+    rows = ws.get(f"A{start}:G")
+    if not rows and start > 2:
+        # Ước lượng vượt quá dữ liệu thật (VD: dòng bị xóa tay): dò lại
+        last = _probe_last_row(ws)
+        start = max(2, last - limit + 1)
+        rows = ws.get(f"A{start}:G")
+    last = start + len(rows) - 1 if rows else start - 1
+    with hint["lock"]:
+        hint["row"] = last
+    rows = [(list(r) + [""] * len(COLUMNS))[:len(COLUMNS)] for r in rows[-limit:]]
+    return rows, last - len(rows) > 1
+
 
-# --- 5. HIỂN THỊ ---
 st.write("---")
-data_final = SHEET.get_all_values()
-if len(data_final) > 1:
-    df = pd.DataFrame(data_final[1:], columns=COLUMNS)
+recent_limit = st.session_state.setdefault("recent_limit", RECENT_ROWS)
+recent_rows, has_more = fetch_recent_rows(month_of(now), recent_limit)
+if recent_rows:
+    df = pd.DataFrame(recent_rows, columns=COLUMNS)
+    if st.checkbox("Chỉ hiện hôm nay", key="recent_today"):
+        df = df[df['Thời gian Check in'].str.startswith(now.strftime('%Y-%m-%d'))]
     st.dataframe(df.iloc[::-1], use_container_width=True, hide_index=True)
+    if has_more and st.button(f"⬇️ Tải thêm {RECENT_ROWS} dòng"):
+        st.session_state["recent_limit"] += RECENT_ROWS
+        st.rerun()
@@ -0,0 +1,98 @@
+"""
+Kho kết nối Google Sheets dùng chung cho toàn bộ tiến trình Streamlit.
+
+- Mỗi Service Account chỉ xác thực một lần (client gspread được giữ lại).
+  Token truy cập do google-auth tự làm mới khi hết hạn, không cần đăng nhập lại.
+- Tên Spreadsheet chỉ được tra sang ID một lần (tránh tra cứu Drive mỗi lần rerun).
+- Handle Worksheet được giữ theo (Service Account, ID Spreadsheet, tên tab).
+
+Nhờ vậy một lần rerun không tốn thêm request xác thực hay tra cứu nào.
+Mọi client đều dùng GatewayHTTPClient (sheetsgateway.py): rate limit, gộp đọc, thử lại 429.
+
+Tùy chọn `mirror_path`: trả về bản sao SQLite cục bộ của Worksheet (xem sheetmirror.py),
+đọc/ghi tức thì và đồng bộ hai chiều với Sheet ở luồng nền.
+"""
+import base64
+import json
+
+import gspread
+import streamlit as st
+
+from sheetmirror import MirroredWorksheet
+from sheetsgateway import GatewayHTTPClient, configure_limits, gateway_stats  # noqa: F401
+
+
+@st.cache_resource(show_spinner=False)
+def decode_credentials(base64_creds):
+    """Giải mã thông tin Service Account dạng base64 (chỉ làm một lần)."""
+    return json.loads(base64.b64decode(base64_creds).decode('utf-8'))
+
+
+@st.cache_resource(show_spinner=False)
+def _get_client(client_email, _creds):
+    # Hạn mức mỗi phút của Service Account, cấu hình qua secrets.toml (mặc định 60/60)
+    configure_limits(
+        reads_per_minute=st.secrets.get("sheets_reads_per_minute"),
+        writes_per_minute=st.secrets.get("sheets_writes_per_minute"),
+    )
+    return gspread.service_account_from_dict(dict(_creds), http_client=GatewayHTTPClient)
+
+
+@st.cache_resource(show_spinner=False)
+def _resolve_spreadsheet_id(client_email, spreadsheet_name, _client):
+    return _client.open(spreadsheet_name).id
+
+
+@st.cache_resource(show_spinner=False)
+def _get_worksheet(client_email, spreadsheet_id, worksheet_name, _client):
+    return _client.open_by_key(spreadsheet_id).worksheet(worksheet_name)
+
+
+@st.cache_resource(show_spinner=False)
+def _get_mirror(client_email, spreadsheet_id, worksheet_name, mirror_path, row_id_column, watch_headers, _worksheet):
+    return MirroredWorksheet(_worksheet, mirror_path, row_id_column=row_id_column,
+                             watch_headers=watch_headers).start()
+
+
+def get_client(creds):
+    """Trả về client gspread đã xác thực của Service Account `creds`."""
+    return _get_client(creds["client_email"], creds)
+
+
+def get_worksheet(creds, worksheet_name, spreadsheet_id=None, spreadsheet_name=None,
+                  mirror_path=None, row_id_column=None, watch_headers=()):
+    """
+    Trả về handle Worksheet dùng chung, mở theo `spreadsheet_id` hoặc `spreadsheet_name`.
+    Lỗi (SpreadsheetNotFound, WorksheetNotFound, APIError...) được ném ra và không bị cache.
+
+    Nếu có `mirror_path` (file SQLite) thì trả về MirroredWorksheet bọc handle đó;
+    `row_id_column` là cột ID theo quy ước (số dòng - 1) cần sửa khi số dòng append bị lệch;
+    `watch_headers` là các cột (theo tiêu đề) hay bị sửa tại chỗ, dùng để kéo về tăng dần.
+    """
+    client = get_client(creds)
+    if spreadsheet_id is None:
+        spreadsheet_id = _resolve_spreadsheet_id(creds["client_email"], spreadsheet_name, client)
+    worksheet = _get_worksheet(creds["client_email"], spreadsheet_id, worksheet_name, client)
+    if mirror_path:
+        return _get_mirror(creds["client_email"], spreadsheet_id, worksheet_name,
+                           mirror_path, row_id_column, tuple(watch_headers), worksheet)
+    return worksheet
+
+
+def reset_pool():
+    """Xóa toàn bộ client/handle đã lưu (VD: sau khi đổi quyền hoặc đổi tên tab)."""
+    _get_client.clear()
+    _resolve_spreadsheet_id.clear()
+    _get_worksheet.clear()
+    _get_mirror.clear()
+
+
+def render_gateway_stats(container=st.sidebar):
+    """Hiển thị các bộ đếm của cổng Google Sheets (requests, retries, throttled...)."""
+    stats = gateway_stats()
+    with container.expander("📊 Google Sheets API"):
+        st.caption(
+            f"Requests: **{stats['requests']}** · Retries: **{stats['retries']}** · "
+            f"Gộp đọc: **{stats['coalesced']}** · Lỗi: **{stats['errors']}**"
+        )
+        st.caption(f"Chờ do rate limit: **{stats['throttled_waits']}** lần ({stats['throttled_seconds']:.1f} s)")
@@ -0,0 +1,125 @@
+"""
+Bảng tổng hợp (rollup) số liệu đơn hàng, cập nhật tăng dần.
+
+- Dữ liệu gốc được rút gọn thành một khối đếm: (ngày tạo, dịch vụ, tình trạng) -> số đơn.
+  Mọi thống kê (theo dịch vụ, theo tình trạng, theo ngày/tuần, tỉ lệ "Mới" -> "Hoàn thành")
+  đều cộng dồn trên khối này nên rất nhỏ so với bảng đơn hàng.
+- `sync()` so sánh bảng mới với bản đã tổng hợp (vector hóa theo cột): chỉ các đơn mới,
+  đổi tình trạng/dịch vụ/ngày hoặc bị xóa mới được trừ khỏi / cộng vào khối đếm,
+  và chỉ các đơn đó mới phải phân tích lại cột thời gian.
+"""
+import threading
+
+import pandas as pd
+
+KEYS = ["day", "service", "status"]
+
+
+def _empty_cube():
+    return pd.Series(dtype="int64", index=pd.MultiIndex.from_arrays([[], [], []], names=KEYS))
+
+
+def _count(frame):
+    """Đếm số đơn theo (ngày, dịch vụ, tình trạng); giữ cả ngày không đọc được (NaT)."""
+    if frame.empty:
+        return _empty_cube()
+    return frame.groupby(KEYS, dropna=False, observed=True).size()
+
+
+class OrderRollups:
+    def __init__(self, id_field, time_field, service_field, status_field):
+        self.id_field = id_field
+        self.time_field = time_field
+        self.service_field = service_field
+        self.status_field = status_field
+        self.version = None
+        self._lock = threading.RLock()
+        # Số thứ tự -> (chuỗi thời gian gốc, ngày tạo đã phân tích, dịch vụ, tình trạng)
+        self._orders = pd.DataFrame(
+            {"time": pd.Series(dtype=object), "day": pd.Series(dtype="datetime64[ns]"),
+             "service": pd.Series(dtype=object), "status": pd.Series(dtype=object)}
+        )
+        self._cube = _empty_cube()
+
+    # --- Cập nhật ---
+    def _typed_frame(self, df):
+        frame = pd.DataFrame({
+            "time": df[self.time_field].astype(str).values,
+            "service": df[self.service_field].astype(str).values,
+            "status": df[self.status_field].astype(str).values,
+        }, index=df[self.id_field].astype(str).values)
+        return frame[~frame.index.duplicated(keep="last")]
+
+    def sync(self, df, version=None):
+        """Đồng bộ với bảng đơn hàng gốc; bỏ qua nếu `version` không đổi."""
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            current = self._typed_frame(df)
+            old = self._orders
+
+            n = len(old)
+            if n <= len(current) and old.index.equals(current.index[:n]):
+                # Trường hợp thường gặp: chỉ đổi giá trị và/hoặc thêm dòng cuối -> so sánh theo vị trí
+                diff = (old[["time", "service", "status"]].values != current.values[:n]).any(axis=1)
+                changed = old.index[diff]
+                added = current.index[n:]
+                removed = old.index[:0]
+            else:
+                common = current.index.intersection(old.index)
+                before = old.loc[common, ["time", "service", "status"]]
+                changed = common[(before.values != current.loc[common].values).any(axis=1)]
+                added = current.index.difference(old.index)
+                removed = old.index.difference(current.index)
+
+            outgoing = old.loc[changed.union(removed)]
+            incoming = current.loc[changed.union(added)].copy()
+            incoming["day"] = pd.to_datetime(incoming["time"], errors="coerce").dt.normalize()
+
+            if not outgoing.empty or not incoming.empty:
+                cube = self._cube.sub(_count(outgoing), fill_value=0).add(_count(incoming), fill_value=0)
+                self._cube = cube[cube != 0].astype("int64")
+                orders = old.drop(index=removed) if len(removed) else old.copy()
+                columns = list(orders.columns)
+                if len(changed):
+                    orders.loc[changed, columns] = incoming.loc[changed, columns]
+                orders = pd.concat([orders, incoming.loc[added, columns]])
+                # Giữ đúng thứ tự của bảng gốc để lần đồng bộ sau đi được nhánh so sánh theo vị trí
+                self._orders = orders if orders.index.equals(current.index) else orders.reindex(current.index)
+            self.version = version
+
+    # --- Truy vấn ---
+    def cube(self):
+        with self._lock:
+            return self._cube.copy()
+
+    def by(self, key):
+        """Số đơn theo 'service' hoặc 'status', nhiều nhất trước."""
+        cube = self.cube()
+        if cube.empty:
+            return pd.Series(dtype="int64")
+        return cube.groupby(level=key).sum().sort_values(ascending=False)
+
+    def timeline(self, freq="D", by="status"):
+        """Số đơn theo ngày ('D') hoặc tuần ('W'), tách cột theo `by` (để vẽ biểu đồ chồng)."""
+        cube = self.cube()
+        if cube.empty:
+            return pd.DataFrame()
+        table = cube.groupby(level=["day", by]).sum().unstack(by, fill_value=0)
+        table = table[table.index.notna()]
+        if freq == "W":
+            table = table.resample("W-MON", label="left", closed="left").sum()
+        return table
+
+    def conversion(self, start_status, done_status):
+        """Tỉ lệ đơn đã sang `done_status` trên tổng số đơn (mọi đơn đều bắt đầu ở `start_status`)."""
+        counts = self.by("status")
+        total = int(counts.sum()) if not counts.empty else 0
+        done = int(counts.get(done_status, 0))
+        still_new = int(counts.get(start_status, 0))
+        return {
+            "total": total,
+            "done": done,
+            "new": still_new,
+            "rate": done / total if total else 0.0,
+        }
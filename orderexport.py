@@ -0,0 +1,100 @@
+"""
+Xuất danh sách đơn hàng (đã lọc) ra CSV, XLSX hoặc Parquet; `export_frame()` dùng chung cho
+các bảng khác (VD: bảng công trong timesheet.py).
+
+- File được ghi thẳng xuống đĩa theo từng khối `chunk_rows` dòng: bộ lọc được áp trên
+  từng khối, không dựng toàn bộ kết quả thành một chuỗi/bảng trung gian trong bộ nhớ.
+- XLSX dùng chế độ write-only của openpyxl, Parquet dùng ParquetWriter của pyarrow
+  (mỗi khối là một row group); hai thư viện chỉ được import khi chọn định dạng tương ứng.
+- `take_file()` đọc file đã ghi một lần (cho st.download_button) rồi xóa ngay, không để
+  file tạm tồn lại trên đĩa.
+"""
+import csv
+import os
+import tempfile
+
+import pandas as pd
+
+CHUNK_ROWS = 5000
+
+
+def iter_filtered_chunks(df, mask, chunk_rows=CHUNK_ROWS):
+    """Các khối của `df` (chỉ mục đưa thành cột đầu) đã lọc theo `mask` (mảng bool cùng độ dài)."""
+    mask = pd.Series(mask).to_numpy(dtype=bool)
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows][mask[start:start + chunk_rows]]
+        if len(chunk):
+            yield chunk.reset_index()
+
+
+def _header(df):
+    return [df.index.name or "index"] + [str(c) for c in df.columns]
+
+
+def write_csv(path, df, chunks, title=None):
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(_header(df))
+        for chunk in chunks:
+            writer.writerows(chunk.itertuples(index=False, name=None))
+
+
+def write_xlsx(path, df, chunks, title="Đơn hàng"):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(_header(df))
+    for chunk in chunks:
+        for row in chunk.astype(str).itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+
+
+def write_parquet(path, df, chunks, title=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.string()) for name in _header(df)])
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk.astype(str), schema=schema, preserve_index=False))
+
+
+# Tên hiển thị -> (đuôi file, MIME, hàm ghi)
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv", write_csv),
+    "Excel (XLSX)": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_xlsx),
+    "Parquet": (".parquet", "application/vnd.apache.parquet", write_parquet),
+}
+
+
+def export_frame(df, mask, fmt, prefix, title, directory=None, chunk_rows=CHUNK_ROWS):
+    """
+    Ghi các dòng thỏa `mask` ra file tạm theo định dạng `fmt` (khóa của EXPORT_FORMATS);
+    `title` là tên trang tính khi xuất XLSX. Trả về đường dẫn file; người gọi chịu trách nhiệm
+    xóa file khi không dùng nữa.
+    """
+    suffix, _, writer = EXPORT_FORMATS[fmt]
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=directory)
+    os.close(fd)
+    try:
+        writer(path, df, iter_filtered_chunks(df, mask, chunk_rows), title=title)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def take_file(path):
+    """Nội dung (bytes) của file xuất; file bị xóa sau khi đọc, kể cả khi đọc lỗi."""
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def export_orders(df, mask, fmt, directory=None, chunk_rows=CHUNK_ROWS):
+    """Ghi các đơn thỏa `mask` ra file tạm (xem export_frame)."""
+    return export_frame(df, mask, fmt, "don_hang_", "Đơn hàng", directory=directory, chunk_rows=chunk_rows)
@@ -0,0 +1,127 @@
+"""
+Nhập hàng loạt đơn hàng từ file CSV/XLSX (VD: danh sách khách từ chiến dịch marketing).
+
+- File được đọc theo từng khối (CSV: pandas chunksize, XLSX: openpyxl read-only) nên
+  bộ nhớ không phụ thuộc vào kích thước file.
+- Kiểm tra và chuẩn hóa bằng phép toán vector hóa trên cả khối: thiếu trường, SĐT sai
+  định dạng, dịch vụ không có trong danh sách, vượt độ dài, trùng lặp trong file.
+- Dòng bị loại được trả về kèm số dòng trong file và lý do.
+"""
+import io
+
+import pandas as pd
+
+from orderindex import fold, fold_series, normalize_phone_series
+
+# Tên cột chấp nhận trong file (so khớp không dấu, không phân biệt hoa thường) -> cột chuẩn
+COLUMN_ALIASES = {
+    "name": ["Tên Khách Hàng", "Tên khách", "Họ tên", "Name"],
+    "phone": ["Số Điện Thoại", "SĐT", "Điện thoại", "Phone"],
+    "address": ["Địa Chỉ", "Địa chỉ cần sửa chữa", "Address"],
+    "service": ["Yêu Cầu Dịch Vụ", "Dịch vụ", "Service"],
+}
+REQUIRED_COLUMNS = list(COLUMN_ALIASES)
+MAX_LENGTHS = {"name": 100, "address": 200}
+PHONE_PATTERN = r"^0\d{9,10}$"
+CHUNK_ROWS = 5000
+
+
+def _canonical_columns(columns):
+    """Đổi tên cột của file sang tên chuẩn; ném ValueError nếu thiếu cột bắt buộc."""
+    lookup = {fold(alias).strip(): key for key, aliases in COLUMN_ALIASES.items() for alias in aliases}
+    renamed = {col: lookup[fold(col).strip()] for col in columns if fold(col).strip() in lookup}
+    missing = [COLUMN_ALIASES[key][0] for key in REQUIRED_COLUMNS if key not in renamed.values()]
+    if missing:
+        raise ValueError(f"File thiếu cột: {', '.join(missing)}")
+    return renamed
+
+
+def _iter_xlsx(data, chunk_rows):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(c or "").strip() for c in next(rows, ())]
+        block = []
+        for row in rows:
+            block.append(["" if c is None else str(c) for c in row[:len(header)]])
+            if len(block) >= chunk_rows:
+                yield pd.DataFrame(block, columns=header)
+                block = []
+        if block or not header:
+            yield pd.DataFrame(block, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_order_chunks(data, file_name, chunk_rows=CHUNK_ROWS):
+    """Đọc file CSV/XLSX (bytes) thành các khối DataFrame (mọi giá trị dạng chuỗi)."""
+    if file_name.lower().endswith((".xlsx", ".xlsm")):
+        yield from _iter_xlsx(data, chunk_rows)
+    else:
+        yield from pd.read_csv(
+            io.BytesIO(data), dtype=str, keep_default_na=False, encoding="utf-8-sig",
+            chunksize=chunk_rows, skipinitialspace=True,
+        )
+
+
+def validate_chunk(chunk, services, first_line):
+    """
+    Kiểm tra một khối. Trả về (hợp lệ, bị loại): hợp lệ có các cột chuẩn đã chuẩn hóa,
+    bị loại có thêm 'Dòng' (số dòng trong file, tính cả tiêu đề) và 'Lý do'.
+    """
+    renamed = _canonical_columns(chunk.columns)
+    frame = chunk.rename(columns=renamed)[REQUIRED_COLUMNS].astype(str)
+    frame = frame.apply(lambda col: col.str.strip().str.replace(r"\s+", " ", regex=True))
+    frame["phone"] = normalize_phone_series(frame["phone"])
+    frame.index = pd.RangeIndex(first_line, first_line + len(frame))
+
+    # Khớp dịch vụ không phân biệt dấu/hoa thường rồi đưa về đúng tên trong danh sách
+    service_lookup = {fold(s): s for s in services}
+    frame["service"] = fold_series(frame["service"]).map(service_lookup).fillna(frame["service"])
+
+    reasons = pd.Series("", index=frame.index)
+
+    def flag(mask, reason):
+        reasons[mask & (reasons == "")] = reason
+
+    empty = (frame[REQUIRED_COLUMNS] == "").any(axis=1)
+    flag(empty, "Thiếu thông tin bắt buộc")
+    flag(~frame["phone"].str.match(PHONE_PATTERN), "Số điện thoại không hợp lệ")
+    flag(~frame["service"].isin(services), "Yêu cầu dịch vụ không có trong danh sách")
+    for field, limit in MAX_LENGTHS.items():
+        flag(frame[field].str.len() > limit, f"'{COLUMN_ALIASES[field][0]}' dài quá {limit} ký tự")
+
+    rejected = chunk.copy()
+    rejected.index = frame.index
+    rejected.insert(0, "Lý do", reasons)
+    rejected.insert(0, "Dòng", frame.index)
+    valid = reasons == ""
+    return frame[valid], rejected[~valid]
+
+
+def read_orders(data, file_name, services, chunk_rows=CHUNK_ROWS):
+    """
+    Đọc và kiểm tra toàn bộ file. Trả về (đơn hợp lệ, dòng bị loại).
+    Đơn trùng (cùng SĐT + dịch vụ) trong file chỉ giữ lần xuất hiện đầu tiên.
+    """
+    accepted, rejected = [], []
+    line = 2  # Dòng 1 là tiêu đề
+    for chunk in iter_order_chunks(data, file_name, chunk_rows):
+        ok, bad = validate_chunk(chunk, services, line)
+        accepted.append(ok)
+        rejected.append(bad)
+        line += len(chunk)
+
+    accepted = pd.concat(accepted) if accepted else pd.DataFrame(columns=REQUIRED_COLUMNS)
+    rejected = pd.concat(rejected) if rejected else pd.DataFrame(columns=["Dòng", "Lý do"])
+
+    duplicated = accepted.duplicated(subset=["phone", "service"], keep="first")
+    if duplicated.any():
+        dupes = accepted[duplicated]
+        rejected = pd.concat([rejected, pd.DataFrame({
+            "Dòng": dupes.index, "Lý do": "Trùng đơn khác trong file (cùng SĐT và dịch vụ)",
+        }, index=dupes.index)]).sort_values("Dòng").fillna("")
+        accepted = accepted[~duplicated]
+    return accepted, rejected
@@ -0,0 +1,267 @@
+"""
+Chỉ mục toàn văn (inverted index) cho bảng đơn hàng, không phân biệt dấu tiếng Việt.
+
+- Chuẩn hóa: bỏ dấu ("Nguyễn Văn" -> "nguyen van", "đ" -> "d"), chữ thường, tách theo
+  ký tự không phải chữ/số. Số điện thoại còn được lưu thêm dạng chỉ gồm chữ số.
+- Tìm kiếm: mỗi từ trong truy vấn phải khớp (AND) với tiền tố của một token (tra bằng
+  bisect trên danh sách token đã sắp xếp) hoặc nằm bên trong token (tra bằng chỉ mục trigram).
+- Cập nhật tăng dần: `sync()` so sánh nội dung từng đơn với bản đã lập chỉ mục và chỉ
+  đánh lại chỉ mục các đơn mới/đổi (VD: đổi 'Tình trạng').
+
+`PhoneIndex`: SĐT chuẩn hóa (+84/84/0 thống nhất về 0, bỏ ký tự không phải số) -> các đơn,
+dùng để nhận diện khách cũ ngay khi nhập SĐT ở form đặt hàng.
+"""
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+import pandas as pd
+
+_TOKEN_PATTERN = r"\w+"
+_MARKS_PATTERN = "[\u0300-\u036f]"  # Dấu thanh/dấu mũ sau khi tách NFD
+_TOKEN_RE = re.compile(_TOKEN_PATTERN)
+_MARKS_RE = re.compile(_MARKS_PATTERN)
+NGRAM = 3
+
+
+def fold(text):
+    """Bỏ dấu tiếng Việt và chuyển về chữ thường."""
+    text = str(text).replace("đ", "d").replace("Đ", "D")
+    return _MARKS_RE.sub("", unicodedata.normalize("NFD", text)).lower()
+
+
+def fold_series(series):
+    """Phiên bản vector hóa của fold() cho cả một cột pandas."""
+    return (
+        series.astype(str).str.replace("đ", "d").str.replace("Đ", "D")
+        .str.normalize("NFD").str.replace(_MARKS_PATTERN, "", regex=True).str.lower()
+    )
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(fold(text))
+
+
+def _ngrams(token):
+    return {token[i:i + NGRAM] for i in range(len(token) - NGRAM + 1)}
+
+
+class OrderSearchIndex:
+    def __init__(self, fields, phone_fields=()):
+        self.fields = list(fields)
+        self.phone_fields = set(phone_fields)
+        self.version = None
+        self._lock = threading.RLock()
+        self._docs = {}        # order_id -> chuỗi gốc đã ghép (để phát hiện thay đổi)
+        self._doc_tokens = {}  # order_id -> set token
+        self._postings = {}    # token -> set order_id
+        self._grams = {}       # trigram -> set token
+        self._sorted_tokens = None
+
+    # --- Cập nhật ---
+    def _add_token(self, token, order_id):
+        posting = self._postings.get(token)
+        if posting is None:
+            posting = self._postings[token] = set()
+            for gram in _ngrams(token):
+                self._grams.setdefault(gram, set()).add(token)
+            self._sorted_tokens = None
+        posting.add(order_id)
+
+    def _drop_token(self, token, order_id):
+        posting = self._postings.get(token)
+        if posting is None:
+            return
+        posting.discard(order_id)
+        if not posting:
+            del self._postings[token]
+            for gram in _ngrams(token):
+                tokens = self._grams.get(gram)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._grams[gram]
+            self._sorted_tokens = None
+
+    def _apply(self, order_id, text, new_tokens):
+        old_tokens = self._doc_tokens.get(order_id, set())
+        for token in old_tokens - new_tokens:
+            self._drop_token(token, order_id)
+        for token in new_tokens - old_tokens:
+            self._add_token(token, order_id)
+        self._docs[order_id] = text
+        self._doc_tokens[order_id] = new_tokens
+
+    def _doc_texts(self, df):
+        texts = df[self.fields[0]].astype(str)
+        for field in self.fields[1:]:
+            texts = texts + "\x1f" + df[field].astype(str)
+        return texts
+
+    def _tokenize_frame(self, df, texts):
+        """Token của từng đơn, tính vector hóa theo cột (bỏ dấu, tách từ, SĐT chỉ còn chữ số)."""
+        token_lists = fold_series(texts).str.findall(_TOKEN_PATTERN)
+        for field in self.phone_fields:
+            digits = df[field].astype(str).str.replace(r"\D", "", regex=True)
+            token_lists = token_lists + digits.map(lambda d: [d] if d else [])
+        return token_lists
+
+    def upsert(self, order_id, values):
+        """Thêm hoặc cập nhật một đơn. `values` theo thứ tự của `fields`."""
+        self.upsert_frame(pd.DataFrame([list(values)], columns=self.fields, index=[order_id]))
+
+    def upsert_frame(self, df):
+        """Thêm hoặc cập nhật nhiều đơn (chỉ mục = Số thứ tự); đơn không đổi được bỏ qua."""
+        with self._lock:
+            texts = self._doc_texts(df)
+            changed = [self._docs.get(order_id) != text for order_id, text in zip(df.index, texts)]
+            if not any(changed):
+                return
+            df, texts = df[changed], texts[changed]
+            for order_id, text, tokens in zip(df.index, texts, self._tokenize_frame(df, texts)):
+                self._apply(order_id, text, set(tokens))
+
+    def remove(self, order_id):
+        with self._lock:
+            for token in self._doc_tokens.pop(order_id, set()):
+                self._drop_token(token, order_id)
+            self._docs.pop(order_id, None)
+
+    def sync(self, df, version=None):
+        """
+        Đồng bộ chỉ mục với DataFrame (chỉ mục = Số thứ tự, có đủ các cột `fields`).
+        Bỏ qua nếu `version` không đổi; ngược lại chỉ đánh lại chỉ mục các đơn thay đổi.
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            self.upsert_frame(df)
+            for order_id in set(self._docs) - set(df.index):
+                self.remove(order_id)
+            self._sorted_tokens = sorted(self._postings)  # Sắp xếp sẵn để truy vấn đầu tiên không phải chờ
+            self.version = version
+
+    # --- Tìm kiếm ---
+    def _match_term(self, term, within=None):
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._postings)
+        tokens = self._sorted_tokens
+
+        matched = set()
+        # Khớp tiền tố
+        i = bisect_left(tokens, term)
+        while i < len(tokens) and tokens[i].startswith(term):
+            matched.add(tokens[i])
+            i += 1
+        # Khớp chuỗi con qua trigram
+        if len(term) >= NGRAM:
+            candidates = None
+            for gram in _ngrams(term):
+                found = self._grams.get(gram, set())
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    break
+            matched.update(t for t in candidates or () if term in t)
+
+        result = set()
+        for token in matched:
+            posting = self._postings[token]
+            result |= posting if within is None else within.intersection(posting)
+        return result
+
+    def search(self, query):
+        """Trả về tập Số thứ tự khớp với mọi từ trong truy vấn (None nếu truy vấn rỗng)."""
+        terms = tokenize(query)
+        if not terms:
+            return None
+        with self._lock:
+            result = None
+            # Từ dài (chọn lọc hơn) trước; các từ sau chỉ giao với tập kết quả hiện có
+            for term in sorted(set(terms), key=len, reverse=True):
+                result = self._match_term(term, result)
+                if not result:
+                    return set()
+            return result
+
+
+# --- CHỈ MỤC SỐ ĐIỆN THOẠI (nhận diện khách cũ) ---
+def normalize_phone(phone):
+    """Chuẩn hóa SĐT: chỉ giữ chữ số, thống nhất +84/84/0084 về 0 ('+84 90-123 4567' -> '0901234567')."""
+    digits = re.sub(r"\D", "", str(phone))
+    if digits.startswith("0084"):
+        digits = "0" + digits[4:]
+    elif digits.startswith("84") and len(digits) >= 11:
+        digits = "0" + digits[2:]
+    elif len(digits) == 9 and not digits.startswith("0"):
+        digits = "0" + digits
+    return digits
+
+
+def normalize_phone_series(phones):
+    """Phiên bản vector hóa của normalize_phone() cho cả một cột."""
+    digits = phones.astype(str).str.replace(r"\D", "", regex=True)
+    digits = digits.str.replace(r"^0084", "0", regex=True)
+    digits = digits.where(~(digits.str.startswith("84") & (digits.str.len() >= 11)), "0" + digits.str[2:])
+    return digits.where(~((digits.str.len() == 9) & ~digits.str.startswith("0")), "0" + digits)
+
+
+class PhoneIndex:
+    """SĐT đã chuẩn hóa -> các đơn hàng; tra cứu O(1), cập nhật tăng dần khi bảng đổi."""
+
+    def __init__(self, phone_field, info_fields):
+        self.phone_field = phone_field
+        self.info_fields = list(info_fields)
+        self.version = None
+        self._lock = threading.RLock()
+        self._records = {}  # order_id -> (SĐT chuẩn hóa, *info_fields)
+        self._by_phone = {}  # SĐT chuẩn hóa -> set order_id
+
+    def add(self, order_id, phone, info):
+        """Thêm/cập nhật một đơn (VD: ngay sau khi ghi đơn mới); Số thứ tự lưu dạng chuỗi như khi sync."""
+        with self._lock:
+            self._set(str(order_id), (normalize_phone(phone), *info))
+
+    def _set(self, order_id, record):
+        old = self._records.get(order_id)
+        if old == record:
+            return
+        if old is not None and old[0] != record[0]:
+            self._unlink(order_id, old[0])
+        self._records[order_id] = record
+        if record[0]:
+            self._by_phone.setdefault(record[0], set()).add(order_id)
+
+    def _unlink(self, order_id, phone):
+        ids = self._by_phone.get(phone)
+        if ids is not None:
+            ids.discard(order_id)
+            if not ids:
+                del self._by_phone[phone]
+
+    def sync(self, df, version=None, id_field=None):
+        """
+        Đồng bộ với bảng đơn hàng (chỉ mục hoặc cột `id_field` = Số thứ tự, lưu dạng chuỗi);
+        bỏ qua nếu version không đổi.
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            ids = (df[id_field] if id_field else df.index.to_series()).astype(str).tolist()
+            columns = [normalize_phone_series(df[self.phone_field]).tolist()]
+            columns += [df[f].astype(str).tolist() for f in self.info_fields]
+            seen = set()
+            for order_id, record in zip(ids, zip(*columns)):
+                seen.add(order_id)
+                self._set(order_id, record)
+            for order_id in set(self._records) - seen:
+                self._unlink(order_id, self._records.pop(order_id)[0])
+            self.version = version
+
+    def lookup(self, phone):
+        """Các đơn trước đây của SĐT này: danh sách (order_id, *info_fields), mới nhất trước."""
+        key = normalize_phone(phone)
+        with self._lock:
+            ids = self._by_phone.get(key, ())
+            rows = [(order_id, *self._records[order_id][1:]) for order_id in ids]
+        return sorted(rows, key=lambda r: str(r[1]), reverse=True)
@@ -0,0 +1,104 @@
+"""
+Đồng bộ tăng dần bảng đơn hàng từ Google Sheets (dùng trong Customerinfo.py).
+
+Trạng thái đồng bộ là một dict dùng chung: header, df, row_index (Số thứ tự -> số dòng),
+version (tăng mỗi khi dữ liệu đổi). `delta_sync()` chỉ đọc dòng tiêu đề, cột 'Tình trạng'
+và các dòng từ dòng cuối đã biết trở xuống trong một lần batch_get; `full_reload()` đọc cả Sheet.
+"""
+import re
+
+import pandas as pd
+from gspread.exceptions import APIError
+from gspread.utils import rowcol_to_a1
+
+ID_FIELD = "Số thứ tự"
+STATUS_FIELD = "Tình trạng"
+
+
+def id_key(order_id):
+    """Chuẩn hóa Số thứ tự về chuỗi để so khớp (5, 5.0, ' 5' -> '5')."""
+    if isinstance(order_id, float) and order_id.is_integer():
+        order_id = int(order_id)
+    return str(order_id).strip()
+
+
+def _col_letter(col_index):
+    """Số cột (1-based) -> chữ cái cột (7 -> 'G')."""
+    return re.sub(r"\d", "", rowcol_to_a1(1, col_index))
+
+
+def _trim_row(row):
+    row = list(row)
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+def full_reload(state, ws):
+    data = ws.get_all_values()
+    header = data[0] if data else []
+    df = pd.DataFrame(data[1:], columns=header) if len(data) > 1 else pd.DataFrame()
+    state["header"] = header
+    state["df"] = df
+    state["row_index"] = (
+        dict(zip(df[ID_FIELD].map(id_key), range(2, len(df) + 2)))
+        if ID_FIELD in df.columns else {}
+    )
+    state["version"] += 1
+
+
+def delta_sync(state, ws):
+    """
+    Đồng bộ tăng dần bằng một lần batch_get: dòng tiêu đề, cột 'Tình trạng' và các dòng từ dòng
+    cuối đã biết trở xuống (dòng đó để đối chiếu Số thứ tự; đọc từ dòng ngay sau nó sẽ vượt lưới
+    khi Sheet vừa khít dữ liệu). Trả về False nếu phát hiện thay đổi cấu trúc (đổi tiêu đề,
+    xóa/chèn dòng) để gọi tải lại toàn bộ.
+    """
+    header, df = state["header"], state["df"]
+    n = len(df)
+    if n == 0 or ID_FIELD not in header or STATUS_FIELD not in header:
+        return False
+
+    id_index = header.index(ID_FIELD)
+    status_col = _col_letter(header.index(STATUS_FIELD) + 1)
+    last_col = _col_letter(len(header))
+    try:
+        remote_header, status_values, tail = ws.batch_get([
+            "1:1",
+            f"{status_col}2:{status_col}{n + 1}",
+            f"A{n + 1}:{last_col}",
+        ])
+    except APIError as e:
+        if "exceeds grid limits" in str(e):
+            return False  # Sheet bị xóa bớt dòng
+        raise
+
+    if _trim_row(remote_header[0] if remote_header else []) != _trim_row(header):
+        return False
+    last_row = tail[0] if tail else []
+    last_id = last_row[id_index] if len(last_row) > id_index else ""
+    if id_key(last_id) != id_key(df[ID_FIELD].iloc[-1]):
+        return False
+
+    changed = False
+    statuses = [r[0] if r else "" for r in status_values]
+    statuses += [""] * (n - len(statuses))
+    if statuses != df[STATUS_FIELD].tolist():
+        df = df.copy()
+        df[STATUS_FIELD] = statuses
+        changed = True
+
+    new_rows = tail[1:]
+    if new_rows:
+        width = len(header)
+        new_rows = [(list(r) + [""] * width)[:width] for r in new_rows]
+        new_df = pd.DataFrame(new_rows, columns=header)
+        df = pd.concat([df, new_df], ignore_index=True)
+        for offset, order_id in enumerate(new_df[ID_FIELD].map(id_key)):
+            state["row_index"][order_id] = n + 2 + offset
+        changed = True
+
+    if changed:
+        state["df"] = df
+        state["version"] += 1
+    return True
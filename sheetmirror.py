@@ -0,0 +1,405 @@
+"""
+Bản sao SQLite cục bộ của một Worksheet, đồng bộ hai chiều chạy nền (tùy chọn).
+
+`MirroredWorksheet` có cùng các hàm gspread mà các app đang dùng (get_all_values,
+col_values, batch_get, append_row(s), update, update_cell, batch_update...):
+
+- Đọc: trả về ngay từ SQLite, không gọi Google Sheets.
+- Ghi: áp dụng ngay vào SQLite và xếp vào hàng đợi `ops`; luồng nền đẩy lên Sheet
+  theo lô (append liên tiếp -> một append_rows, update liên tiếp -> một batch_update).
+- Kéo về: sau mỗi lần đẩy, luồng nền lấy thay đổi trên Sheet về. Có `watch_headers` thì
+  kéo tăng dần như đồng bộ đơn hàng: một batch_get dòng tiêu đề + các cột được theo dõi
+  + dòng cuối đã biết và mọi dòng phía dưới (ô ID của dòng cuối để phát hiện xóa/chèn dòng);
+  chỉ các dòng có cột theo dõi đổi mới được đọc đủ. Đổi cấu trúc, quá nhiều dòng đổi hoặc
+  không có `watch_headers` thì đọc lại toàn bộ Sheet.
+  Xung đột được giải quyết theo số dòng: dòng còn thao tác chờ đẩy giữ bản cục bộ,
+  các dòng còn lại lấy bản trên Sheet.
+- Lỗi 429/APIError chỉ làm chậm lần đồng bộ kế tiếp (backoff), người dùng vẫn làm việc bình thường.
+
+Append trả về ngay số dòng cục bộ (dòng cuối đã biết + 1), không chờ Google Sheets (kể cả
+khi cổng đang chờ hết 429). Khi luồng nền đẩy lên mà Sheet cấp dòng khác thì các update đang
+chờ được chuyển sang dòng thật, và nếu có `row_id_column` thì cột ID được sửa thành (số dòng - 1).
+"""
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from gspread.exceptions import APIError
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+
+def _grid(range_name):
+    """'Sheet1!A5:G' -> (row1, col1, row2, col2), 1-based, bao gồm hai đầu; None = không giới hạn."""
+    range_name = range_name.rsplit("!", 1)[-1]
+    g = a1_range_to_grid_range(range_name)
+    return (g.get("startRowIndex", 0) + 1, g.get("startColumnIndex", 0) + 1,
+            g.get("endRowIndex"), g.get("endColumnIndex"))
+
+
+def _trim(cells):
+    cells = list(cells)
+    while cells and cells[-1] == "":
+        cells.pop()
+    return cells
+
+
+def _cell_text(value):
+    return "" if value is None else str(value)
+
+
+def _column_letter(col):
+    return rowcol_to_a1(1, col).rstrip("0123456789")
+
+
+def _appended_start_row(response):
+    updated_range = response["updates"]["updatedRange"]
+    return int(re.search(r"![A-Z]+(\d+)", updated_range).group(1))
+
+
+class MirroredWorksheet:
+    def __init__(self, worksheet, db_path, row_id_column=None, watch_headers=(), sync_interval=5.0,
+                 max_backoff=300.0, max_changed_rows=200):
+        self.worksheet = worksheet
+        self.row_id_column = row_id_column
+        self.watch_headers = tuple(watch_headers)
+        self.max_changed_rows = max_changed_rows
+        self.sync_interval = sync_interval
+        self.max_backoff = max_backoff
+        self.key = f"{worksheet.spreadsheet_id}/{worksheet.id}"
+        self.last_error = ""
+        self.last_synced_at = 0.0
+
+        self._lock = threading.RLock()
+        self._push_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS mirror_rows ("
+            "sheet TEXT, row_num INTEGER, cells TEXT, PRIMARY KEY (sheet, row_num))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS mirror_ops ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, sheet TEXT, kind TEXT, payload TEXT)"
+        )
+
+    def __getattr__(self, name):
+        # Thuộc tính khác (title, id, spreadsheet_id...) lấy từ Worksheet gốc
+        return getattr(self.worksheet, name)
+
+    # --- Vòng đời ---
+    def start(self):
+        """Nạp dữ liệu lần đầu (nếu SQLite chưa có) rồi chạy luồng đồng bộ nền."""
+        with self._lock:
+            empty = self._db.execute(
+                "SELECT 1 FROM mirror_rows WHERE sheet = ? LIMIT 1", (self.key,)
+            ).fetchone() is None
+        if empty:
+            self.pull()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"mirror-{self.key}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM mirror_ops WHERE sheet = ?", (self.key,)
+            ).fetchone()[0]
+
+    # --- Đọc (từ SQLite) ---
+    def _rows(self, row1=1, row2=None):
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT row_num, cells FROM mirror_rows WHERE sheet = ? AND row_num >= ? AND row_num <= ?",
+                (self.key, row1, row2 if row2 is not None else 2 ** 62),
+            )
+            return {r: json.loads(c) for r, c in cur}
+
+    def _read(self, row1, col1, row2, col2):
+        rows = self._rows(row1, row2)
+        last = row2 if row2 is not None else max(rows, default=row1 - 1)
+        out = []
+        for r in range(row1, last + 1):
+            cells = rows.get(r, [])
+            out.append(_trim(cells[col1 - 1:col2] if col2 is not None else cells[col1 - 1:]))
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def get_all_values(self, *args, **kwargs):
+        values = self._read(1, 1, None, None)
+        width = max((len(r) for r in values), default=0)
+        return [r + [""] * (width - len(r)) for r in values]
+
+    def get(self, range_name=None, *args, **kwargs):
+        if range_name is None:
+            return self._read(1, 1, None, None)
+        return self._read(*_grid(range_name))
+
+    def batch_get(self, ranges, *args, **kwargs):
+        return [self._read(*_grid(r)) for r in ranges]
+
+    def row_values(self, row, *args, **kwargs):
+        rows = self._read(row, 1, row, None)
+        return rows[0] if rows else []
+
+    def col_values(self, col, *args, **kwargs):
+        return _trim(r[0] if r else "" for r in self._read(1, col, None, col))
+
+    # --- Ghi (vào SQLite + hàng đợi) ---
+    def _write_local(self, row1, col1, values):
+        for offset, new_cells in enumerate(values):
+            row_num = row1 + offset
+            found = self._db.execute(
+                "SELECT cells FROM mirror_rows WHERE sheet = ? AND row_num = ?", (self.key, row_num)
+            ).fetchone()
+            cells = json.loads(found[0]) if found else []
+            end = col1 - 1 + len(new_cells)
+            cells += [""] * (end - len(cells))
+            cells[col1 - 1:end] = [_cell_text(v) for v in new_cells]
+            self._db.execute(
+                "INSERT OR REPLACE INTO mirror_rows (sheet, row_num, cells) VALUES (?, ?, ?)",
+                (self.key, row_num, json.dumps(cells, ensure_ascii=False)),
+            )
+
+    def _queue(self, kind, payload):
+        cur = self._db.execute(
+            "INSERT INTO mirror_ops (sheet, kind, payload) VALUES (?, ?, ?)",
+            (self.key, kind, json.dumps(payload, ensure_ascii=False, default=str)),
+        )
+        self._wake.set()
+        return cur.lastrowid
+
+    def append_rows(self, values, value_input_option="RAW", **kwargs):
+        values = [list(v) for v in values]
+        with self._lock:
+            self._db.execute("BEGIN")
+            last = self._db.execute(
+                "SELECT MAX(row_num) FROM mirror_rows WHERE sheet = ?", (self.key,)
+            ).fetchone()[0] or 0
+            start = last + 1
+            self._write_local(start, 1, values)
+            self._queue("append", {"row": start, "values": values, "vio": str(value_input_option)})
+            self._db.execute("COMMIT")
+        end_col = _column_letter(max((len(v) for v in values), default=1))
+        return {"updates": {"updatedRange": f"'{self.worksheet.title}'!A{start}:{end_col}{start + len(values) - 1}"}}
+
+    def append_row(self, values, value_input_option="RAW", **kwargs):
+        return self.append_rows([values], value_input_option=value_input_option)
+
+    def batch_update(self, data, value_input_option="RAW", **kwargs):
+        data = [{"range": d["range"], "values": [list(r) for r in d["values"]]} for d in data]
+        with self._lock:
+            self._db.execute("BEGIN")
+            for d in data:
+                row1, col1, _, _ = _grid(d["range"])
+                self._write_local(row1, col1, d["values"])
+            self._queue("update", {"data": data, "vio": str(value_input_option or "RAW")})
+            self._db.execute("COMMIT")
+        return {}
+
+    def update(self, range_name=None, values=None, value_input_option="RAW", **kwargs):
+        # Hỗ trợ cả update(values, range_name) của gspread 6 lẫn update(range_name, values)
+        if not isinstance(range_name, str):
+            range_name, values = values, range_name
+        return self.batch_update([{"range": range_name, "values": values}], value_input_option=value_input_option)
+
+    def update_cell(self, row, col, value):
+        return self.update(rowcol_to_a1(row, col), [[value]])
+
+    # --- Đồng bộ với Google Sheets ---
+    def _pending_ops(self):
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT seq, kind, payload FROM mirror_ops WHERE sheet = ? ORDER BY seq", (self.key,)
+            )
+            return [(seq, kind, json.loads(payload)) for seq, kind, payload in cur]
+
+    def _done(self, seqs):
+        with self._lock:
+            self._db.executemany("DELETE FROM mirror_ops WHERE seq = ?", [(s,) for s in seqs])
+
+    def _remap_pending_updates(self, row_map):
+        """Chuyển các update đang chờ từ số dòng tạm sang số dòng thật."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            for seq, kind, payload in self._pending_ops():
+                if kind != "update":
+                    continue
+                for d in payload["data"]:
+                    row1, col1, _, _ = _grid(d["range"])
+                    if row1 in row_map:
+                        new_row = row_map[row1]
+                        d["range"] = (
+                            f"{rowcol_to_a1(new_row, col1)}:"
+                            f"{rowcol_to_a1(new_row + len(d['values']) - 1, col1 + max(len(d['values'][0]), 1) - 1)}"
+                        )
+                self._db.execute(
+                    "UPDATE mirror_ops SET payload = ? WHERE seq = ?",
+                    (json.dumps(payload, ensure_ascii=False, default=str), seq),
+                )
+            self._db.execute("COMMIT")
+
+    def push(self):
+        """
+        Đẩy hàng đợi lên Sheet: mỗi nhóm thao tác liên tiếp cùng loại là một request.
+        Trả về {seq của thao tác append: dòng đầu tiên Sheet thực sự cấp} cho các append đã đẩy.
+        """
+        with self._push_lock:
+            return self._push()
+
+    def _push(self):
+        appended = {}
+        ops = self._pending_ops()
+        while ops:
+            _, kind, payload = ops[0]
+            end = next(
+                (i for i, op in enumerate(ops) if op[1] != kind or op[2]["vio"] != payload["vio"]),
+                len(ops),
+            )
+            batch = ops[:end]
+
+            if kind == "append":
+                rows = [v for _, _, p in batch for v in p["values"]]
+                response = self.worksheet.append_rows(rows, value_input_option=payload["vio"])
+                actual = _appended_start_row(response)
+                row_map = {}
+                for seq, _, p in batch:
+                    appended[seq] = actual
+                    for offset in range(len(p["values"])):
+                        if p["row"] + offset != actual:
+                            row_map[p["row"] + offset] = actual
+                        actual += 1
+                self._done([s for s, _, _ in batch])
+                if row_map:
+                    if self.row_id_column:
+                        self.worksheet.batch_update([
+                            {"range": rowcol_to_a1(r, self.row_id_column), "values": [[r - 1]]}
+                            for r in row_map.values()
+                        ])
+                    self._remap_pending_updates(row_map)
+            else:
+                data = [d for _, _, p in batch for d in p["data"]]
+                self.worksheet.batch_update(data, value_input_option=payload["vio"])
+                self._done([s for s, _, _ in batch])
+            ops = self._pending_ops()
+        return appended
+
+    def _pinned_rows(self):
+        """Các dòng còn thao tác chờ đẩy: giữ bản cục bộ khi kéo về."""
+        pinned = set()
+        for _, kind, payload in self._pending_ops():
+            if kind == "append":
+                pinned.update(range(payload["row"], payload["row"] + len(payload["values"])))
+            else:
+                for d in payload["data"]:
+                    row1 = _grid(d["range"])[0]
+                    pinned.update(range(row1, row1 + len(d["values"])))
+        return pinned
+
+    def _store_rows(self, rows, pinned, replace=False):
+        """Ghi {số dòng: ô} vào SQLite (bỏ qua dòng bị ghim); replace=True xóa các dòng cũ không ghim trước."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            if replace:
+                self._db.execute(
+                    f"DELETE FROM mirror_rows WHERE sheet = ? AND row_num NOT IN ({','.join('?' * len(pinned))})",
+                    (self.key, *pinned),
+                )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO mirror_rows (sheet, row_num, cells) VALUES (?, ?, ?)",
+                [(self.key, i, json.dumps(_trim(r), ensure_ascii=False)) for i, r in rows.items() if i not in pinned],
+            )
+            self._db.execute("COMMIT")
+
+    def _pull_delta(self, pinned):
+        """
+        Kéo tăng dần (xem docstring của module). Trả về False nếu cần đọc lại toàn bộ:
+        chưa có dữ liệu/tiêu đề, đổi tiêu đề, dòng cuối đã biết đổi ID hoặc quá nhiều dòng đổi.
+        """
+        local = self._rows()
+        header = local.get(1, [])
+        if not self.watch_headers or not header or any(h not in header for h in self.watch_headers):
+            return False
+        n = max(local)
+        id_col = self.row_id_column or 1
+        last_col = _column_letter(len(header))
+        watch_cols = [header.index(h) + 1 for h in self.watch_headers]
+        try:
+            remote_header, tail, *watched = self.worksheet.batch_get(
+                ["1:1", f"A{n}:{last_col}"] + [f"{_column_letter(c)}2:{_column_letter(c)}{n}" for c in watch_cols]
+            )
+        except APIError as e:
+            if "exceeds grid limits" in str(e):
+                return False  # Sheet bị xóa bớt dòng
+            raise
+
+        if _trim(remote_header[0] if remote_header else []) != _trim(header):
+            return False
+        remote_last = tail[0] if tail else []
+        local_last = local.get(n, [])
+        if _cell_text(remote_last[id_col - 1] if len(remote_last) >= id_col else "") != \
+                (local_last[id_col - 1] if len(local_last) >= id_col else ""):
+            return False
+
+        changed = set()
+        for col, values in zip(watch_cols, watched):
+            values = list(values) + [[]] * (n - 1 - len(values))
+            for row_num, cell in enumerate(values, 2):
+                remote = _cell_text(cell[0]) if cell else ""
+                cells = local.get(row_num, [])
+                if remote != (cells[col - 1] if len(cells) >= col else ""):
+                    changed.add(row_num)
+        changed -= pinned
+        if len(changed) > self.max_changed_rows:
+            return False
+
+        rows = {n + offset: row for offset, row in enumerate(tail[1:], 1)}
+        if changed:
+            changed = sorted(changed)
+            fetched = self.worksheet.batch_get([f"A{r}:{last_col}{r}" for r in changed])
+            rows.update({r: (block[0] if block else []) for r, block in zip(changed, fetched)})
+        if rows:
+            self._store_rows(rows, pinned)
+        return True
+
+    def pull(self):
+        """Kéo thay đổi trên Sheet về (tăng dần nếu được); dòng còn thao tác chờ đẩy giữ bản cục bộ."""
+        with self._lock:
+            pinned = self._pinned_rows()
+        if not self._pull_delta(pinned):
+            values = self.worksheet.get_all_values()
+            self._store_rows(dict(enumerate(values, 1)), pinned, replace=True)
+        self.last_synced_at = time.time()
+
+    def sync_now(self):
+        self.push()
+        self.pull()
+
+    def _run(self):
+        backoff = 0.0
+        while not self._stop.is_set():
+            try:
+                self.sync_now()
+                self.last_error = ""
+                backoff = 0.0
+            except Exception as e:
+                # 429 / lỗi mạng: giữ nguyên hàng đợi và thử lại chậm dần
+                self.last_error = str(e)
+                backoff = min(self.max_backoff, max(self.sync_interval, backoff * 2))
+            delay = backoff + random.uniform(0, backoff / 2) if backoff else self.sync_interval
+            self._wake.wait(delay)
+            self._wake.clear()
@@ -0,0 +1,178 @@
+"""
+Cổng duy nhất cho mọi request Google Sheets (gắn vào gspread qua `http_client`).
+
+- Giới hạn tốc độ bằng token bucket theo từng Service Account, tách riêng đọc (GET)
+  và ghi, khớp với hạn mức "mỗi phút mỗi người dùng" của Sheets API.
+- Các lệnh đọc giống hệt nhau đang chạy đồng thời (cùng endpoint + params) được gộp
+  thành một request; các luồng còn lại nhận chung kết quả.
+- Lỗi 429/408/5xx được thử lại với độ trễ tăng theo cấp số nhân có jitter.
+- Bộ đếm (requests, retries, throttled_waits...) đọc qua `gateway_stats()`.
+"""
+import json
+import random
+import threading
+import time
+
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+READS_PER_MINUTE = 60
+WRITES_PER_MINUTE = 60
+MAX_RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 64.0
+
+_stats_lock = threading.Lock()
+_stats = {
+    "requests": 0,
+    "retries": 0,
+    "throttled_waits": 0,
+    "throttled_seconds": 0.0,
+    "coalesced": 0,
+    "errors": 0,
+}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def gateway_stats():
+    """Ảnh chụp các bộ đếm của cổng (dùng chung cho toàn tiến trình)."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Lấy một token, chờ nếu cần. Trả về số giây đã phải chờ."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """Sau khi bị 429: bỏ hết token để các request sau tự giãn ra."""
+        with self._lock:
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+
+
+_buckets_lock = threading.Lock()
+_buckets = {}
+
+
+def configure_limits(reads_per_minute=None, writes_per_minute=None):
+    """Đổi hạn mức mặc định (áp dụng cho các bucket tạo sau khi gọi)."""
+    global READS_PER_MINUTE, WRITES_PER_MINUTE
+    with _buckets_lock:
+        READS_PER_MINUTE = reads_per_minute or READS_PER_MINUTE
+        WRITES_PER_MINUTE = writes_per_minute or WRITES_PER_MINUTE
+        _buckets.clear()
+
+
+def _bucket(account, is_read):
+    key = (account, is_read)
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(READS_PER_MINUTE if is_read else WRITES_PER_MINUTE)
+        return _buckets[key]
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+_inflight_lock = threading.Lock()
+_inflight = {}
+
+
+def _is_retryable(code):
+    return code in (408, 429) or code >= 500
+
+
+class GatewayHTTPClient(HTTPClient):
+    """HTTPClient của gspread, mọi request đều đi qua rate limit, gộp đọc và thử lại 429."""
+
+    def _account(self):
+        auth = getattr(self, "auth", None)
+        return getattr(auth, "service_account_email", None) or "default"
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        send = lambda: self._send(method, endpoint, params, data, json, files, headers)  # noqa: E731
+        if method.lower() != "get":
+            return send()
+
+        key = (self._account(), endpoint, _params_key(params))
+        with _inflight_lock:
+            leader = key not in _inflight
+            if leader:
+                _inflight[key] = _InFlight()
+            flight = _inflight[key]
+
+        if not leader:
+            _count("coalesced")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+
+        try:
+            flight.response = send()
+            return flight.response
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+            flight.done.set()
+
+    def _send(self, method, endpoint, params, data, json, files, headers):
+        bucket = _bucket(self._account(), method.lower() == "get")
+        attempt = 0
+        while True:
+            waited = bucket.acquire()
+            if waited:
+                _count("throttled_waits")
+                _count("throttled_seconds", waited)
+            _count("requests")
+            try:
+                return super().request(method, endpoint, params=params, data=data,
+                                       json=json, files=files, headers=headers)
+            except APIError as e:
+                if not _is_retryable(e.code) or attempt >= MAX_RETRIES:
+                    _count("errors")
+                    raise
+                if e.code == 429:
+                    bucket.drain()
+                attempt += 1
+                _count("retries")
+                delay = min(MAX_DELAY, BASE_DELAY * 2 ** attempt)
+                time.sleep(delay / 2 + random.uniform(0, delay / 2))
+
+
+def _params_key(params):
+    return json.dumps(params, sort_keys=True, default=str) if params else ""
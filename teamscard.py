@@ -0,0 +1,132 @@
+"""
+Dựng Adaptive Card báo cáo đơn hàng BeniHome cho MS Teams.
+
+Dòng đơn hàng được ghép chuỗi theo kiểu vector hóa (không dùng iterrows). Nếu card
+vượt ngân sách byte (Teams giới hạn ~28 KB mỗi tin), danh sách được chia thành nhiều
+card theo nhóm 'Tình trạng', nhóm quá dài thì tách tiếp sang card sau.
+"""
+import json
+from bisect import bisect_right
+from datetime import datetime
+from itertools import accumulate
+
+CARD_BYTE_BUDGET = 24000
+CARD_TITLE = "Đơn hàng BeniHome"
+LOGO_URL = "https://benihome.com.vn/wp-content/uploads/2018/08/logo.png"
+SHEET_URL = "https://docs.google.com/spreadsheets/d/1uRtOnKX29zge_KjHmajNppWUGnqB3YStA1nh_J356Jo/edit?gid=0#gid=0"
+
+# Tên cột của bảng hiển thị -> tên cột trong card
+CARD_COLUMNS = {
+    'Số thứ tự': 'ID',
+    'Ngày tạo': 'Thời gian tạo',
+    'Tên khách': 'Tên Khách Hàng',
+    'Số điện thoại': 'Số Điện Thoại',
+    'Địa chỉ': 'Địa Chỉ',
+    'Yêu cầu dịch vụ': 'Yêu Cầu Dịch Vụ',
+    'Tình trạng': 'Tình trạng',
+}
+LINE_FIELDS = ['Tên Khách Hàng', 'Yêu Cầu Dịch Vụ', 'Địa Chỉ', 'Số Điện Thoại', 'Thời gian tạo']
+
+
+def _json_size(obj):
+    """Kích thước (byte) của obj khi gửi đi (cùng cách mã hóa với post_json)."""
+    return len(json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+
+def _text_block(text):
+    return {"type": "TextBlock", "text": text, "wrap": True, "spacing": "Small"}
+
+
+def _status_container(heading, texts):
+    return {
+        "type": "Container",
+        "items": [
+            {"type": "TextBlock", "text": heading, "weight": "Bolder", "size": "Medium", "spacing": "Medium"},
+            {"type": "Container", "items": [_text_block(t) for t in texts]},
+        ]
+    }
+
+
+def _card_shell(title, current_time, total_orders, part, parts):
+    if parts > 1:
+        title = f"{title} ({part}/{parts})"
+    return {
+        "type": "AdaptiveCard",
+        "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+        "version": "1.0",
+        "body": [
+            # Header
+            {
+                "type": "ColumnSet",
+                "columns": [
+                    {"type": "Column", "width": 3, "items": [
+                        {"type": "TextBlock", "size": "Large", "weight": "Bolder", "text": title},
+                        {"type": "TextBlock", "isSubtle": True, "spacing": "None", "text": f"Cập nhật: {current_time}"}
+                    ]},
+                    {"type": "Column", "width": "auto", "items": [
+                        {"type": "Image", "url": LOGO_URL, "size": "Medium", "altText": "BeniHome"}
+                    ], "horizontalAlignment": "Right"}
+                ]
+            },
+            # Total
+            {"type": "TextBlock", "text": f"Tổng: {total_orders} đơn", "weight": "Bolder", "spacing": "Small"}
+        ],
+        "actions": [
+            {"type": "Action.OpenUrl", "title": "Mở bảng Excel", "url": SHEET_URL}
+        ]
+    }
+
+
+def order_lines(df_json):
+    """Ghép mỗi đơn thành một dòng '#ID • Tên • Dịch vụ • ...' bằng phép cộng chuỗi vector hóa."""
+    lines = "#" + df_json['ID'].astype(str)
+    for field in LINE_FIELDS:
+        lines = lines + " • " + df_json[field].astype(str)
+    return lines
+
+
+def build_order_cards(df, byte_budget=CARD_BYTE_BUDGET, title=CARD_TITLE, current_time=None):
+    """
+    Nhóm bảng đơn hàng (chỉ mục 'Số thứ tự') theo 'Tình trạng' và trả về danh sách card,
+    mỗi card không vượt quá `byte_budget` (trừ khi một dòng đơn lẻ đã lớn hơn ngân sách).
+    """
+    df_json = df.reset_index().rename(columns=CARD_COLUMNS)
+    df_json = df_json[['ID', 'Tình trạng'] + LINE_FIELDS]
+    current_time = current_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    total_orders = len(df_json)
+
+    lines = order_lines(df_json)
+    block_overhead = _json_size(_text_block("")) + 2  # 2 byte cho ", " giữa các phần tử
+    line_sizes = (lines.str.encode("utf-8").str.len() + block_overhead).tolist()
+    lines = lines.tolist()
+
+    shell_size = _json_size(_card_shell(title, current_time, total_orders, 99, 99))
+    pages = [[]]
+    used = shell_size
+
+    groups = df_json.groupby('Tình trạng', sort=True).indices
+    for status, positions in groups.items():
+        texts = [lines[i] for i in positions]
+        cum = list(accumulate(line_sizes[i] for i in positions))
+        header_size = _json_size(_status_container(f"{status} ({len(texts)}) (tiếp)", []))
+        start = 0
+        while start < len(texts):
+            base = cum[start - 1] if start else 0
+            end = bisect_right(cum, base + byte_budget - used - header_size)
+            if end <= start:
+                if pages[-1]:
+                    pages.append([])
+                    used = shell_size
+                    continue
+                end = start + 1  # một dòng lớn hơn cả ngân sách: vẫn gửi riêng một card
+            heading = f"{status} ({len(texts)})" + (" (tiếp)" if start else "")
+            pages[-1].append(_status_container(heading, texts[start:end]))
+            used += header_size + cum[end - 1] - base
+            start = end
+
+    cards = []
+    for part, containers in enumerate(pages, 1):
+        card = _card_shell(title, current_time, total_orders, part, len(pages))
+        card["body"].extend(containers)
+        cards.append(card)
+    return cards
@@ -0,0 +1,183 @@
+"""
+Bộ lập lịch gửi báo cáo tóm tắt (digest) lên MS Teams chạy nền trong tiến trình app.
+
+- Vào các giờ cấu hình (VD: 08:00, 17:30 giờ Việt Nam), digest chỉ gồm các đơn mới tạo
+  hoặc đổi 'Tình trạng' kể từ lần gửi THÀNH CÔNG gần nhất.
+- Trạng thái đã gửi (ảnh chụp Số thứ tự -> Tình trạng) lưu trong file JSON cục bộ riêng
+  (`<state>.statuses.json`); ảnh chụp của digest đang chờ gửi nằm ở `<state>.pending.json`.
+  Ảnh chụp chỉ được chốt khi outbox báo tin đã gửi xong; gửi lỗi thì lần sau gửi lại phần đó.
+- File `state_path` chỉ chứa thông tin nhỏ (mốc giờ đã chạy, lần gửi thành công gần nhất,
+  digest đang chờ) để giao diện đọc rẻ qua `status()`. Trạng thái được nạp từ đĩa một lần
+  rồi giữ trong bộ nhớ; mỗi file chỉ được ghi lại khi phần của nó thay đổi.
+- So sánh với ảnh chụp bằng phép toán vector hóa của pandas nên digest vẫn rẻ khi lịch sử lớn.
+- Lần chạy đầu tiên (chưa có file trạng thái) chỉ lấy mốc, không gửi toàn bộ lịch sử.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from teamsoutbox import FAILED, SENT
+
+
+def _parse_times(times):
+    return sorted(datetime.strptime(t.strip(), "%H:%M").time() for t in times)
+
+
+class DigestScheduler:
+    def __init__(self, state_path, times, tz, load_orders, outbox, url, build_cards, wrap,
+                 poll_interval=30):
+        """
+        load_orders(): bảng đơn hàng dạng hiển thị (chỉ mục = Số thứ tự, có cột 'Tình trạng').
+        build_cards(df): danh sách Adaptive Card cho các đơn trong df; wrap(card): payload webhook.
+        """
+        self.state_path = state_path
+        self.times = _parse_times(times)
+        self.tz = tz
+        self.load_orders = load_orders
+        self.outbox = outbox
+        self.url = url
+        self.build_cards = build_cards
+        self.wrap = wrap
+        self.poll_interval = poll_interval
+        self.last_error = ""
+        base = os.path.splitext(state_path)[0]
+        self.statuses_path = f"{base}.statuses.json"
+        self.pending_path = f"{base}.pending.json"
+        self._meta = None              # {"last_slot", "last_sent_at", "pending": {"msg_id", "created_at"} | None}
+        self._statuses = None          # Ảnh chụp đã chốt: Số thứ tự -> Tình trạng
+        self._pending_statuses = None  # Ảnh chụp của digest đang chờ gửi
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Vòng đời ---
+    def start(self):
+        if self.times and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="teams-digest", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+                self.last_error = ""
+            except Exception as e:
+                self.last_error = str(e)
+            self._stop.wait(self.poll_interval)
+
+    # --- Trạng thái lưu trên đĩa ---
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _load(self):
+        """Nạp trạng thái từ đĩa (chỉ lần đầu). False nếu chưa có: chưa lấy mốc."""
+        if self._meta is None:
+            meta = self._read_json(self.state_path)
+            if meta is None:
+                return False
+            self._meta = meta
+            self._statuses = self._read_json(self.statuses_path) or {}
+        return True
+
+    def status(self):
+        """Mốc giờ đã chạy, lần gửi thành công gần nhất, digest đang chờ (đọc từ bộ nhớ); {} nếu chưa có."""
+        with self._lock:
+            return dict(self._meta) if self._load() else {}
+
+    # --- Lập lịch ---
+    def _due_slot(self, now, state):
+        """Mốc giờ gần nhất đã qua trong ngày mà chưa chạy (VD: '2025-06-01 17:30'), hoặc None."""
+        passed = [t for t in self.times if t <= now.time()]
+        if not passed:
+            return None
+        slot = f"{now:%Y-%m-%d} {passed[-1]:%H:%M}"
+        return slot if slot != state.get("last_slot") else None
+
+    def _settle_pending(self):
+        """Chốt ảnh chụp khi digest đang chờ đã gửi xong; bỏ nếu gửi thất bại."""
+        pending = self._meta.get("pending")
+        if not pending:
+            return
+        msg = self.outbox.status(pending["msg_id"])
+        if msg is None or msg["status"] == FAILED:
+            self._meta["pending"] = None
+            self._pending_statuses = None
+        elif msg["status"] == SENT:
+            statuses = self._pending_statuses
+            if statuses is None:  # Khởi động lại khi digest còn đang chờ
+                statuses = self._read_json(self.pending_path)
+            if os.path.exists(self.pending_path):
+                os.replace(self.pending_path, self.statuses_path)
+            if statuses is not None:
+                self._statuses = statuses
+            self._meta["last_sent_at"] = pending["created_at"]
+            self._meta["pending"] = None
+            self._pending_statuses = None
+
+    def tick(self, now=None):
+        now = now or datetime.now(self.tz)
+        with self._lock:
+            if not self._load():
+                # Lần đầu: lấy mốc hiện tại, không gửi lại toàn bộ lịch sử
+                self._statuses = self._snapshot(self.load_orders())
+                self._write_json(self.statuses_path, self._statuses)
+                self._meta = {"last_slot": self._due_slot(now, {}), "last_sent_at": None, "pending": None}
+                self._write_json(self.state_path, self._meta)
+                return None
+
+            before = dict(self._meta)
+            self._settle_pending()
+            slot = self._due_slot(now, self._meta)
+            msg_id = None
+            if slot and not self._meta.get("pending"):
+                msg_id = self._send_digest(now)
+                self._meta["last_slot"] = slot
+            if self._meta != before:
+                self._write_json(self.state_path, self._meta)
+            return msg_id
+
+    # --- Dựng digest ---
+    @staticmethod
+    def _snapshot(df):
+        return dict(zip(df.index.astype(str), df["Tình trạng"].astype(str)))
+
+    @staticmethod
+    def changed_orders(df, statuses):
+        """Các đơn mới (chưa có trong ảnh chụp) hoặc đã đổi 'Tình trạng' so với ảnh chụp."""
+        previous = pd.Series(statuses, dtype=object)
+        before = pd.Series(df.index.astype(str), index=df.index).map(previous)
+        return df[before.isna() | (before != df["Tình trạng"].astype(str))]
+
+    def _send_digest(self, now):
+        df = self.load_orders()
+        delta = self.changed_orders(df, self._statuses)
+        if delta.empty:
+            return None
+        cards = self.build_cards(delta)
+        self._pending_statuses = self._snapshot(df)
+        self._write_json(self.pending_path, self._pending_statuses)
+        msg_id = self.outbox.enqueue_parts(self.url, [self.wrap(card) for card in cards])
+        self._meta["pending"] = {"msg_id": msg_id, "created_at": now.isoformat()}
+        return msg_id
@@ -0,0 +1,201 @@
+"""
+Hàng đợi gửi webhook MS Teams chạy nền, lưu bền trên đĩa (outbox).
+
+- Mỗi tin nhắn là một file JSON trong thư mục outbox, nên khởi động lại app không mất tin.
+- Luồng nền gửi lần lượt theo thứ tự tạo; lỗi tạm thời (timeout, 408, 429, 5xx)
+  được thử lại với độ trễ tăng theo cấp số nhân có jitter.
+- Một báo cáo có thể gồm nhiều phần (nhiều card); các phần được gửi đúng thứ tự,
+  lỗi ở phần nào thì lần thử lại tiếp tục từ phần đó.
+- Báo cáo giống hệt (cùng dedup_key) đang chờ hoặc vừa gửi xong sẽ không bị gửi lặp.
+- Thư mục chỉ được quét một lần khi khởi tạo; sau đó các tin được giữ trong bộ nhớ
+  (tin đang chờ tách riêng), file chỉ được ghi khi tin thay đổi.
+
+Hàm gửi được truyền vào (`sender(url, payload) -> (status, body)`), nên có thể
+kiểm thử với một HTTP server cục bộ thay cho Power Automate.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+
+def _is_retryable(status):
+    return status >= 500 or status in (408, 429)
+
+
+class TeamsOutbox:
+    def __init__(self, directory, sender, max_attempts=8, base_delay=2.0, max_delay=300.0,
+                 dedup_window=600, retention=7 * 24 * 3600, poll_interval=1.0):
+        self.directory = directory
+        self.sender = sender
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dedup_window = dedup_window
+        self.retention = retention
+        self.poll_interval = poll_interval
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pending = {}  # id -> tin đang chờ gửi
+        self._done = {}     # id -> tin đã gửi/thất bại, giữ tới hết `retention` (tra trạng thái, chống gửi lặp)
+        for msg in self._scan():
+            (self._pending if msg["status"] == PENDING else self._done)[msg["id"]] = msg
+
+    # --- Vòng đời luồng nền ---
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="teams-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # --- API cho giao diện ---
+    def enqueue(self, url, payload, dedup_key=None):
+        """Đưa một payload vào outbox và trả về ID tin nhắn (không chờ gửi)."""
+        return self.enqueue_parts(url, [payload], dedup_key)
+
+    def enqueue_parts(self, url, payloads, dedup_key=None):
+        """Đưa một báo cáo nhiều phần vào outbox; các phần sẽ được gửi lần lượt."""
+        if dedup_key is None:
+            body = json.dumps(payloads, ensure_ascii=False, sort_keys=True)
+            dedup_key = hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+        now = time.time()
+        with self._lock:
+            for msg in list(self._pending.values()) + list(self._done.values()):
+                if msg["dedup_key"] != dedup_key:
+                    continue
+                if msg["status"] == PENDING:
+                    return msg["id"]
+                if msg["status"] == SENT and now - msg["sent_at"] < self.dedup_window:
+                    return msg["id"]
+
+            msg = {
+                "id": f"{int(now * 1000)}-{uuid.uuid4().hex[:8]}",
+                "dedup_key": dedup_key,
+                "url": url,
+                "payloads": list(payloads),
+                "next_part": 0,
+                "status": PENDING,
+                "attempts": 0,
+                "created_at": now,
+                "next_attempt": now,
+                "sent_at": None,
+                "last_status": None,
+                "last_error": "",
+            }
+            self._save(msg)
+            self._pending[msg["id"]] = msg
+
+        self._wake.set()
+        return msg["id"]
+
+    def status(self, msg_id):
+        """Trả về bản ghi của tin nhắn (dict) hoặc None nếu không còn trong outbox."""
+        if not msg_id:
+            return None
+        with self._lock:
+            msg = self._pending.get(msg_id) or self._done.get(msg_id)
+            return dict(msg) if msg is not None else None
+
+    # --- Xử lý nền ---
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.deliver_due()
+            except Exception:
+                pass
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def deliver_due(self):
+        """Gửi các tin đến hạn theo thứ tự tạo. Trả về số tin đã xử lý."""
+        now = time.time()
+        handled = 0
+        with self._lock:
+            expired = [m["id"] for m in self._done.values() if now - m["created_at"] > self.retention]
+            for msg_id in expired:
+                del self._done[msg_id]
+                self._remove(msg_id)
+            due = sorted(self._pending.values(), key=lambda m: m["created_at"])
+        for msg in due:
+            if msg["next_attempt"] > now:
+                continue
+
+            status, body = None, ""
+            while msg["next_part"] < len(msg["payloads"]):
+                status, body = self.sender(msg["url"], msg["payloads"][msg["next_part"]])
+                if status not in (200, 202):
+                    break
+                msg["next_part"] += 1
+                with self._lock:
+                    self._save(msg)
+
+            msg["attempts"] += 1
+            msg["last_status"] = status
+            if msg["next_part"] >= len(msg["payloads"]):
+                msg["status"] = SENT
+                msg["sent_at"] = time.time()
+                msg["last_error"] = ""
+            else:
+                msg["last_error"] = str(body)[:500]
+                if not _is_retryable(status) or msg["attempts"] >= self.max_attempts:
+                    msg["status"] = FAILED
+                else:
+                    msg["next_attempt"] = time.time() + self._backoff(msg["attempts"])
+            with self._lock:
+                self._save(msg)
+                if msg["status"] != PENDING:
+                    self._done[msg["id"]] = self._pending.pop(msg["id"])
+            handled += 1
+        return handled
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    # --- Lưu trữ file ---
+    def _path(self, msg_id):
+        return os.path.join(self.directory, f"{msg_id}.json")
+
+    def _load(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _scan(self):
+        names = [n for n in os.listdir(self.directory) if n.endswith(".json")]
+        msgs = (self._load(os.path.join(self.directory, n)) for n in names)
+        return [m for m in msgs if m is not None]
+
+    def _save(self, msg):
+        path = self._path(msg["id"])
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(msg, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _remove(self, msg_id):
+        try:
+            os.remove(self._path(msg_id))
+        except OSError:
+            pass
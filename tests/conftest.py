@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module nằm ở thư mục gốc của repo (không đóng gói)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
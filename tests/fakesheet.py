@@ -0,0 +1,87 @@
+"""Worksheet giả trong bộ nhớ cho các bài kiểm tra (hành vi đọc/ghi giống gspread)."""
+from gspread.exceptions import APIError
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+
+class _Response:
+    def __init__(self, code, message):
+        self.status_code = code
+        self.text = message
+        self._error = {"code": code, "message": message, "status": "INVALID_ARGUMENT"}
+
+    def json(self):
+        return {"error": self._error}
+
+
+def grid_error(title, range_name, rows):
+    return APIError(_Response(400, f"Range ('{title}'!{range_name}) exceeds grid limits. Max rows: {rows}, max columns: 26"))
+
+
+class FakeWorksheet:
+    """
+    Worksheet trong bộ nhớ, ghi lại các lời gọi đọc để kiểm tra chi phí đồng bộ.
+    `row_count` = số dòng của lưới: đọc ra ngoài lưới báo APIError "exceeds grid limits" như
+    Google Sheets; append nới lưới vừa khít dữ liệu. None = lưới không giới hạn.
+    """
+
+    spreadsheet_id = "sheet"
+    id = 0
+    title = "Orders"
+
+    def __init__(self, rows, row_count=None):
+        self.rows = [list(r) for r in rows]
+        self.row_count = row_count
+        self.calls = []
+
+    def _cell(self, r, c):
+        row = self.rows[r - 1] if r - 1 < len(self.rows) else []
+        return row[c - 1] if c - 1 < len(row) else ""
+
+    def _read(self, range_name):
+        g = a1_range_to_grid_range(range_name)
+        r1, c1 = g.get("startRowIndex", 0) + 1, g.get("startColumnIndex", 0) + 1
+        if self.row_count is not None and max(r1, g.get("endRowIndex", 0)) > self.row_count:
+            raise grid_error(self.title, range_name, self.row_count)
+        r2 = g.get("endRowIndex", len(self.rows))
+        c2 = g.get("endColumnIndex", max(len(r) for r in self.rows))
+        out = []
+        for r in range(r1, min(r2, len(self.rows)) + 1):
+            cells = [self._cell(r, c) for c in range(c1, c2 + 1)]
+            while cells and cells[-1] == "":
+                cells.pop()
+            out.append(cells)
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def get_all_values(self):
+        self.calls.append("get_all_values")
+        return [list(r) for r in self.rows]
+
+    def get(self, range_name, **kwargs):
+        self.calls.append(("get", range_name))
+        return self._read(range_name)
+
+    def batch_get(self, ranges, **kwargs):
+        self.calls.append(("batch_get", list(ranges)))
+        return [self._read(r) for r in ranges]
+
+    def append_rows(self, values, **kwargs):
+        self.calls.append("append_rows")
+        start = len(self.rows) + 1
+        self.rows.extend([str(v) for v in row] for row in values)
+        if self.row_count is not None:
+            self.row_count = max(self.row_count, len(self.rows))
+        end = rowcol_to_a1(start + len(values) - 1, max(len(v) for v in values))
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:{end}"}}
+
+    def batch_update(self, data, **kwargs):
+        self.calls.append("batch_update")
+        for d in data:
+            g = a1_range_to_grid_range(d["range"])
+            r1, c1 = g.get("startRowIndex", 0) + 1, g.get("startColumnIndex", 0) + 1
+            for i, values in enumerate(d["values"]):
+                row = self.rows[r1 - 1 + i]
+                for j, value in enumerate(values):
+                    row.extend([""] * (c1 + j - len(row)))
+                    row[c1 - 1 + j] = str(value)
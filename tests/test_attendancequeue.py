@@ -0,0 +1,223 @@
+from datetime import datetime
+
+import pytest
+
+from attendancequeue import CHECK_IN, CHECK_OUT, DONE, FAILED, AttendanceQueue, match_check_ins
+from fakesheet import FakeWorksheet
+
+
+class FakeSink:
+    """Sheet chấm công giả: một phân vùng theo tháng, mỗi dòng [user, check in, check out, ghi chú]."""
+
+    def __init__(self):
+        self.rows = {}
+        self.open_shifts = {}
+        self.calls = []
+        self.fail_after_append = False
+
+    def append_check_ins(self, entries):
+        self.calls.append("append")
+        refs = []
+        for user, ts in entries:
+            part = ts[:7]
+            rows = self.rows.setdefault(part, [])
+            rows.append([user, ts, "", ""])
+            refs.append((part, len(rows) + 1))
+        if self.fail_after_append:
+            self.fail_after_append = False
+            raise ConnectionError("mất kết nối sau khi đã ghi")
+        return refs
+
+    def find_check_ins(self, entries, known_last_rows):
+        wanted = set(entries)
+        return {(r[0], r[1]): (part, i + 2) for part, rows in self.rows.items()
+                for i, r in enumerate(rows) if (r[0], r[1]) in wanted}
+
+    def take_open_shift(self, key):
+        return self.open_shifts.pop(key, None)
+
+    def remember_open_shift(self, key, ref):
+        self.open_shifts[key] = ref
+
+    def write_check_outs(self, updates):
+        self.calls.append("batch_update")
+        for (part, row), ts, note in updates:
+            self.rows[part][row - 2][2:] = [ts, note]
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = AttendanceQueue(str(tmp_path / "queue.db"), FakeSink())
+    yield q
+    q.stop()
+
+
+def statuses(queue):
+    return [(e["kind"], e["status"]) for e in reversed(queue.user_events("an", limit=100))]
+
+
+def test_duplicate_event_ids_are_recorded_once(queue):
+    first = queue.enqueue(CHECK_IN, "An", "2025-06-01 08:00:00")
+    again = queue.enqueue(CHECK_IN, " an ", "2025-06-01 08:00:00")  # Bấm lặp trong cùng giây
+    assert first == again
+    assert queue.pending_count() == 1
+    assert queue.last_pending_kind("AN") == CHECK_IN
+
+    assert queue.flush() == 1
+    assert queue.sink.rows["2025-06"] == [["An", "2025-06-01 08:00:00", "", ""]]
+    assert queue.last_pending_kind("an") is None
+
+
+def test_check_out_closes_the_check_in_of_the_same_batch(queue):
+    queue.enqueue(CHECK_IN, "An", "2025-06-01 08:00:00")
+    queue.enqueue(CHECK_IN, "Bình", "2025-06-01 08:01:00")
+    queue.enqueue(CHECK_OUT, "An", "2025-06-01 17:00:00", note="Kho")
+    queue.enqueue(CHECK_IN, "An", "2025-06-01 18:00:00")  # Ca thứ hai vẫn mở
+
+    assert queue.flush() == 4
+    assert queue.sink.calls == ["append", "batch_update"]  # Một lệnh cho cả lô
+    assert queue.sink.rows["2025-06"] == [
+        ["An", "2025-06-01 08:00:00", "2025-06-01 17:00:00", "Kho"],
+        ["Bình", "2025-06-01 08:01:00", "", ""],
+        ["An", "2025-06-01 18:00:00", "", ""],
+    ]
+    assert queue.sink.open_shifts == {"an": ("2025-06", 4), "bình": ("2025-06", 3)}
+
+
+def test_check_out_in_a_later_batch_uses_the_remembered_open_shift(queue):
+    queue.enqueue(CHECK_IN, "An", "2025-06-30 22:00:00")
+    queue.flush()
+    queue.enqueue(CHECK_OUT, "An", "2025-07-01 06:00:00", note="Ca đêm")
+    queue.flush()
+
+    # Ca qua đêm cuối tháng được đóng trên phân vùng của lượt check-in
+    assert queue.sink.rows == {"2025-06": [["An", "2025-06-30 22:00:00", "2025-07-01 06:00:00", "Ca đêm"]]}
+    assert statuses(queue) == [(CHECK_IN, DONE), (CHECK_OUT, DONE)]
+
+
+def test_check_out_without_open_shift_fails(queue):
+    queue.enqueue(CHECK_OUT, "An", "2025-06-01 17:00:00")
+    queue.flush()
+    assert queue.pending_count() == 0
+    [event] = queue.user_events("an")
+    assert event["status"] == FAILED
+    assert "Check In" in event["last_error"]
+
+
+def test_uncertain_check_in_is_matched_on_sheet_instead_of_resent(queue):
+    queue.sink.fail_after_append = True
+    queue.enqueue(CHECK_IN, "An", "2025-06-01 08:00:00")
+    queue.enqueue(CHECK_OUT, "An", "2025-06-01 17:00:00")
+    with pytest.raises(ConnectionError):
+        queue.flush()
+    assert queue.pending_count() == 2
+
+    queue.flush()
+    assert queue.sink.calls == ["append", "batch_update"]
+    assert queue.sink.rows["2025-06"] == [["An", "2025-06-01 08:00:00", "2025-06-01 17:00:00", ""]]
+    assert statuses(queue) == [(CHECK_IN, DONE), (CHECK_OUT, DONE)]
+
+
+class ReopeningSink(FakeSink):
+    """Như chỉ mục thật: không thấy ca trong chỉ mục thì dựng lại từ Sheet (ca chưa có giờ ra)."""
+
+    def take_open_shift(self, key):
+        ref = self.open_shifts.pop(key, None)
+        if ref is None:
+            for part, rows in self.rows.items():
+                for i, r in enumerate(rows):
+                    if r[0].strip().lower() == key and not r[2]:
+                        ref = (part, i + 2)
+        return ref
+
+
+def test_second_check_out_of_the_same_shift_is_rejected(tmp_path):
+    queue = AttendanceQueue(str(tmp_path / "queue.db"), ReopeningSink())
+    queue.enqueue(CHECK_IN, "An", "2025-06-01 08:00:00")
+    queue.flush()
+
+    queue.enqueue(CHECK_OUT, "An", "2025-06-01 17:00:00", note="Kho")
+    assert queue.last_pending_kind("an") == CHECK_OUT  # Giao diện dựa vào đây để chặn lần bấm thứ hai
+    queue.enqueue(CHECK_OUT, "An", "2025-06-01 17:05:00", note="Văn phòng")  # Vẫn lọt vào hàng đợi
+    queue.flush()
+
+    assert queue.sink.rows["2025-06"] == [["An", "2025-06-01 08:00:00", "2025-06-01 17:00:00", "Kho"]]
+    assert statuses(queue) == [(CHECK_IN, DONE), (CHECK_OUT, DONE), (CHECK_OUT, FAILED)]
+    assert "đã có lượt Check Out" in queue.user_events("an", limit=1)[0]["last_error"]
+
+
+def sheets_format(ts):
+    """Cách Google Sheets hiển thị lại một ô ngày giờ ghi USER_ENTERED ('2025-06-01 08:00:00' -> '1/6/2025 8:00:00')."""
+    t = datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")
+    return f"{t.day}/{t.month}/{t.year} {t.hour}:{t.minute:02d}:{t.second:02d}"
+
+
+class SheetSink(FakeSink):
+    """Sink trên một Worksheet giả có lưới vừa khít dữ liệu và ô thời gian bị định dạng lại."""
+
+    def __init__(self, rows=0):
+        super().__init__()
+        self.fail_before_append = False
+        header = ["Số thứ tự", "Tên người dùng", "Thời gian Check in", "Thời gian Check out"]
+        self.ws = FakeWorksheet([header] + [[str(i), "Cũ", "2025-06-01 07:00:00", ""] for i in range(1, rows + 1)],
+                                row_count=rows + 1)
+
+    def append_check_ins(self, entries):
+        if self.fail_before_append:
+            self.fail_before_append = False
+            raise ConnectionError("mất kết nối trước khi ghi")
+        start = len(self.ws.rows) + 1
+        self.ws.append_rows([["", user, sheets_format(ts), ""] for user, ts in entries])
+        if self.fail_after_append:
+            self.fail_after_append = False
+            raise ConnectionError("mất kết nối sau khi đã ghi")
+        return [("2025-06", start + i) for i in range(len(entries))]
+
+    def find_check_ins(self, entries, known_last_rows):
+        since_row = max(2, (known_last_rows.get("2025-06") or 1) + 1)
+        return {entry: ("2025-06", row) for entry, row in match_check_ins(self.ws, since_row, entries).items()}
+
+    def write_check_outs(self, updates):
+        for (part, row), ts, note in updates:
+            self.ws.rows[row - 1][3] = sheets_format(ts)
+
+
+def test_match_check_ins_compares_times_not_strings():
+    ws = FakeWorksheet([["Số thứ tự", "Tên người dùng", "Thời gian Check in"],
+                        ["1", "An", "1/6/2025 8:00:00"], ["2", "Bình", "2025-06-01 08:00:00"]])
+    found = match_check_ins(ws, 2, [("An", "2025-06-01 08:00:00"), ("Bình", "2025-06-01 08:00:00"),
+                                    ("An", "2025-06-01 09:00:00")])
+    assert found == {("An", "2025-06-01 08:00:00"): 2, ("Bình", "2025-06-01 08:00:00"): 3}
+
+
+def test_match_check_ins_past_a_full_grid_finds_nothing():
+    ws = FakeWorksheet([["Số thứ tự", "Tên người dùng", "Thời gian Check in"], ["1", "An", "1/6/2025 8:00:00"]],
+                       row_count=2)
+    assert match_check_ins(ws, 3, [("An", "2025-06-01 08:00:00")]) == {}
+
+
+def test_uncertain_check_in_reformatted_by_sheets_is_not_appended_twice(tmp_path):
+    queue = AttendanceQueue(str(tmp_path / "queue.db"), SheetSink(rows=3))
+    queue.sink.fail_after_append = True
+    queue.enqueue(CHECK_IN, "An", "2025-06-01 08:00:00")
+    with pytest.raises(ConnectionError):
+        queue.flush()
+
+    queue.flush()
+    assert [r[1] for r in queue.sink.ws.rows[1:]] == ["Cũ", "Cũ", "Cũ", "An"]
+    assert statuses(queue) == [(CHECK_IN, DONE)]
+
+
+def test_uncertain_check_in_on_a_full_grid_does_not_block_the_queue(tmp_path):
+    queue = AttendanceQueue(str(tmp_path / "queue.db"), SheetSink(rows=3))
+    queue.enqueue(CHECK_IN, "Bình", "2025-06-01 07:30:00")
+    queue.flush()  # Biết dòng cuối = 5 (lưới vừa khít 5 dòng)
+
+    queue.sink.fail_before_append = True
+    queue.enqueue(CHECK_IN, "An", "2025-06-01 08:00:00")
+    with pytest.raises(ConnectionError):
+        queue.flush()
+
+    queue.flush()  # Đọc từ dòng 6 (ngoài lưới) = chưa có gì: gửi lại thay vì kẹt mãi
+    assert [r[1] for r in queue.sink.ws.rows[1:]] == ["Cũ", "Cũ", "Cũ", "Bình", "An"]
+    assert queue.pending_count() == 0
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from orderanalytics import OrderRollups
+
+SERVICES = ["Sửa máy lạnh", "Vệ sinh máy giặt", "Lắp đặt"]
+STATUSES = ["Mới", "Đang xử lý", "Hoàn thành"]
+
+
+def orders(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Số thứ tự": range(1, n + 1),
+        "Ngày tạo": [f"2025-06-{d:02d} 08:{m:02d}:00" for d, m in zip(rng.integers(1, 29, n), rng.integers(0, 60, n))],
+        "Yêu cầu dịch vụ": rng.choice(SERVICES, n),
+        "Tình trạng": rng.choice(STATUSES, n),
+    })
+
+
+def rollups():
+    return OrderRollups("Số thứ tự", "Ngày tạo", "Yêu cầu dịch vụ", "Tình trạng")
+
+
+def full_recompute(df):
+    fresh = rollups()
+    fresh.sync(df, version="full")
+    return fresh
+
+
+def assert_same(incremental, df):
+    expected = full_recompute(df)
+    pd.testing.assert_series_equal(incremental.cube().sort_index(), expected.cube().sort_index())
+    pd.testing.assert_series_equal(incremental.by("service").sort_index(), expected.by("service").sort_index())
+    assert incremental.conversion("Mới", "Hoàn thành") == expected.conversion("Mới", "Hoàn thành")
+
+
+def test_incremental_sync_matches_full_recompute_for_edits_and_appends():
+    df = orders(500)
+    index = rollups()
+    index.sync(df, version=1)
+    assert int(index.cube().sum()) == 500
+
+    df.loc[df.index[::7], "Tình trạng"] = "Hoàn thành"
+    df.loc[3, "Yêu cầu dịch vụ"] = "Lắp đặt"
+    df.loc[4, "Ngày tạo"] = "không rõ"  # Ngày không đọc được vẫn được đếm
+    df = pd.concat([df, orders(20, seed=1).assign(**{"Số thứ tự": range(501, 521)})], ignore_index=True)
+    index.sync(df, version=2)
+    assert_same(index, df)
+
+
+def test_incremental_sync_matches_full_recompute_after_deletes_and_reorder():
+    df = orders(300)
+    index = rollups()
+    index.sync(df, version=1)
+
+    df = df.drop(index=[0, 10, 150]).sample(frac=1, random_state=3)  # Xóa dòng + đổi thứ tự
+    df.loc[df.index[:5], "Tình trạng"] = "Đang xử lý"
+    index.sync(df, version=2)
+    assert_same(index, df)
+
+    index.sync(df.iloc[:0], version=3)
+    assert index.cube().empty
+    assert index.conversion("Mới", "Hoàn thành")["total"] == 0
@@ -0,0 +1,55 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import orderexport
+from orderexport import export_orders, take_file
+
+
+def orders(n):
+    return pd.DataFrame({
+        "Tên khách": [f"Nguyễn Văn {i}" for i in range(n)],
+        "Tình trạng": ["Mới" if i % 3 else "Hoàn thành" for i in range(n)],
+        "Ghi chú": ['có dấu phẩy, "ngoặc"' if i == 1 else "" for i in range(n)],
+    }, index=pd.Index(range(1, n + 1), name="Số thứ tự"))
+
+
+def expected(df, mask):
+    return df[mask].reset_index().astype(str)
+
+
+def test_csv_export_streams_filtered_chunks(tmp_path):
+    df = orders(23)
+    mask = (df["Tình trạng"] == "Mới").values
+    path = export_orders(df, mask, "CSV", directory=tmp_path, chunk_rows=5)
+
+    data = take_file(path)
+    assert not os.path.exists(path)  # File tạm bị xóa ngay sau khi đọc
+    back = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    pd.testing.assert_frame_equal(back, expected(df, mask))
+
+
+def test_parquet_export_round_trips(tmp_path):
+    pytest.importorskip("pyarrow")
+    df = orders(12)
+    mask = np.arange(12) % 2 == 0
+    data = take_file(export_orders(df, mask, "Parquet", directory=tmp_path, chunk_rows=4))
+
+    back = pd.read_parquet(io.BytesIO(data))
+    pd.testing.assert_frame_equal(back.astype(str), expected(df, mask))
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_export_leaves_no_temp_file(tmp_path, monkeypatch):
+    def broken_writer(path, df, chunks, title=None):
+        with open(path, "w") as f:
+            f.write("một phần")
+        raise OSError("đĩa đầy")
+
+    monkeypatch.setitem(orderexport.EXPORT_FORMATS, "CSV", (".csv", "text/csv", broken_writer))
+    with pytest.raises(OSError):
+        export_orders(orders(3), [True] * 3, "CSV", directory=tmp_path)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,41 @@
+import pytest
+
+from orderimport import read_orders
+
+SERVICES = ["Sửa máy lạnh", "Vệ sinh máy giặt"]
+
+
+def csv(*lines):
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def test_csv_rejections_report_file_line_and_reason():
+    data = csv(
+        "Tên khách,SĐT,Địa chỉ,Dịch vụ",
+        "Nguyễn Văn An,+84 901 234 567,12 Lê Lợi,sua may lanh",  # 2: hợp lệ (SĐT + dịch vụ được chuẩn hóa)
+        "Trần Thị Bình,,5 Phố Huế,Sửa máy lạnh",                 # 3: thiếu SĐT
+        "Lê Văn Cường,12345,Cần Thơ,Sửa máy lạnh",                # 4: SĐT sai
+        "Phạm Thị Dung,0912345678,Đà Nẵng,Sơn nhà",               # 5: dịch vụ lạ
+        f"{'A' * 101},0912345679,Huế,Sửa máy lạnh",               # 6: tên quá dài
+        "Nguyễn Văn An,0901234567,Chỗ khác,Sửa máy lạnh",         # 7: trùng dòng 2
+        "Nguyễn Văn An,0901234567,12 Lê Lợi,Vệ sinh máy giặt",    # 8: khác dịch vụ -> hợp lệ
+    )
+    accepted, rejected = read_orders(data, "leads.csv", SERVICES, chunk_rows=3)
+
+    assert accepted.index.tolist() == [2, 8]
+    assert accepted.loc[2, "phone"] == "0901234567"
+    assert accepted.loc[2, "service"] == "Sửa máy lạnh"
+
+    reasons = dict(zip(rejected["Dòng"], rejected["Lý do"]))
+    assert sorted(reasons) == [3, 4, 5, 6, 7]
+    assert reasons[3] == "Thiếu thông tin bắt buộc"
+    assert reasons[4] == "Số điện thoại không hợp lệ"
+    assert reasons[5] == "Yêu cầu dịch vụ không có trong danh sách"
+    assert "dài quá 100" in reasons[6]
+    assert reasons[7].startswith("Trùng đơn")
+
+
+def test_missing_required_column_is_reported():
+    data = csv("Tên khách,Địa chỉ,Dịch vụ", "An,Huế,Sửa máy lạnh")
+    with pytest.raises(ValueError, match="Số Điện Thoại"):
+        read_orders(data, "leads.csv", SERVICES)
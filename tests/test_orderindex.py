@@ -0,0 +1,82 @@
+import pandas as pd
+
+from orderindex import OrderSearchIndex, PhoneIndex, fold, fold_series, normalize_phone, normalize_phone_series, tokenize
+
+FIELDS = ["Tên khách", "Số điện thoại", "Địa chỉ", "Tình trạng"]
+
+
+def orders(rows):
+    return pd.DataFrame(rows, columns=["Số thứ tự"] + FIELDS).set_index("Số thứ tự")
+
+
+def sample():
+    return orders([
+        (1, "Nguyễn Văn An", "0901 234 567", "12 Đường Lê Lợi, Quận 1", "Mới"),
+        (2, "Trần Thị Bình", "+84 912-345-678", "5 Phố Huế, Hà Nội", "Đang xử lý"),
+        (3, "Nguyễn Thị Đào", "0987654321", "Đà Nẵng", "Hoàn thành"),
+    ])
+
+
+def test_fold_strips_vietnamese_diacritics():
+    assert fold("Nguyễn Văn ĐÀO") == "nguyen van dao"
+    assert tokenize("Trần-Thị  Bình!") == ["tran", "thi", "binh"]
+    series = pd.Series(["Đường Lê Lợi", "Phố Huế"])
+    assert fold_series(series).tolist() == [fold(s) for s in series]
+
+
+def test_search_matches_unaccented_prefixes_and_substrings():
+    index = OrderSearchIndex(FIELDS, phone_fields=["Số điện thoại"])
+    index.sync(sample(), version=1)
+    assert index.search("nguyen van") == {1}
+    assert index.search("NGUYỄN") == {1, 3}
+    assert index.search("da nang") == {3}
+    assert index.search("uye") == {1, 3}  # Chuỗi con giữa token
+    assert index.search("01234567") == {1}  # SĐT chỉ còn chữ số
+    assert index.search("nguyen binh") == set()
+    assert index.search("  ") is None
+
+
+def test_sync_reindexes_only_changed_and_removed_orders():
+    index = OrderSearchIndex(FIELDS)
+    df = sample()
+    index.sync(df, version=1)
+
+    df.loc[1, "Tình trạng"] = "Hoàn thành"
+    df = df.drop(index=3)
+    df.loc[4] = ["Lê Văn Cường", "0933000111", "Cần Thơ", "Mới"]
+    index.sync(df, version=1)  # Cùng version: bỏ qua
+    assert index.search("can tho") == set()
+
+    index.sync(df, version=2)
+    assert index.search("hoan thanh") == {1}
+    assert index.search("dao") == set()
+    assert index.search("can tho") == {4}
+    assert index.search("nguyen") == {1}
+
+
+def test_normalize_phone_folds_country_code_and_separators():
+    raw = ["+84 90-123 4567", "84901234567", "0084901234567", "901234567", "0901.234.567", "", "1900 1234"]
+    expected = ["0901234567"] * 5 + ["", "19001234"]
+    assert [normalize_phone(p) for p in raw] == expected
+    assert normalize_phone_series(pd.Series(raw)).tolist() == expected
+
+
+def test_phone_index_finds_repeat_customers_and_follows_sync():
+    df = pd.DataFrame({
+        "Số thứ tự": [1, 2, 3],
+        "Số điện thoại": ["0901234567", "+84 901 234 567", "0912345678"],
+        "Ngày tạo": ["2025-06-01", "2025-06-03", "2025-06-02"],
+    })
+    index = PhoneIndex("Số điện thoại", ["Ngày tạo"])
+    index.sync(df, version=1, id_field="Số thứ tự")
+    assert index.lookup("84901234567") == [("2", "2025-06-03"), ("1", "2025-06-01")]
+
+    index.add(4, "0901 234 567", ["2025-06-04"])  # Đơn vừa ghi: Số thứ tự dạng số
+    assert [r[0] for r in index.lookup("0901234567")] == ["4", "2", "1"]
+    index.add("4", "0901234567", ["2025-06-04"])  # Cùng đơn khi đã đồng bộ từ Sheet: không nhân đôi
+    assert [r[0] for r in index.lookup("0901234567")] == ["4", "2", "1"]
+
+    df.loc[1, "Số điện thoại"] = "0912345678"  # Đơn 2 đổi SĐT
+    index.sync(df, version=2, id_field="Số thứ tự")  # Đơn 4 không có trong bảng -> bị bỏ
+    assert index.lookup("0901234567") == [("1", "2025-06-01")]
+    assert [r[0] for r in index.lookup("0912345678")] == ["2", "3"]
@@ -0,0 +1,57 @@
+from fakesheet import FakeWorksheet
+from ordersync import delta_sync, full_reload
+
+HEADER = ["Số thứ tự", "Tên Khách Hàng", "Tình trạng"]
+
+
+def sheet(n):
+    return [HEADER] + [[str(i), f"Khách {i}", "Mới"] for i in range(1, n + 1)]
+
+
+def loaded(ws):
+    state = {"header": None, "df": None, "row_index": {}, "version": 0}
+    full_reload(state, ws)
+    ws.calls.clear()
+    return state
+
+
+def test_delta_sync_reads_status_and_new_rows_in_one_request():
+    ws = FakeWorksheet(sheet(20))
+    state = loaded(ws)
+    ws.rows[4][2] = "Hoàn thành"
+    ws.rows.append(["21", "Khách 21", "Mới"])
+
+    assert delta_sync(state, ws)
+    assert ws.calls == [("batch_get", ["1:1", "C2:C21", "A21:C"])]
+    assert state["df"].values.tolist() == [r for r in ws.rows[1:]]
+    assert state["row_index"]["21"] == 22
+    assert state["version"] == 2
+
+
+def test_delta_sync_stays_inside_a_grid_sized_to_the_data():
+    # Sheet đã vượt lưới 1000 dòng ban đầu: mỗi lần append nới lưới vừa khít dữ liệu
+    ws = FakeWorksheet(sheet(1500), row_count=1501)
+    state = loaded(ws)
+
+    assert delta_sync(state, ws)  # Không có dòng mới: không đọc ra ngoài lưới
+    assert state["version"] == 1
+
+    ws.append_rows([["1501", "Khách 1501", "Mới"]])
+    assert delta_sync(state, ws)
+    assert state["df"]["Số thứ tự"].iloc[-1] == "1501"
+    assert state["row_index"]["1501"] == 1502
+    assert "get_all_values" not in ws.calls
+
+
+def test_delta_sync_asks_for_full_reload_when_rows_were_deleted():
+    ws = FakeWorksheet(sheet(30), row_count=31)
+    state = loaded(ws)
+    del ws.rows[10:]
+    ws.row_count = 10  # Xóa dòng thu nhỏ lưới: đọc dòng cuối đã biết vượt lưới
+
+    assert delta_sync(state, ws) is False
+
+    ws = FakeWorksheet(sheet(30))
+    state = loaded(ws)
+    del ws.rows[3]  # Xóa dòng giữa bảng: Số thứ tự dòng cuối lệch
+    assert delta_sync(state, ws) is False
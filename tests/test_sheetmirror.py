@@ -0,0 +1,67 @@
+from fakesheet import FakeWorksheet
+from sheetmirror import MirroredWorksheet
+
+HEADER = ["Số thứ tự", "Tên", "Tình trạng"]
+
+
+def make_mirror(tmp_path, ws):
+    mirror = MirroredWorksheet(ws, str(tmp_path / "mirror.db"), row_id_column=1, watch_headers=("Tình trạng",))
+    mirror.pull()
+    ws.calls.clear()
+    return mirror
+
+
+def sheet(n):
+    return [HEADER] + [[str(i), f"Khách {i}", "Mới"] for i in range(1, n + 1)]
+
+
+def test_pull_without_changes_reads_only_the_change_signal(tmp_path):
+    ws = FakeWorksheet(sheet(50))
+    mirror = make_mirror(tmp_path, ws)
+
+    mirror.pull()
+
+    assert ws.calls == [("batch_get", ["1:1", "A51:C", "C2:C51"])]
+    assert mirror.get_all_values() == ws.rows
+
+
+def test_pull_fetches_only_new_and_changed_rows(tmp_path):
+    ws = FakeWorksheet(sheet(50))
+    mirror = make_mirror(tmp_path, ws)
+    ws.rows[9][2] = "Hoàn thành"
+    ws.rows[9][1] = "Khách 9 (đổi tên)"
+    ws.rows.append(["51", "Khách 51", "Mới"])
+
+    mirror.pull()
+
+    assert "get_all_values" not in ws.calls
+    assert ws.calls[-1] == ("batch_get", ["A10:C10"])
+    assert mirror.get_all_values() == ws.rows
+
+
+def test_pull_falls_back_to_full_read_when_rows_are_deleted(tmp_path):
+    ws = FakeWorksheet(sheet(50))
+    mirror = make_mirror(tmp_path, ws)
+    del ws.rows[5]
+
+    mirror.pull()
+
+    assert "get_all_values" in ws.calls
+    assert mirror.get_all_values() == ws.rows
+
+
+def test_append_returns_the_local_row_without_waiting_for_sheets(tmp_path):
+    ws = FakeWorksheet(sheet(10))
+    mirror = make_mirror(tmp_path, ws)
+    ws.rows.append(["11", "Người khác ghi xen", "Mới"])  # Mirror chưa biết dòng này
+
+    response = mirror.append_row(["11", "Khách mới", "Mới"])
+
+    assert response["updates"]["updatedRange"] == "'Orders'!A12:C12"
+    assert ws.calls == []  # Không gọi Sheets trong lúc người dùng chờ
+    assert mirror.pending_count() == 1
+
+    mirror.update("C12", [["Đang xử lý"]])
+    assert mirror.push() == {1: 13}
+    assert ws.rows[12] == ["12", "Khách mới", "Đang xử lý"]  # ID + update chuyển theo dòng thật
+    assert mirror.pending_count() == 0
@@ -0,0 +1,187 @@
+import threading
+
+import pytest
+from gspread.exceptions import APIError
+
+import sheetsgateway
+from sheetsgateway import MAX_RETRIES, GatewayHTTPClient, TokenBucket, configure_limits, gateway_stats
+
+URL = "https://sheets.googleapis.com/v4/spreadsheets/abc/values/Sheet1!A1:G"
+
+
+class FakeClock:
+    """Thay cho module time của cổng: sleep chỉ cộng dồn đồng hồ, không chờ thật."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, code, body=None):
+        self.status_code = code
+        self.ok = code < 400
+        self._body = body if body is not None else {"error": {"code": code, "message": f"HTTP {code}"}}
+        self.text = str(self._body)
+
+    def json(self):
+        return self._body
+
+
+class StubSession:
+    """Session giả: trả lần lượt các mã trong `codes` (mã cuối lặp lại); `gate` chặn request đến khi mở."""
+
+    def __init__(self, codes=(200,), gate=None):
+        self.codes = list(codes)
+        self.gate = gate
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        with self._lock:
+            self.calls.append((method, url, kwargs.get("params")))
+            code = self.codes.pop(0) if len(self.codes) > 1 else self.codes[0]
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        return Response(code, {"values": [["ok"]]} if code < 400 else None)
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sheetsgateway, "time", clock)
+    configure_limits(10 ** 6, 10 ** 6)  # Bucket mới, không bị giới hạn trừ khi test tự tạo
+    yield clock
+    configure_limits(60, 60)
+
+
+def client(session):
+    return GatewayHTTPClient(None, session=session)
+
+
+def run_concurrently(fn, n):
+    results = [None] * n
+
+    def worker(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def wait_until(condition):
+    event = threading.Event()
+    for _ in range(500):
+        if condition():
+            return
+        event.wait(0.01)
+    raise AssertionError("timeout")
+
+
+def test_identical_concurrent_gets_share_one_request():
+    gate = threading.Event()
+    session = StubSession(gate=gate)
+    http = client(session)
+    coalesced = gateway_stats()["coalesced"]
+
+    threads, results = run_concurrently(lambda: http.request("get", URL, params={"majorDimension": "ROWS"}), 5)
+    wait_until(lambda: gateway_stats()["coalesced"] - coalesced == 4)
+    gate.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(session.calls) == 1
+    assert all(r is results[0] for r in results)
+    assert results[0].json() == {"values": [["ok"]]}
+
+    http.request("get", URL, params={"majorDimension": "ROWS"})  # Request sau khi xong không dùng lại kết quả cũ
+    assert len(session.calls) == 2
+
+
+def test_followers_reraise_the_leader_error():
+    gate = threading.Event()
+    session = StubSession(codes=[404], gate=gate)
+    http = client(session)
+    coalesced = gateway_stats()["coalesced"]
+
+    threads, results = run_concurrently(lambda: http.request("get", URL), 4)
+    wait_until(lambda: gateway_stats()["coalesced"] - coalesced == 3)
+    gate.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(session.calls) == 1
+    assert all(isinstance(r, APIError) and r.code == 404 for r in results)
+
+
+def test_different_params_are_not_coalesced():
+    session = StubSession()
+    http = client(session)
+    http.request("get", URL, params={"range": "A1"})
+    http.request("get", URL, params={"range": "A2"})
+    assert len(session.calls) == 2
+
+
+def test_retryable_errors_back_off_and_then_succeed(clock):
+    session = StubSession(codes=[429, 503, 408, 200])
+    response = client(session).request("get", URL)
+
+    assert response.status_code == 200
+    assert len(session.calls) == 4
+    backoffs = [s for s in clock.sleeps if s >= sheetsgateway.BASE_DELAY]
+    assert len(backoffs) == 3
+
+
+def test_429_gives_up_after_max_retries(clock):
+    session = StubSession(codes=[429])
+    retries = gateway_stats()["retries"]
+
+    with pytest.raises(APIError) as raised:
+        client(session).request("get", URL)
+
+    assert raised.value.code == 429
+    assert len(session.calls) == 1 + MAX_RETRIES
+    assert gateway_stats()["retries"] - retries == MAX_RETRIES
+    assert all(s <= sheetsgateway.MAX_DELAY for s in clock.sleeps)
+
+
+def test_client_errors_are_not_retried():
+    session = StubSession(codes=[400])
+    with pytest.raises(APIError):
+        client(session).request("post", URL, json={"values": [[1]]})
+    assert len(session.calls) == 1
+
+
+def test_writes_are_never_coalesced():
+    gate = threading.Event()
+    session = StubSession(gate=gate)
+    http = client(session)
+
+    threads, results = run_concurrently(lambda: http.request("post", URL + ":append", json={"values": [["x"]]}), 4)
+    wait_until(lambda: len(session.calls) == 4)  # Cả 4 request cùng đến session
+    gate.set()
+    for t in threads:
+        t.join(5)
+
+    assert all(r.status_code == 200 for r in results)
+    assert len({id(r) for r in results}) == 4
+
+
+def test_token_bucket_spaces_requests_after_the_burst(clock):
+    bucket = TokenBucket(60, burst=2)
+    assert bucket.acquire() == 0 and bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(1.0)  # 60/phút -> một token mỗi giây
+    bucket.drain()
+    assert bucket.acquire() == pytest.approx(1.0)
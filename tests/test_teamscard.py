@@ -0,0 +1,55 @@
+import json
+
+import pandas as pd
+
+from teamscard import CARD_BYTE_BUDGET, build_order_cards
+
+
+def orders(n, statuses=("Mới", "Đang xử lý", "Hoàn thành"), address="Số 1 Đường Nguyễn Văn Cừ, Quận 5"):
+    return pd.DataFrame({
+        "Số thứ tự": range(1, n + 1),
+        "Ngày tạo": "2025-06-01 08:00:00",
+        "Tên khách": [f"Khách hàng Nguyễn Văn {i}" for i in range(n)],
+        "Số điện thoại": "0901234567",
+        "Địa chỉ": address,
+        "Yêu cầu dịch vụ": "Sửa máy lạnh",
+        "Tình trạng": [statuses[i % len(statuses)] for i in range(n)],
+    }).set_index("Số thứ tự")
+
+
+def size(card):
+    return len(json.dumps(card, ensure_ascii=False).encode("utf-8"))
+
+
+def card_ids(cards):
+    texts = [block["text"] for card in cards for container in card["body"][2:]
+             for block in container["items"][1]["items"]]
+    return [int(text.split(" • ")[0][1:]) for text in texts]
+
+
+def test_small_report_fits_in_one_card():
+    cards = build_order_cards(orders(5), current_time="2025-06-01 09:00:00")
+    assert len(cards) == 1
+    assert size(cards[0]) <= CARD_BYTE_BUDGET
+    assert sorted(card_ids(cards)) == [1, 2, 3, 4, 5]
+
+
+def test_large_report_is_split_under_byte_budget_without_losing_orders():
+    df = orders(1500)
+    cards = build_order_cards(df, current_time="2025-06-01 09:00:00")
+
+    assert len(cards) > 1
+    assert all(size(card) <= CARD_BYTE_BUDGET for card in cards)
+    assert sorted(card_ids(cards)) == list(df.index)
+    assert cards[0]["body"][0]["columns"][0]["items"][0]["text"].endswith(f"(1/{len(cards)})")
+
+
+def test_orders_stay_grouped_by_status():
+    cards = build_order_cards(orders(600), current_time="2025-06-01 09:00:00")
+    headings = [container["items"][0]["text"] for card in cards for container in card["body"][2:]]
+    statuses = [h.split(" (")[0] for h in headings]
+    # Mỗi tình trạng là một đoạn liên tiếp (có thể tách qua nhiều card với hậu tố "(tiếp)")
+    assert statuses == sorted(statuses)
+    for previous, status, heading in zip(statuses, statuses[1:], headings[1:]):
+        if status == previous:
+            assert heading.endswith("(tiếp)")
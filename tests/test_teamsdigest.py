@@ -0,0 +1,125 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+from teamsdigest import DigestScheduler
+from teamsoutbox import FAILED, PENDING, SENT
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.messages = {}
+
+    def enqueue_parts(self, url, payloads):
+        msg_id = f"msg-{len(self.messages) + 1}"
+        self.messages[msg_id] = {"status": PENDING, "payloads": payloads}
+        return msg_id
+
+    def status(self, msg_id):
+        msg = self.messages.get(msg_id)
+        return None if msg is None else {"status": msg["status"]}
+
+
+def at(day, hhmm):
+    return datetime.strptime(f"2025-06-{day:02d} {hhmm}", "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc)
+
+
+class Orders:
+    def __init__(self, statuses):
+        self.df = pd.DataFrame({"Tình trạng": statuses}, index=pd.Index(range(1, len(statuses) + 1), name="Số thứ tự"))
+        self.loads = 0
+
+    def __call__(self):
+        self.loads += 1
+        return self.df
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    orders = Orders(["Mới", "Mới", "Hoàn thành"])
+    outbox = FakeOutbox()
+    writes = []
+    real_write = DigestScheduler._write_json
+    monkeypatch.setattr(DigestScheduler, "_write_json",
+                        staticmethod(lambda path, data: (writes.append(path), real_write(path, data))))
+
+    def make():
+        return DigestScheduler(str(tmp_path / "digest.json"), ["08:00", "17:30"], timezone.utc, orders, outbox,
+                               url="https://hook", build_cards=lambda delta: [delta.index.tolist()],
+                               wrap=lambda card: {"ids": card})
+    return make, orders, outbox, writes
+
+
+def test_first_tick_takes_a_baseline_without_sending(setup):
+    make, orders, outbox, writes = setup
+    digest = make()
+    assert digest.tick(at(1, "09:00")) is None
+    assert outbox.messages == {}
+    assert digest.status() == {"last_slot": "2025-06-01 08:00", "last_sent_at": None, "pending": None}
+
+
+def test_digest_sends_only_changes_and_settles_when_delivered(setup):
+    make, orders, outbox, writes = setup
+    digest = make()
+    digest.tick(at(1, "09:00"))
+    orders.df.loc[1, "Tình trạng"] = "Đang xử lý"
+    orders.df.loc[4] = "Mới"
+
+    msg_id = digest.tick(at(1, "17:31"))
+    assert outbox.messages[msg_id]["payloads"] == [{"ids": [1, 4]}]
+    assert digest.status()["pending"]["msg_id"] == msg_id
+
+    writes.clear()
+    assert digest.tick(at(1, "17:32")) is None  # Đang chờ gửi: không gửi lại, không ghi file
+    assert writes == []
+
+    outbox.messages[msg_id]["status"] = SENT
+    digest.tick(at(1, "17:33"))
+    assert digest.status()["last_sent_at"] == at(1, "17:31").isoformat()
+    assert digest.status()["pending"] is None
+    assert writes == [digest.state_path]  # Ảnh chụp chỉ được chuyển file, không ghi lại
+
+    writes.clear()
+    assert digest.tick(at(2, "08:01")) is None  # Không có gì đổi từ lần gửi trước
+    assert len(outbox.messages) == 1
+    assert writes == [digest.state_path]  # Chỉ mốc giờ mới
+
+
+def test_idle_ticks_write_nothing(setup):
+    make, orders, outbox, writes = setup
+    digest = make()
+    digest.tick(at(1, "09:00"))
+    writes.clear()
+    for minute in range(10, 40):
+        digest.tick(at(1, f"09:{minute}"))
+    assert writes == []
+
+
+def test_failed_digest_is_resent_at_the_next_slot(setup):
+    make, orders, outbox, writes = setup
+    digest = make()
+    digest.tick(at(1, "09:00"))
+    orders.df.loc[2, "Tình trạng"] = "Hoàn thành"
+    first = digest.tick(at(1, "17:30"))
+    outbox.messages[first]["status"] = FAILED
+
+    digest.tick(at(1, "17:31"))
+    assert digest.status()["pending"] is None
+    assert digest.status()["last_sent_at"] is None
+
+    second = digest.tick(at(2, "08:00"))
+    assert outbox.messages[second]["payloads"] == [{"ids": [2]}]
+
+
+def test_pending_digest_settles_after_restart(setup):
+    make, orders, outbox, writes = setup
+    make().tick(at(1, "09:00"))
+    orders.df.loc[3, "Tình trạng"] = "Mới"
+    msg_id = make().tick(at(1, "17:30"))
+    outbox.messages[msg_id]["status"] = SENT
+
+    restarted = make()
+    restarted.tick(at(1, "17:35"))
+    assert restarted.status()["last_sent_at"] == at(1, "17:30").isoformat()
+    assert restarted.tick(at(2, "08:00")) is None  # Ảnh chụp mới đã được chốt từ file đang chờ
@@ -0,0 +1,154 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from teamsoutbox import FAILED, PENDING, SENT, TeamsOutbox
+
+
+class StubWebhook:
+    """Power Automate giả: trả lần lượt các mã trong `script` (hết thì 202), ghi lại payload nhận được."""
+
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.received = []
+        self.calls = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.calls += 1
+                code = stub.script.pop(0) if stub.script else 202
+                if code in (200, 202):
+                    stub.received.append(body)
+                self.send_response(code)
+                self.end_headers()
+                self.wfile.write(b"ok" if code in (200, 202) else b"busy")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/hook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def post_json(url, payload):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status, resp.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+@pytest.fixture
+def stub_factory():
+    stubs = []
+
+    def make(script=()):
+        stub = StubWebhook(script)
+        stubs.append(stub)
+        return stub
+
+    yield make
+    for stub in stubs:
+        stub.close()
+
+
+def make_outbox(tmp_path, **kwargs):
+    kwargs.setdefault("base_delay", 0.0)
+    return TeamsOutbox(str(tmp_path / "outbox"), sender=post_json, **kwargs)
+
+
+def deliver_all(outbox, rounds=10):
+    for _ in range(rounds):
+        outbox.deliver_due()
+
+
+def test_retries_on_429_and_5xx_until_delivered(tmp_path, stub_factory):
+    stub = stub_factory([429, 503, 500])
+    outbox = make_outbox(tmp_path)
+    msg_id = outbox.enqueue(stub.url, {"text": "báo cáo"})
+
+    outbox.deliver_due()
+    assert outbox.status(msg_id)["status"] == PENDING
+    assert outbox.status(msg_id)["last_status"] == 429
+    deliver_all(outbox)
+
+    msg = outbox.status(msg_id)
+    assert msg["status"] == SENT
+    assert msg["attempts"] == 4
+    assert stub.calls == 4
+    assert stub.received == [{"text": "báo cáo"}]
+
+
+def test_client_error_is_not_retried(tmp_path, stub_factory):
+    stub = stub_factory([400])
+    outbox = make_outbox(tmp_path)
+    msg_id = outbox.enqueue(stub.url, {"text": "sai"})
+    deliver_all(outbox)
+
+    assert outbox.status(msg_id)["status"] == FAILED
+    assert stub.calls == 1
+
+
+def test_identical_report_is_deduplicated(tmp_path, stub_factory):
+    stub = stub_factory()
+    outbox = make_outbox(tmp_path)
+    first = outbox.enqueue(stub.url, {"text": "trùng"})
+    assert outbox.enqueue(stub.url, {"text": "trùng"}) == first  # Đang chờ
+    deliver_all(outbox)
+    assert outbox.enqueue(stub.url, {"text": "trùng"}) == first  # Vừa gửi xong, còn trong cửa sổ chống lặp
+    deliver_all(outbox)
+
+    assert stub.received == [{"text": "trùng"}]
+    assert outbox.enqueue(stub.url, {"text": "khác"}) != first
+
+
+def test_multi_part_report_is_delivered_in_order_and_resumes_at_failed_part(tmp_path, stub_factory):
+    stub = stub_factory([202, 503])  # Phần 1 qua, phần 2 lỗi một lần
+    outbox = make_outbox(tmp_path)
+    parts = [{"part": i} for i in range(4)]
+    msg_id = outbox.enqueue_parts(stub.url, parts)
+
+    outbox.deliver_due()
+    assert outbox.status(msg_id)["next_part"] == 1
+    deliver_all(outbox)
+
+    assert outbox.status(msg_id)["status"] == SENT
+    assert stub.received == parts  # Đúng thứ tự, phần 1 không bị gửi lại
+
+
+def test_pending_messages_survive_restart(tmp_path, stub_factory):
+    stub = stub_factory()
+    msg_id = make_outbox(tmp_path).enqueue(stub.url, {"text": "còn chờ"})
+
+    restarted = make_outbox(tmp_path)
+    assert restarted.status(msg_id)["status"] == PENDING
+    deliver_all(restarted)
+    assert restarted.status(msg_id)["status"] == SENT
+    assert stub.received == [{"text": "còn chờ"}]
+
+
+def test_background_worker_delivers_without_blocking(tmp_path, stub_factory):
+    stub = stub_factory()
+    outbox = make_outbox(tmp_path, poll_interval=0.05).start()
+    try:
+        msg_id = outbox.enqueue(stub.url, {"text": "nền"})
+        for _ in range(100):
+            if outbox.status(msg_id)["status"] == SENT:
+                break
+            threading.Event().wait(0.05)
+        assert outbox.status(msg_id)["status"] == SENT
+    finally:
+        outbox.stop()
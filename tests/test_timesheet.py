@@ -0,0 +1,73 @@
+import pandas as pd
+
+from timesheet import (APPROVED, BAD_CHECK_IN, BAD_CHECK_OUT, DATE, HOURS, MISSING_CHECK_OUT, OVERLAP,
+                       Timesheet)
+
+PENDING = "Chờ duyệt"
+COLUMNS = ['Tên người dùng', 'Thời gian Check in', 'Thời gian Check out', 'Tình trạng']
+
+
+def attendance(rows):
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def sample():
+    return attendance([
+        ("an", "2025-06-02 08:00:00", "2025-06-02 12:00:00", APPROVED),  # 0
+        ("an", "2025-06-02 11:00:00", "2025-06-02 17:00:00", APPROVED),  # 1: bắt đầu trước khi ca 0 kết thúc
+        ("an", "2025-06-03 08:00:00", "", PENDING),                      # 2: ngày đã qua, thiếu giờ ra
+        ("binh", "2025-06-02 22:00:00", "2025-06-03 06:00:00", APPROVED),  # 3: ca qua đêm
+        ("binh", "2025-06-04 09:00:00", "2025-06-04 08:00:00", PENDING),   # 4: ra trước vào
+        ("binh", "không rõ", "", PENDING),                                # 5
+        ("binh", "2025-06-05 08:00:00", "2025-06-05 12:30:00", PENDING),   # 6
+        ("an", "2025-06-05 13:00:00", "", PENDING),                       # 7: hôm nay, chưa check-out
+    ])
+
+
+def synced(df):
+    sheet = Timesheet(tz="Asia/Ho_Chi_Minh")
+    sheet.sync("2025-06", df, version=1)
+    return sheet
+
+
+def test_issues_flag_overlaps_and_bad_or_missing_times():
+    issues = synced(sample()).issues("2025-06", now="2025-06-05 18:00:00")
+    flagged = dict(zip(zip(issues.index, issues[DATE], issues["Giờ vào"]), issues["Bất thường"]))
+    assert flagged == {
+        ("an", "2025-06-02", "11:00:00"): OVERLAP,
+        ("an", "2025-06-03", "08:00:00"): MISSING_CHECK_OUT,
+        ("binh", "2025-06-04", "09:00:00"): BAD_CHECK_OUT,
+        ("binh", "", ""): BAD_CHECK_IN,
+    }
+
+
+def test_back_to_back_shifts_of_different_users_do_not_overlap():
+    df = attendance([
+        ("an", "2025-06-02 08:00:00", "2025-06-02 12:00:00", APPROVED),
+        ("an", "2025-06-02 12:00:00", "2025-06-02 17:00:00", APPROVED),  # Nối tiếp, không chồng
+        ("binh", "2025-06-02 09:00:00", "2025-06-02 10:00:00", APPROVED),
+    ])
+    assert synced(df).issues("2025-06", now="2025-06-03").empty
+
+
+def test_approved_hours_by_day_and_month():
+    sheet = synced(sample())
+    daily = sheet.daily("2025-06")
+    assert daily.loc[["an"], HOURS].tolist() == [10.0]
+    assert daily.loc[["binh"], DATE].tolist() == ["2025-06-02"]  # Ca qua đêm tính cho ngày check-in
+    assert daily.loc[["binh"], HOURS].tolist() == [8.0]
+    monthly = sheet.monthly("2025-06")
+    assert monthly.loc["an", "Số ca"] == 2 and monthly.loc["an", "Số ngày công"] == 1
+
+
+def test_set_review_matches_full_recompute():
+    df = sample()
+    sheet = synced(df)
+    sheet.set_review("2025-06", [6, 2], APPROVED)
+    sheet.set_review("2025-06", [0, 99], PENDING)  # Nhãn không tồn tại được bỏ qua
+
+    df.loc[[6, 2], 'Tình trạng'] = APPROVED
+    df.loc[0, 'Tình trạng'] = PENDING
+    expected = synced(df)
+    pd.testing.assert_frame_equal(sheet.daily("2025-06"), expected.daily("2025-06"))
+    pd.testing.assert_frame_equal(sheet.monthly("2025-06"), expected.monthly("2025-06"))
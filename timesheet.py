@@ -0,0 +1,204 @@
+"""
+Bảng công: tổng giờ làm đã duyệt theo nhân viên theo ngày/tháng, kèm các ca bất thường.
+
+- Thời lượng ca = Check out - Check in, tính vector hóa trên cả tháng. Giờ trên Sheet là giờ
+  địa phương không kèm múi giờ nên được gắn múi giờ `tz` (mặc định Asia/Ho_Chi_Minh) trước khi
+  trừ; ca qua đêm được tính trọn cho ngày check-in.
+- Bất thường: thiếu check-out (ca của các ngày đã qua), giờ ra không sau giờ vào, giờ vào không
+  đọc được, hai ca của cùng một người chồng lên nhau.
+- Kết quả được cache theo phân vùng tháng (kèm version dữ liệu). Duyệt/từ chối chỉ cộng hoặc trừ
+  giờ của các ca vừa đổi vào bảng tổng theo ngày, không tính lại cả tháng.
+- `export_timesheet()` ghi báo cáo ra CSV/XLSX theo từng khối (bộ ghi của orderexport).
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from attendanceindex import CHECK_IN, CHECK_OUT, STATUS, USER, typed_frame
+from orderexport import export_frame
+
+APPROVED = "Đã duyệt ✅"
+TIMEZONE = "Asia/Ho_Chi_Minh"
+
+MISSING_CHECK_OUT = "Thiếu check-out"
+BAD_CHECK_OUT = "Giờ ra không sau giờ vào"
+BAD_CHECK_IN = "Giờ vào không đọc được"
+OVERLAP = "Trùng ca"
+
+# Tên cột trong báo cáo
+EMPLOYEE = "Nhân viên"
+DATE = "Ngày"
+MONTH = "Tháng"
+HOURS = "Số giờ"
+SHIFTS = "Số ca"
+DAYS = "Số ngày công"
+
+
+def _localize(times, tz):
+    if times.dt.tz is None:
+        return times.dt.tz_localize(tz, ambiguous="NaT", nonexistent="shift_forward")
+    return times.dt.tz_convert(tz)
+
+
+def shift_frame(frame, tz=TIMEZONE, approved_status=APPROVED):
+    """
+    Mỗi dòng chấm công -> một ca: nhân viên, ngày (theo giờ địa phương), giờ vào/ra có múi giờ,
+    số giờ (0 nếu thiếu/sai giờ ra), đã duyệt hay chưa và lỗi dữ liệu (nếu có). Giữ chỉ mục dòng.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(frame[CHECK_IN]):
+        frame = typed_frame(frame)
+    start = _localize(frame[CHECK_IN], tz)
+    end = _localize(frame[CHECK_OUT], tz)
+    hours = (end - start).dt.total_seconds() / 3600
+
+    shifts = pd.DataFrame({
+        "user": frame[USER].astype(str),
+        "day": start.dt.tz_localize(None).dt.normalize(),
+        "start": start,
+        "end": end,
+        "hours": hours.where(hours > 0, 0.0).fillna(0.0),
+        "approved": frame[STATUS].astype(str) == approved_status,
+    })
+
+    problem = pd.Series("", index=frame.index)
+    problem[start.isna()] = BAD_CHECK_IN
+    problem[start.notna() & end.notna() & (hours <= 0)] = BAD_CHECK_OUT
+    problem[(problem == "") & _overlaps(shifts)] = OVERLAP
+    shifts["problem"] = problem
+    return shifts
+
+
+def _overlaps(shifts):
+    """Ca bắt đầu trước khi một ca trước đó của cùng người kết thúc (ca thiếu giờ ra coi như dài 0)."""
+    valid = shifts[shifts["start"].notna()]
+    if valid.empty:
+        return pd.Series(False, index=shifts.index)
+    ordered = valid.sort_values(["user", "start"], kind="stable")
+    start_ns = ordered["start"].dt.tz_convert("UTC").dt.tz_localize(None).astype("int64")
+    end = ordered["end"].dt.tz_convert("UTC").dt.tz_localize(None)
+    end_ns = end.astype("int64").where(end.notna(), start_ns)
+    end_ns = end_ns.where(end_ns > start_ns, start_ns)
+    users = ordered["user"]
+    previous_end = end_ns.groupby(users.values).cummax().groupby(users.values).shift()
+    overlap = start_ns < previous_end
+    return overlap.reindex(shifts.index, fill_value=False)
+
+
+def _detail(shifts, problem):
+    report = pd.DataFrame({
+        EMPLOYEE: shifts["user"],
+        DATE: shifts["day"].dt.strftime("%Y-%m-%d"),
+        "Giờ vào": shifts["start"].dt.strftime("%H:%M:%S"),
+        "Giờ ra": shifts["end"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+        HOURS: shifts["hours"].round(2),
+        "Đã duyệt": shifts["approved"],
+        "Bất thường": problem,
+    }).fillna("")
+    return report.sort_values([EMPLOYEE, DATE, "Giờ vào"], kind="stable").set_index(EMPLOYEE)
+
+
+def _daily(shifts):
+    """Tổng giờ + số ca đã duyệt theo (nhân viên, ngày)."""
+    approved = shifts[shifts["approved"]]
+    return approved.groupby(["user", "day"]).agg(hours=("hours", "sum"), shifts=("hours", "size"))
+
+
+class Timesheet:
+    def __init__(self, tz=TIMEZONE, approved_status=APPROVED, max_months=12):
+        self.tz = tz
+        self.approved_status = approved_status
+        self.max_months = max_months
+        self._lock = threading.RLock()
+        self._months = OrderedDict()  # 'YYYY-MM' -> {"version", "shifts", "daily"}
+
+    # --- Cập nhật ---
+    def sync(self, month, frame, version=None):
+        """Tính (lại) ca và bảng tổng của `month` từ bảng chấm công; bỏ qua nếu `version` không đổi."""
+        with self._lock:
+            cached = self._months.get(month)
+            if cached is not None and version is not None and cached["version"] == version:
+                self._months.move_to_end(month)
+                return
+            shifts = shift_frame(frame, self.tz, self.approved_status)
+            self._months[month] = {"version": version, "shifts": shifts, "daily": _daily(shifts)}
+            self._months.move_to_end(month)
+            while len(self._months) > self.max_months:
+                self._months.popitem(last=False)
+
+    def set_review(self, month, labels, status):
+        """Đổi tình trạng các ca `labels`: chỉ cộng/trừ giờ của các ca đổi trạng thái duyệt."""
+        with self._lock:
+            cached = self._months.get(month)
+            if cached is None:
+                return
+            shifts = cached["shifts"]
+            labels = shifts.index.intersection(pd.Index(labels))
+            approved = status == self.approved_status
+            flipped = labels[shifts.loc[labels, "approved"].values != approved]
+            if flipped.empty:
+                return
+            delta = _daily(shifts.loc[flipped].assign(approved=True))
+            daily = cached["daily"]
+            daily = daily.add(delta, fill_value=0) if approved else daily.sub(delta, fill_value=0)
+            cached["daily"] = daily[daily["shifts"] > 0].astype({"shifts": "int64"})
+            shifts.loc[flipped, "approved"] = approved
+
+    # --- Báo cáo ---
+    def _get(self, month):
+        with self._lock:
+            cached = self._months.get(month)
+            if cached is None:
+                raise KeyError(f"Chưa đồng bộ bảng công tháng {month}")
+            return cached
+
+    def daily(self, month):
+        """Giờ đã duyệt theo nhân viên theo ngày (chỉ mục: Nhân viên)."""
+        daily = self._get(month)["daily"].reset_index()
+        report = pd.DataFrame({
+            EMPLOYEE: daily["user"],
+            DATE: daily["day"].dt.strftime("%Y-%m-%d"),
+            HOURS: daily["hours"].round(2),
+            SHIFTS: daily["shifts"].astype("int64"),
+        })
+        return report.sort_values([EMPLOYEE, DATE]).set_index(EMPLOYEE)
+
+    def monthly(self, month):
+        """Tổng giờ, số ca và số ngày công đã duyệt của từng nhân viên trong tháng."""
+        daily = self._get(month)["daily"]
+        if daily.empty:
+            return pd.DataFrame(columns=[MONTH, HOURS, SHIFTS, DAYS], index=pd.Index([], name=EMPLOYEE))
+        totals = daily.groupby(level="user").agg(hours=("hours", "sum"), shifts=("shifts", "sum"),
+                                                 days=("hours", "size"))
+        report = pd.DataFrame({
+            MONTH: month,
+            HOURS: totals["hours"].round(2),
+            SHIFTS: totals["shifts"].astype("int64"),
+            DAYS: totals["days"].astype("int64"),
+        }, index=totals.index.rename(EMPLOYEE))
+        return report.sort_index()
+
+    def shifts(self, month):
+        """Chi tiết từng ca (mọi tình trạng) kèm số giờ và lỗi dữ liệu."""
+        shifts = self._get(month)["shifts"]
+        return _detail(shifts, shifts["problem"])
+
+    def issues(self, month, now=None):
+        """
+        Các ca bất thường. Ca chưa check-out chỉ bị tính là thiếu khi ngày check-in đã qua
+        (so với `now`, mặc định là bây giờ theo múi giờ của bảng công).
+        """
+        shifts = self._get(month)["shifts"]
+        now = pd.Timestamp.now(tz=self.tz) if now is None else pd.Timestamp(now)
+        today = (now.tz_convert(self.tz).tz_localize(None) if now.tzinfo else now).normalize()
+        missing = shifts["start"].notna() & shifts["end"].isna() & (shifts["day"] < today)
+        problem = shifts["problem"].mask(missing & (shifts["problem"] == ""), MISSING_CHECK_OUT)
+        flagged = problem != ""
+        return _detail(shifts[flagged], problem[flagged])
+
+
+def export_timesheet(report, fmt, directory=None):
+    """Ghi một báo cáo (daily/monthly/shifts/issues) ra file tạm CSV/XLSX theo từng khối."""
+    return export_frame(report, np.ones(len(report), dtype=bool), fmt, "bang_cong_", "Bảng công",
+                        directory=directory)